@@ -0,0 +1,92 @@
+"""
+Cached Spotify artist lookups.
+
+Artists come up again and again across users, so their genres are kept in
+the ``Artist`` table and only re-fetched once older than
+``ARTIST_CACHE_MAX_AGE``. Misses are resolved with the batched ``artists``
+endpoint.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Artist
+from .spotify_client import get_spotify
+
+logger = logging.getLogger(__name__)
+
+ARTISTS_BATCH_SIZE = 50
+
+
+def _is_fresh(artist, now):
+    return now - artist.fetched_at < timedelta(seconds=settings.ARTIST_CACHE_MAX_AGE)
+
+
+def get_artists(artist_ids, spotify=None):
+    """
+    Return ``{spotify_id: Artist}`` for the given ids.
+
+    Fresh rows are served from the database. Missing or stale ones are
+    fetched from Spotify 50 at a time; if that fails, stale rows are still
+    returned rather than nothing.
+    """
+    artist_ids = list(dict.fromkeys(i for i in artist_ids if i))
+    if not artist_ids:
+        return {}
+
+    now = timezone.now()
+    known = {a.spotify_id: a for a in Artist.objects.filter(spotify_id__in=artist_ids)}
+    to_fetch = [i for i in artist_ids if i not in known or not _is_fresh(known[i], now)]
+    if not to_fetch:
+        return known
+
+    spotify = spotify or get_spotify()
+    fetched = []
+    try:
+        for start in range(0, len(to_fetch), ARTISTS_BATCH_SIZE):
+            batch = to_fetch[start:start + ARTISTS_BATCH_SIZE]
+            for item in spotify.artists(batch)['artists']:
+                if item:
+                    fetched.append(Artist(
+                        spotify_id=item['id'],
+                        name=item.get('name', ''),
+                        genres=item.get('genres', []),
+                        fetched_at=now,
+                    ))
+    except Exception as e:
+        logger.warning("Error fetching artists from Spotify: %s", e)
+
+    if fetched:
+        Artist.objects.bulk_create(
+            fetched,
+            update_conflicts=True,
+            unique_fields=['spotify_id'],
+            update_fields=['name', 'genres', 'fetched_at'],
+        )
+        known.update((artist.spotify_id, artist) for artist in fetched)
+    return known
+
+
+def get_artist(artist_id, spotify=None):
+    return get_artists([artist_id], spotify=spotify).get(artist_id)
+
+
+def find_by_name(name):
+    """A fresh cached artist with exactly this name, if there is exactly one."""
+    if not name:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=settings.ARTIST_CACHE_MAX_AGE)
+    matches = list(Artist.objects.filter(name__iexact=name, fetched_at__gte=cutoff)[:2])
+    return matches[0] if len(matches) == 1 else None
+
+
+def find_cached(artist_id=None, artist_name=None):
+    """A fresh cached artist by id or unambiguous name, without calling Spotify."""
+    if artist_id:
+        artist = Artist.objects.filter(spotify_id=artist_id).first()
+        if artist is not None and _is_fresh(artist, timezone.now()):
+            return artist
+        return None
+    return find_by_name(artist_name)
@@ -0,0 +1,188 @@
+"""
+Local full-text search over every album we already know about.
+
+``CatalogEntry`` holds one row per ``Album`` (list entries reference albums
+too) and is kept in sync by the signal handlers in ``api.signals``.
+The search itself is done by a pluggable backend chosen with the
+``CATALOG_SEARCH_BACKEND`` setting.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .genres import format_genres
+from .models import Album, CatalogEntry
+from .search_cache import normalize_query
+
+ENTRY_FIELDS = ('spotify_id', 'name', 'artist', 'genres', 'image_url', 'release_date')
+SOURCE_FIELDS = ('id', 'spotify_id', 'name', 'artist', 'image_url', 'release_date')
+REBUILD_CHUNK_SIZE = 2000
+
+
+class BaseSearchBackend:
+    def search(self, query, limit):
+        """Return up to ``limit`` ``CatalogEntry`` dicts, best match first."""
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Rebuild any derived index after ``CatalogEntry`` was bulk-loaded."""
+
+
+class DatabaseBackend(BaseSearchBackend):
+    """Portable fallback using ``icontains`` filters; fine for small catalogs."""
+
+    def search(self, query, limit):
+        entries = CatalogEntry.objects.all()
+        for term in normalize_query(query).split():
+            entries = entries.filter(name__icontains=term) | entries.filter(artist__icontains=term)
+        return list(entries.order_by('name').values(*ENTRY_FIELDS)[:limit])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """FTS5 index over name, artist and genres, ranked with bm25."""
+
+    table = 'api_catalogentry_fts'
+    # bm25 column weights for name, artist, genres
+    weights = (10.0, 5.0, 1.0)
+
+    def match_expression(self, query):
+        terms = re.findall(r'\w+', normalize_query(query))
+        # Every term must match; the last one is treated as a prefix since
+        # queries arrive while the user is still typing.
+        parts = [f'"{term}"' for term in terms[:-1]]
+        if terms:
+            parts.append(f'"{terms[-1]}"*')
+        return ' '.join(parts)
+
+    def search(self, query, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(w) for w in self.weights)
+        columns = ', '.join(f'e.{field}' for field in ENTRY_FIELDS)
+        sql = (
+            f"SELECT {columns} FROM {self.table} "
+            f"JOIN api_catalogentry e ON e.id = {self.table}.rowid "
+            f"WHERE {self.table} MATCH %s "
+            f"ORDER BY bm25({self.table}, {weights}) LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [expression, limit])
+            rows = cursor.fetchall()
+        entries = [dict(zip(ENTRY_FIELDS, row)) for row in rows]
+        release_field = CatalogEntry._meta.get_field('release_date')
+        for entry in entries:
+            entry['release_date'] = release_field.to_python(entry['release_date'])
+        return entries
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(settings.CATALOG_SEARCH_BACKEND)
+        if backend_class is SQLiteFTSBackend and connection.vendor != 'sqlite':
+            backend_class = DatabaseBackend
+        _backend = backend_class()
+    return _backend
+
+
+def search(query, limit=20):
+    return get_backend().search(query, limit)
+
+
+def _entry_defaults(obj):
+    return {
+        'name': obj.name or '',
+        'artist': obj.artist or '',
+        'genres': format_genres(obj),
+        'image_url': obj.image_url or '',
+        'release_date': obj.release_date,
+    }
+
+
+def _sources():
+    return Album.objects.only(*SOURCE_FIELDS).prefetch_related('genres')
+
+
+def sync(spotify_id):
+    """Bring the catalog entry for one album in line with its ``Album`` row."""
+    if not spotify_id:
+        return
+    source = _sources().filter(spotify_id=spotify_id).first()
+    if source is None:
+        CatalogEntry.objects.filter(spotify_id=spotify_id).delete()
+        return
+    defaults = _entry_defaults(source)
+    updated = CatalogEntry.objects.filter(spotify_id=spotify_id).exclude(**defaults).update(**defaults)
+    if not updated:
+        CatalogEntry.objects.get_or_create(spotify_id=spotify_id, defaults=defaults)
+
+
+def sync_many(spotify_ids):
+    """``sync()`` for many albums at once, e.g. after a ``bulk_create`` that sent no signals."""
+    _upsert([
+        CatalogEntry(spotify_id=source.spotify_id, **_entry_defaults(source))
+        for source in _sources().filter(spotify_id__in=spotify_ids)
+    ])
+
+
+def rebuild(chunk_size=REBUILD_CHUNK_SIZE):
+    """Reload the whole catalog from ``Album``. Returns the entry count."""
+    count = 0
+    batch = []
+    for source in _sources().order_by('id').iterator(chunk_size=chunk_size):
+        if not source.spotify_id:
+            continue
+        count += 1
+        batch.append(CatalogEntry(spotify_id=source.spotify_id, **_entry_defaults(source)))
+        if len(batch) >= chunk_size:
+            _upsert(batch)
+            batch = []
+    _upsert(batch)
+
+    CatalogEntry.objects.exclude(spotify_id__in=Album.objects.values('spotify_id')).delete()
+    get_backend().rebuild()
+    return count
+
+
+def _upsert(entries):
+    if entries:
+        CatalogEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['spotify_id'],
+            update_fields=['name', 'artist', 'genres', 'image_url', 'release_date'],
+        )
+
+
+def as_spotify_album(entry):
+    """Shape a catalog entry like Spotify's simplified album object."""
+    release_date = entry['release_date']
+    return {
+        'id': entry['spotify_id'],
+        'name': entry['name'],
+        'artists': [{'name': entry['artist']}],
+        'images': [{'url': entry['image_url']}] if entry['image_url'] else [],
+        'release_date': release_date.isoformat() if release_date else '',
+        'external_urls': {'spotify': f"https://open.spotify.com/album/{entry['spotify_id']}"},
+        'genres': [g.strip() for g in entry['genres'].split(',') if g.strip()],
+    }
+
+
+def search_response(entries, search_type):
+    """Wrap entries in the same envelope ``/spotify/search/`` returns from Spotify."""
+    albums = [as_spotify_album(entry) for entry in entries]
+    if search_type == 'track':
+        # The frontend reads album data off track items, so wrap each album
+        items = [{'album': album, 'artists': album['artists'], 'name': album['name']} for album in albums]
+        return {'tracks': {'items': items}, 'source': 'local'}
+    return {'albums': {'items': albums}, 'source': 'local'}
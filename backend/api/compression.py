@@ -0,0 +1,219 @@
+"""
+Response compression and payload size histograms.
+
+``CompressionMiddleware`` picks brotli or gzip from the request's
+``Accept-Encoding`` (q-values honoured, brotli preferred when the optional
+``Brotli`` package is installed). A body is left alone when:
+- it is smaller than ``settings.COMPRESSION_MIN_SIZE``,
+- it already has a ``Content-Encoding``,
+- its media type is already compressed (images, audio, archives...).
+Streaming responses are compressed chunk by chunk, whatever their size.
+Strong ETags become weak, as with Django's ``GZipMiddleware``, because the
+bytes on the wire differ per encoding.
+
+Every response also goes into a histogram of body sizes before and after
+compression, kept per URL name and reported by the ``/metrics/`` view.
+"""
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+# Media types whose bodies are already compressed
+SKIP_CONTENT_TYPES = (
+    'image/', 'audio/', 'video/', 'font/woff',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/x-bzip2',
+    'application/x-7z-compressed', 'application/pdf', 'application/octet-stream',
+)
+# Upper bounds, in bytes, of the histogram buckets; the last one is open
+BUCKETS = (1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024)
+BUCKET_LABELS = ('<1K', '<4K', '<16K', '<64K', '<256K', '<1M', '>=1M')
+
+_accept_encoding_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+_lock = threading.Lock()
+_routes = {}
+
+
+def negotiate(accept_encoding):
+    """``'br'``, ``'gzip'`` or None for an ``Accept-Encoding`` header."""
+    weights = {}
+    for match in _accept_encoding_re.finditer(accept_encoding or ''):
+        coding, q = match.group(1).lower(), match.group(2)
+        try:
+            weights[coding] = float(q) if q is not None else 1.0
+        except ValueError:
+            weights[coding] = 0.0
+    wildcard = weights.get('*', 0.0)
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    # Ties go to the first in `available`, i.e. brotli
+    ranked = sorted(available, key=lambda coding: -weights.get(coding, wildcard))
+    best = ranked[0]
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+            self._compress = self._compressor.process
+        else:
+            # wbits=31: gzip container
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+        self.encoding = encoding
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def flush(self):
+        # Emitted after each streamed chunk so clients see data as it comes
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.finish() if self.encoding == 'br' else self._compressor.flush()
+
+    def whole(self, data):
+        return self.compress(data) + self.finish()
+
+
+def _bucket(size):
+    for bound, label in zip(BUCKETS, BUCKET_LABELS):
+        if size < bound:
+            return label
+    return BUCKET_LABELS[-1]
+
+
+def record(route, raw_size, sent_size, encoding):
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = {
+                'responses': 0, 'compressed': 0, 'raw_bytes': 0, 'sent_bytes': 0,
+                'raw': defaultdict(int), 'sent': defaultdict(int),
+            }
+        stats['responses'] += 1
+        stats['compressed'] += encoding is not None
+        stats['raw_bytes'] += raw_size
+        stats['sent_bytes'] += sent_size
+        stats['raw'][_bucket(raw_size)] += 1
+        stats['sent'][_bucket(sent_size)] += 1
+
+
+def get_stats():
+    """Per-route size histograms, with bucket labels in ascending order."""
+    with _lock:
+        report = {}
+        for route, stats in sorted(_routes.items()):
+            report[route] = {
+                'responses': stats['responses'],
+                'compressed': stats['compressed'],
+                'raw_bytes': stats['raw_bytes'],
+                'sent_bytes': stats['sent_bytes'],
+                'ratio': round(stats['sent_bytes'] / stats['raw_bytes'], 3) if stats['raw_bytes'] else 1,
+                'raw': {label: stats['raw'][label] for label in BUCKET_LABELS if stats['raw'][label]},
+                'sent': {label: stats['sent'][label] for label in BUCKET_LABELS if stats['sent'][label]},
+            }
+    return report
+
+
+def clear():
+    with _lock:
+        _routes.clear()
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+def _skip(response):
+    content_type = response.get('Content-Type', '').lower()
+    return response.has_header('Content-Encoding') or content_type.startswith(SKIP_CONTENT_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        route = _route(request)
+
+        if response.streaming:
+            encoding = None if _skip(response) else negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+            self._stream(response, route, encoding)
+        else:
+            raw_size = len(response.content)
+            encoding = None
+            if raw_size >= settings.COMPRESSION_MIN_SIZE and not _skip(response):
+                encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+            if encoding is not None:
+                compressed = _Compressor(encoding).whole(response.content)
+                # Not worth it for incompressible bodies
+                if len(compressed) < raw_size:
+                    response.content = compressed
+                    response.headers['Content-Length'] = str(len(compressed))
+                else:
+                    encoding = None
+            record(route, raw_size, len(response.content), encoding)
+
+        # The response varies on it even when this one went out uncompressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response.headers['ETag'] = 'W/' + etag
+        return response
+
+    def _stream(self, response, route, encoding):
+        compressor = _Compressor(encoding) if encoding is not None else None
+        sizes = {'raw': 0, 'sent': 0}
+
+        def process(chunk):
+            sizes['raw'] += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush()
+            sizes['sent'] += len(chunk)
+            return chunk
+
+        def finish():
+            tail = compressor.finish() if compressor is not None else b''
+            sizes['sent'] += len(tail)
+            record(route, sizes['raw'], sizes['sent'], encoding)
+            return tail
+
+        if response.is_async:
+            async def chunks(content):
+                async for chunk in content:
+                    yield process(chunk)
+                tail = finish()
+                if tail:
+                    yield tail
+        else:
+            def chunks(content):
+                for chunk in content:
+                    yield process(chunk)
+                tail = finish()
+                if tail:
+                    yield tail
+
+        # Assigning streaming_content encodes the chunks to bytes first
+        content = response.streaming_content
+        response.streaming_content = chunks(content)
+        if encoding is not None:
+            # The length changes with the encoding
+            del response['Content-Length']
@@ -0,0 +1,79 @@
+"""
+Conditional GETs for the resources the SPA re-fetches on every navigation:
+``/logs/``, ``/favorites/``, ``/lists/<id>/`` and ``/user/profile/``.
+
+Validators come from one aggregate query: the row count plus the newest
+``updated_at`` of the rows and of the albums they show. For the profile
+they come from the cached payload instead. A matching ``If-None-Match`` or
+``If-Modified-Since`` gets its 304 before anything is serialized.
+
+``Album.updated_at`` is also bumped by rating aggregate and genre updates.
+``List.updated_at`` is also bumped whenever the list's entries change.
+The ETag covers the query string, so every page and filter has its own.
+Logs and favorites only get an ETag: a deleted row shows in the count but
+leaves no newer timestamp behind, so ``If-Modified-Since`` would answer a
+stale 304.
+
+Responses are marked ``private, no-cache``. The browser then revalidates
+every time and hands axios its cached body on a 304.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class Validators:
+    def __init__(self, request, *parts, last_modified=None):
+        raw = '|'.join(str(part) for part in (request.get_full_path(), *parts))
+        self.etag = quote_etag(hashlib.md5(raw.encode('utf-8')).hexdigest())
+        self.last_modified = last_modified
+
+    def not_modified(self, request):
+        """The 304 for ``request`` if it already has this version, else None."""
+        timestamp = int(self.last_modified.timestamp()) if self.last_modified else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=timestamp)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def _newest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def for_rows(request, queryset, modified_field):
+    """
+    Validators for a queryset of rows with an ``album``, like a user's logs or
+    favorites. ETag only; see the module docstring.
+    """
+    row = queryset.order_by().aggregate(
+        count=Count('id'), modified=Max(modified_field), album_modified=Max('album__updated_at')
+    )
+    return Validators(request, row['count'], row['modified'], row['album_modified'])
+
+
+def for_list(request, lists):
+    """Validators for the one list in ``lists``, or None if there is no such list."""
+    row = lists.order_by().values('id').annotate(
+        modified=Max('updated_at'), entries=Count('albums'), album_modified=Max('albums__album__updated_at')
+    ).first()
+    if row is None:
+        return None
+    return Validators(
+        request, row['id'], row['entries'], row['modified'], row['album_modified'],
+        last_modified=_newest(row['modified'], row['album_modified']),
+    )
+
+
+def for_profile(request, entry):
+    """Validators for a cached ``api.profiles`` entry; the host is part of the avatar URL."""
+    return Validators(request, request.get_host(), entry['version'], last_modified=entry['built_at'])
@@ -0,0 +1,179 @@
+"""
+Fast read path for the hot list endpoints.
+
+Builds the same payloads as ``LogSerializer``, ``FavoriteAlbumSerializer``,
+``ListDetailSerializer`` and ``ListSummarySerializer`` straight from ``values()`` rows, skipping model
+instantiation and the per-field serializer machinery. Dates, datetimes and
+decimals are still formatted by DRF's own field classes so the rendered
+bytes match the regular serializers. Genres are fetched with one query on
+the M2M table, as ``prefetch_related`` would.
+
+Enabled by ``settings.FAST_READ_SERIALIZERS``.
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+from rest_framework import serializers
+
+from .models import SPOTIFY_ALBUM_URL, Album, ListAlbum
+from .serializers import AlbumSerializer, UserSerializer
+
+ALBUM_FIELDS = ('id', 'spotify_id', 'name', 'artist', 'image_url', 'release_date', 'external_url', 'total_logs', 'rating_sum')
+LOG_FIELDS = ('id', 'rating', 'review', 'created_at', 'updated_at', 'listen_date', 'favorite_song', 'relisten')
+LIST_FIELDS = ('id', 'title', 'description', 'created_at', 'updated_at')
+LIST_ALBUM_FIELDS = ('id', 'list_id', 'rank', 'album_id', 'album__spotify_id', 'album__name', 'album__artist', 'album__image_url', 'album__release_date')
+
+format_datetime = serializers.DateTimeField().to_representation
+format_date = serializers.DateField().to_representation
+_average_rating_field = AlbumSerializer._declared_fields['average_rating']
+
+
+@lru_cache(maxsize=4096)
+def format_average_rating(rating_sum, total_logs):
+    return _average_rating_field.to_representation(Album.compute_average_rating(rating_sum, total_logs))
+
+
+def _album_values(prefix=''):
+    return [prefix + field for field in ALBUM_FIELDS]
+
+
+def _genres(model, ids):
+    """``{id: 'genre,genre'}`` for ``model`` rows, in the order ``Genre`` sorts them."""
+    if not ids:
+        return {}
+    through = model.genres.through
+    key = f'{model._meta.model_name}_id'
+    names = defaultdict(list)
+    rows = through.objects.filter(**{f'{key}__in': ids}).order_by('genre__name').values_list(key, 'genre__name')
+    for obj_id, name in rows:
+        names[obj_id].append(name)
+    return {obj_id: ','.join(values) for obj_id, values in names.items()}
+
+
+def _album(row, genres, prefix=''):
+    album_id = row[prefix + 'id']
+    return {
+        'id': album_id,
+        'spotify_id': row[prefix + 'spotify_id'],
+        'name': row[prefix + 'name'],
+        'artist': row[prefix + 'artist'],
+        'image_url': row[prefix + 'image_url'],
+        'release_date': format_date(row[prefix + 'release_date']),
+        'external_url': row[prefix + 'external_url'],
+        'genres': genres.get(album_id, ''),
+        'average_rating': format_average_rating(row[prefix + 'rating_sum'], row[prefix + 'total_logs']),
+        'total_logs': row[prefix + 'total_logs'],
+    }
+
+
+def log_rows(logs):
+    return logs.values(*LOG_FIELDS, *_album_values('album__'))
+
+
+def serialize_logs(rows, user):
+    """``LogSerializer(many=True)`` output for ``log_rows()`` of ``user``'s logs."""
+    user_data = UserSerializer(user).data
+    genres = _genres(Album, {row['album__id'] for row in rows})
+    return [
+        {
+            'id': row['id'],
+            'user': user_data,
+            'album': _album(row, genres, 'album__'),
+            'rating': row['rating'],
+            'review': row['review'],
+            'created_at': format_datetime(row['created_at']),
+            'updated_at': format_datetime(row['updated_at']),
+            'listen_date': format_date(row['listen_date']),
+            'favorite_song': row['favorite_song'],
+            'relisten': row['relisten'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_feed(rows):
+    """Feed items for ``api.feeds.read()`` rows: logs with their author's username."""
+    genres = _genres(Album, {row['album__id'] for row in rows})
+    return [
+        {
+            'id': row['id'],
+            'user': {'username': row['user__username']},
+            'album': _album(row, genres, 'album__'),
+            'rating': row['rating'],
+            'review': row['review'],
+            'created_at': format_datetime(row['created_at']),
+            'listen_date': format_date(row['listen_date']),
+            'favorite_song': row['favorite_song'],
+            'relisten': row['relisten'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_favorites(favorites):
+    """``FavoriteAlbumSerializer(many=True)`` output for a ``FavoriteAlbum`` queryset."""
+    rows = list(favorites.values('id', 'added_at', *_album_values('album__')))
+    genres = _genres(Album, {row['album__id'] for row in rows})
+    return [
+        {
+            'id': row['id'],
+            'album': _album(row, genres, 'album__'),
+            'added_at': format_datetime(row['added_at']),
+        }
+        for row in rows
+    ]
+
+
+def list_album_rows(list_id):
+    return ListAlbum.objects.filter(list_id=list_id).values(*LIST_ALBUM_FIELDS)
+
+
+def _list(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'created_at': format_datetime(row['created_at']),
+        'updated_at': format_datetime(row['updated_at']),
+    }
+
+
+def serialize_list(lists, album_rows):
+    """
+    ``ListDetailSerializer`` output for the one list in ``lists`` (annotated
+    with ``num_albums``) and a page of its ``list_album_rows()``, or None if
+    there is no such list.
+    """
+    row = lists.values(*LIST_FIELDS, 'num_albums').first()
+    if row is None:
+        return None
+    genres = _genres(Album, {album['album_id'] for album in album_rows})
+    data = _list(row)
+    data['albums'] = [
+        {
+            'id': album['id'],
+            'spotify_id': album['album__spotify_id'],
+            'name': album['album__name'],
+            'artist': album['album__artist'],
+            'image_url': album['album__image_url'],
+            'release_date': format_date(album['album__release_date']),
+            'external_url': SPOTIFY_ALBUM_URL.format(album['album__spotify_id']),
+            'list': album['list_id'],
+            'rank': album['rank'],
+            'genres': genres.get(album['album_id'], ''),
+        }
+        for album in album_rows
+    ]
+    data['album_count'] = row['num_albums']
+    return data
+
+
+def serialize_list_summaries(lists, covers):
+    """``ListSummarySerializer(many=True)`` output for a ``List`` queryset annotated with ``num_albums``."""
+    summaries = []
+    for row in lists.values(*LIST_FIELDS, 'num_albums'):
+        data = _list(row)
+        data['album_count'] = row['num_albums']
+        data['covers'] = covers.get(row['id'], [])
+        summaries.append(data)
+    return summaries
@@ -0,0 +1,155 @@
+"""
+Following-based activity feed.
+
+Each user has an inbox of ``FeedEntry`` rows. When someone logs an album,
+the log is copied into the inbox of every follower (fan-out on write), so
+reading a feed is one range scan on the ``(owner, -created_at, -log)``
+index joined to the logs.
+
+Accounts with more than ``FEED_FANOUT_LIMIT`` followers are flagged
+``Profile.fanout_on_read``. Their logs are not copied; instead feed reads
+also scan their recent logs through the ``(user, -created_at, -id)`` log
+index and merge the two streams. ``manage.py trim_feeds`` caps inbox size.
+
+Following someone copies at most ``FEED_BACKFILL`` of their logs, and never
+more than an inbox holds. When an account drops back to fan-out on write,
+its followers' inboxes are re-seeded by a ``reseed_feeds`` job rather than
+in the request that tipped the count.
+"""
+from django.conf import settings
+from django.db.models import Count, Q
+
+from . import jobs
+from .fast_serializers import ALBUM_FIELDS
+from .models import FeedEntry, Log, Profile
+
+FEED_LOG_FIELDS = (
+    'id', 'rating', 'review', 'created_at', 'listen_date', 'favorite_song', 'relisten', 'user__username',
+    *(f'album__{field}' for field in ALBUM_FIELDS),
+)
+Follow = Profile.followers.through
+
+
+def _after(key, created_at='created_at', pk='id'):
+    """Keyset filter for rows strictly older than ``key``."""
+    if key is None:
+        return Q()
+    return Q(**{f'{created_at}__lt': key[0]}) | Q(**{created_at: key[0], f'{pk}__lt': key[1]})
+
+
+def _entries(owner_id, logs):
+    return [
+        FeedEntry(owner_id=owner_id, log_id=log_id, author_id=author_id, created_at=created_at)
+        for log_id, author_id, created_at in logs
+    ]
+
+
+def log_created(log):
+    """Copy a new log into its author's followers' inboxes."""
+    profile = Profile.objects.filter(user_id=log.user_id).values('id', 'fanout_on_read').first()
+    if profile is None or profile['fanout_on_read']:
+        return
+    follower_ids = Follow.objects.filter(profile_id=profile['id']).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(owner_id=follower_id, log_id=log.id, author_id=log.user_id, created_at=log.created_at)
+            for follower_id in follower_ids
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def _recent_logs(author_id, limit=None):
+    """``(id, user_id, created_at)`` of the logs a new follower gets copied."""
+    limit = min(settings.FEED_BACKFILL if limit is None else limit, settings.FEED_INBOX_SIZE)
+    return list(
+        Log.objects.filter(user_id=author_id).order_by('-created_at', '-id').values_list('id', 'user_id', 'created_at')[:limit]
+    )
+
+
+def backfill(follower_id, author_id, limit=None):
+    """Copy ``author_id``'s most recent logs into a new follower's inbox."""
+    FeedEntry.objects.bulk_create(_entries(follower_id, _recent_logs(author_id, limit)), ignore_conflicts=True)
+
+
+def reseed(author_id, chunk_size=100):
+    """``backfill()`` every follower of ``author_id``, ``chunk_size`` followers per insert."""
+    logs = _recent_logs(author_id)
+    follower_ids = list(Follow.objects.filter(profile__user_id=author_id).values_list('user_id', flat=True))
+    for start in range(0, len(follower_ids), chunk_size):
+        FeedEntry.objects.bulk_create(
+            [entry for follower_id in follower_ids[start:start + chunk_size] for entry in _entries(follower_id, logs)],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+def followed(pairs):
+    """``pairs`` of ``(profile_id, follower_id)`` were just added."""
+    profiles = dict(Profile.objects.filter(id__in={profile_id for profile_id, _ in pairs}).values_list('id', 'user_id'))
+    for profile_id, follower_id in pairs:
+        backfill(follower_id, profiles[profile_id])
+    update_fanout_mode(profiles)
+
+
+def unfollowed(pairs):
+    """``pairs`` of ``(profile_id, follower_id)`` are being removed."""
+    profiles = dict(Profile.objects.filter(id__in={profile_id for profile_id, _ in pairs}).values_list('id', 'user_id'))
+    for profile_id, follower_id in pairs:
+        FeedEntry.objects.filter(owner_id=follower_id, author_id=profiles[profile_id]).delete()
+    update_fanout_mode(profiles)
+
+
+def update_fanout_mode(profile_ids):
+    """Flip profiles between fan-out on write and on read as their follower count crosses the limit."""
+    for profile in Profile.objects.filter(id__in=profile_ids).only('id', 'user_id', 'fanout_on_read'):
+        on_read = Follow.objects.filter(profile_id=profile.id).count() > settings.FEED_FANOUT_LIMIT
+        if on_read == profile.fanout_on_read:
+            continue
+        Profile.objects.filter(id=profile.id).update(fanout_on_read=on_read)
+        if not on_read:
+            # Back to fan-out on write: seed the inboxes it stopped filling,
+            # which can be thousands, outside the request
+            jobs.enqueue('reseed_feeds', author_id=profile.user_id)
+
+
+def _strip(row, prefix):
+    return {key[len(prefix):]: value for key, value in row.items()}
+
+
+def read(user, after=None, limit=20):
+    """
+    Up to ``limit`` log rows (``FEED_LOG_FIELDS``) from accounts ``user``
+    follows, newest first and older than the ``(created_at, log_id)`` key
+    ``after``.
+    """
+    pull_ids = list(
+        Profile.objects.filter(followers=user, fanout_on_read=True).values_list('user_id', flat=True)
+    )
+    prefix = 'log__'
+    rows = [
+        _strip(row, prefix)
+        for row in FeedEntry.objects.filter(_after(after, pk='log_id'), owner=user)
+        .order_by('-created_at', '-log_id')
+        .values(*(prefix + field for field in FEED_LOG_FIELDS))[:limit]
+    ]
+    if not pull_ids:
+        return rows
+
+    pulled = Log.objects.filter(_after(after), user_id__in=pull_ids).order_by('-created_at', '-id').values(*FEED_LOG_FIELDS)[:limit]
+    # The same log can be in both when an account switched modes
+    merged = {row['id']: row for row in [*rows, *pulled]}
+    return sorted(merged.values(), key=lambda row: (row['created_at'], row['id']), reverse=True)[:limit]
+
+
+def trim(max_entries=None):
+    """Keep only the newest ``max_entries`` of every inbox. Returns the number of entries deleted."""
+    max_entries = max(settings.FEED_INBOX_SIZE if max_entries is None else max_entries, 1)
+    deleted = 0
+    full = FeedEntry.objects.values('owner_id').annotate(entries=Count('id')).filter(entries__gt=max_entries)
+    for owner_id in full.values_list('owner_id', flat=True):
+        inbox = FeedEntry.objects.filter(owner_id=owner_id)
+        oldest_kept = inbox.order_by('-created_at', '-log_id').values_list('created_at', 'log_id')[max_entries - 1]
+        deleted += inbox.filter(_after(oldest_kept, pk='log_id')).delete()[0]
+    return deleted
@@ -0,0 +1,39 @@
+"""
+Helpers for the normalized ``Genre`` table.
+
+The API still exchanges genres as comma-separated strings (or Spotify's
+lists); these helpers translate between that and the ``Album.genres``
+M2M.
+"""
+from .models import Genre
+
+
+def parse_genres(value):
+    """Genre names from a comma-separated string or a list, deduplicated in order."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return list(dict.fromkeys(name.strip() for name in value if name and name.strip()))
+
+
+def get_genres(names):
+    """``Genre`` rows for ``names``, creating missing ones in one statement."""
+    names = parse_genres(names)
+    if not names:
+        return []
+    Genre.objects.bulk_create([Genre(name=name) for name in names], ignore_conflicts=True)
+    return list(Genre.objects.filter(name__in=names))
+
+
+def set_genres(obj, names):
+    obj.genres.set(get_genres(names))
+
+
+def genre_names(obj):
+    """Names of ``obj``'s genres; uses prefetched rows when available."""
+    return [genre.name for genre in obj.genres.all()]
+
+
+def format_genres(obj):
+    return ','.join(genre_names(obj))
@@ -0,0 +1,136 @@
+"""
+Minimal database-backed job queue.
+
+Handlers are registered with ``@task('name')`` and queued with
+``enqueue('name', **payload)``. Workers (``manage.py run_workers``) claim
+jobs by taking a time-limited lease with a conditional UPDATE, so a crashed
+worker's jobs become claimable again once the lease runs out. Failed jobs
+are retried with exponential backoff and end up in the ``dead`` state after
+``max_attempts``. Every claim counts as an attempt, so a job that keeps
+crashing its worker is dead-lettered too rather than reclaimed forever.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name):
+    """Register ``func`` as the handler for jobs called ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name):
+    # Handlers live in api.tasks; importing it fills the registry
+    from . import tasks  # noqa: F401
+    return _registry[name]
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = min(settings.JOB_BACKOFF_BASE * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _expired(now):
+    return Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def _claimable(now):
+    return Q(status=Job.PENDING, run_after__lte=now) | (_expired(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def _bury_expired(now):
+    """Dead-letter jobs whose lease ran out on their last attempt."""
+    return Job.objects.filter(_expired(now), attempts__gte=F('max_attempts')).update(
+        status=Job.DEAD,
+        last_error='Lease expired on the last attempt; the worker likely crashed',
+        locked_until=None,
+        updated_at=now,
+    )
+
+
+def claim(worker_id, limit=1, lease=None):
+    """
+    Lease up to ``limit`` runnable jobs for ``worker_id``.
+
+    Candidates are re-checked inside the UPDATE, so when two workers race
+    for the same row only one of them gets it.
+    """
+    now = timezone.now()
+    lease = lease or settings.JOB_LEASE_SECONDS
+    _bury_expired(now)
+    candidates = list(
+        Job.objects.filter(_claimable(now)).order_by('run_after').values_list('id', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for job_id in candidates:
+        updated = Job.objects.filter(_claimable(now), id=job_id).update(
+            status=Job.RUNNING,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    return list(Job.objects.filter(id__in=claimed))
+
+
+def run(job, worker_id):
+    """Run a claimed job and record the outcome; returns the new status."""
+    mine = Job.objects.filter(id=job.id, locked_by=worker_id, status=Job.RUNNING)
+    try:
+        get_handler(job.name)(**job.payload)
+    except Exception as e:
+        logger.warning("Job %s failed (attempt %d/%d): %s", job, job.attempts, job.max_attempts, e)
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            mine.update(status=Job.DEAD, last_error=error, locked_until=None, updated_at=now)
+            return Job.DEAD
+        mine.update(
+            status=Job.PENDING,
+            last_error=error,
+            locked_until=None,
+            run_after=now + timedelta(seconds=backoff(job.attempts)),
+            updated_at=now,
+        )
+        return Job.PENDING
+
+    mine.update(status=Job.DONE, locked_until=None, updated_at=timezone.now())
+    return Job.DONE
+
+
+def requeue_dead(**filters):
+    """Give dead-lettered jobs another full set of attempts."""
+    return Job.objects.filter(status=Job.DEAD, **filters).update(
+        status=Job.PENDING,
+        attempts=0,
+        run_after=timezone.now(),
+        updated_at=timezone.now(),
+    )
@@ -0,0 +1,158 @@
+"""
+Bulk reads and writes of list albums.
+
+``add_albums()`` takes Spotify album ids. It skips ids already in the list
+with one query and links the rest to their ``Album`` rows. Only albums not
+stored yet are fetched from Spotify, with the batched ``albums`` endpoint
+(20 per call) and the artist cache (50 per call). All Spotify calls happen
+before the write transaction. Inside it, the new albums and their genre
+links are bulk-created, ranks are reserved with ``ranking.append_ranks()``
+(see there for how concurrent appends are kept apart) and the entries go in
+with one ``bulk_create``.
+
+``covers()`` fetches the cover mosaics for the list overview with a single
+windowed query.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import catalog_search, ranking
+from .artists import get_artists
+from .genres import get_genres, parse_genres, set_genres
+from .models import SPOTIFY_ALBUM_URL, Album, List, ListAlbum
+from .spotify_client import get_spotify
+from .tracks import parse_release_date
+
+logger = logging.getLogger(__name__)
+
+ALBUMS_BATCH_SIZE = 20
+COVERS_PER_LIST = 4
+
+
+def _from_spotify(spotify_ids, spotify):
+    albums = []
+    try:
+        for start in range(0, len(spotify_ids), ALBUMS_BATCH_SIZE):
+            batch = spotify_ids[start:start + ALBUMS_BATCH_SIZE]
+            albums.extend(album for album in spotify.albums(batch)['albums'] if album)
+    except Exception as e:
+        # Whatever was fetched is still added; the rest is reported back
+        logger.warning("Error fetching albums from Spotify: %s", e)
+
+    primary_artists = {album['id']: album['artists'][0] for album in albums if album['artists']}
+    artists_by_id = get_artists([artist['id'] for artist in primary_artists.values()], spotify=spotify)
+
+    metadata = {}
+    for album in albums:
+        primary_artist = primary_artists.get(album['id'], {})
+        artist = artists_by_id.get(primary_artist.get('id'))
+        metadata[album['id']] = {
+            'name': album['name'],
+            'artist': primary_artist.get('name', ''),
+            'image_url': album['images'][0]['url'] if album['images'] else '',
+            'release_date': parse_release_date(album.get('release_date')),
+            'external_url': album.get('external_urls', {}).get('spotify') or SPOTIFY_ALBUM_URL.format(album['id']),
+            'genres': artist.genres if artist is not None else [],
+        }
+    return metadata
+
+
+def get_album(spotify_id, defaults, genres=None):
+    """The ``Album`` for ``spotify_id``, created from ``defaults`` and ``genres`` if new."""
+    album, created = Album.objects.get_or_create(spotify_id=spotify_id, defaults=defaults)
+    if created and genres:
+        set_genres(album, genres)
+    return album
+
+
+def create_albums(metadata):
+    """
+    ``{spotify_id: album_id}`` for ``metadata``'s albums, creating the missing
+    ones and their genre links in bulk. Must be called in a transaction; the
+    search catalog is updated when it commits.
+    """
+    Album.objects.bulk_create(
+        [
+            Album(spotify_id=spotify_id, **{field: value for field, value in fields.items() if field != 'genres'})
+            for spotify_id, fields in metadata.items()
+        ],
+        ignore_conflicts=True,
+    )
+    album_ids = dict(Album.objects.filter(spotify_id__in=list(metadata)).values_list('spotify_id', 'id'))
+
+    # Only albums that came out of this call bare get the fetched genres
+    bare = set(Album.objects.filter(id__in=album_ids.values(), genres__isnull=True).values_list('id', flat=True))
+    names = {spotify_id: parse_genres(fields['genres']) for spotify_id, fields in metadata.items()}
+    genres = {genre.name: genre for genre in get_genres([name for values in names.values() for name in values])}
+    Album.genres.through.objects.bulk_create(
+        [
+            Album.genres.through(album_id=album_ids[spotify_id], genre_id=genres[name].id)
+            for spotify_id, values in names.items()
+            if album_ids.get(spotify_id) in bare
+            for name in values
+        ],
+        ignore_conflicts=True,
+    )
+    # bulk_create sends no signals
+    spotify_ids = list(metadata)
+    transaction.on_commit(lambda: catalog_search.sync_many(spotify_ids))
+    return album_ids
+
+
+def add_albums(list_obj, spotify_ids, spotify=None):
+    """
+    Append the albums to ``list_obj`` in the given order.
+
+    Returns ``(created, skipped, not_found)``: the new ``ListAlbum`` rows,
+    ids already in the list and ids no album could be found for.
+    """
+    spotify_ids = list(dict.fromkeys(spotify_id for spotify_id in spotify_ids if spotify_id))
+    in_list = ListAlbum.objects.filter(list=list_obj)
+    existing = set(in_list.filter(album__spotify_id__in=spotify_ids).values_list('album__spotify_id', flat=True))
+    wanted = [spotify_id for spotify_id in spotify_ids if spotify_id not in existing]
+    album_ids = dict(Album.objects.filter(spotify_id__in=wanted).values_list('spotify_id', 'id'))
+    missing = [spotify_id for spotify_id in wanted if spotify_id not in album_ids]
+    metadata = _from_spotify(missing, spotify or get_spotify()) if missing else {}
+
+    with transaction.atomic():
+        if metadata:
+            album_ids.update(create_albums(metadata))
+        ranks = ranking.append_ranks(list_obj.id, len(album_ids))
+        # Re-check now that writers are serialized, in case a concurrent add got there first
+        existing |= set(in_list.filter(album_id__in=album_ids.values()).values_list('album__spotify_id', flat=True))
+        to_add = [spotify_id for spotify_id in spotify_ids if spotify_id in album_ids and spotify_id not in existing]
+        created = ListAlbum.objects.bulk_create([
+            ListAlbum(list=list_obj, album_id=album_ids[spotify_id], rank=rank)
+            for spotify_id, rank in zip(to_add, ranks)
+        ])
+        if created:
+            List.touch(list_obj.id)
+
+    skipped = [spotify_id for spotify_id in spotify_ids if spotify_id in existing]
+    not_found = [spotify_id for spotify_id in spotify_ids if spotify_id not in existing and spotify_id not in album_ids]
+    return created, skipped, not_found
+
+
+def covers(list_ids, per_list=COVERS_PER_LIST):
+    """
+    ``{list_id: [image_url, ...]}`` with the first ``per_list`` covers of each
+    list. ``list_ids`` can be a ``values('id')`` queryset, used as a subquery.
+    """
+    position = Window(RowNumber(), partition_by=F('list_id'), order_by=[F('rank').asc(), F('id').asc()])
+    rows = (
+        ListAlbum.objects.filter(list_id__in=list_ids)
+        .exclude(album__image_url__isnull=True)
+        .exclude(album__image_url='')
+        .annotate(position=position)
+        .filter(position__lte=per_list)
+        .order_by('list_id', 'rank', 'id')
+        .values_list('list_id', 'album__image_url')
+    )
+    urls = defaultdict(list)
+    for list_id, image_url in rows:
+        urls[list_id].append(image_url)
+    return urls
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from api import jobs
+from api.models import Album
+
+class Command(BaseCommand):
+    help = 'Queue genre enrichment jobs for albums with empty genres'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Albums per job'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        spotify_ids = list(
+            Album.objects.filter(genres__isnull=True).order_by('spotify_id').values_list('spotify_id', flat=True)
+        )
+
+        queued = 0
+        for start in range(0, len(spotify_ids), batch_size):
+            jobs.enqueue('enrich_genres', spotify_ids=spotify_ids[start:start + batch_size])
+            queued += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued {queued} jobs for {len(spotify_ids)} albums'
+        ))
@@ -0,0 +1,109 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+from api import fast_serializers
+from api.genres import get_genres
+from api.models import Album, FavoriteAlbum, List, ListAlbum, Log
+from api.renderers import ORJSONRenderer
+from api.serializers import FavoriteAlbumSerializer, ListDetailSerializer, LogSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the model serializers + JSONRenderer with the fast read path + ORJSONRenderer '
+        'on generated logs, favorites and list albums. Nothing is kept in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'endpoint':<12}{'rows':>8}{'serializer':>14}{'fast':>12}{'speedup':>10}")
+        for rows in options['rows']:
+            try:
+                with transaction.atomic():
+                    user, list_obj = self.generate(rows)
+                    for name, slow, fast in self.cases(user, list_obj):
+                        slow_time = self.best_of(slow, options['repeat'])
+                        fast_time = self.best_of(fast, options['repeat'])
+                        self.stdout.write(
+                            f'{name:<12}{rows:>8}{slow_time * 1000:>12.1f}ms{fast_time * 1000:>10.1f}ms'
+                            f'{slow_time / fast_time:>9.1f}x'
+                        )
+                    raise Rollback
+            except Rollback:
+                pass
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def generate(self, rows):
+        user = User.objects.create_user(username='benchmark-serializers', password=None)
+        genres = get_genres(['rock', 'indie rock', 'shoegaze', 'jazz'])
+        albums = Album.objects.bulk_create(
+            Album(
+                spotify_id=f'benchmark-{i}',
+                name=f'Album {i}',
+                artist=f'Artist {i % 200}',
+                image_url=f'https://i.scdn.co/image/{i}',
+                release_date=date(1960, 1, 1) + timedelta(days=i * 7),
+                total_logs=i % 7,
+                rating_sum=(i % 7) * 3,
+            )
+            for i in range(rows)
+        )
+        Album.genres.through.objects.bulk_create(
+            Album.genres.through(album_id=album.id, genre_id=genres[i % len(genres)].id)
+            for i, album in enumerate(albums)
+        )
+        Log.objects.bulk_create(
+            Log(user=user, album=album, rating=i % 5 + 1, review='Great record' if i % 3 else None)
+            for i, album in enumerate(albums)
+        )
+        FavoriteAlbum.objects.bulk_create(FavoriteAlbum(user=user, album=album) for album in albums)
+        list_obj = List.objects.create(user=user, title='Benchmark')
+        ListAlbum.objects.bulk_create(
+            ListAlbum(list=list_obj, album=album, rank=i)
+            for i, album in enumerate(albums)
+        )
+        return user, list_obj
+
+    def cases(self, user, list_obj):
+        logs = Log.objects.filter(user=user)
+        favorites = FavoriteAlbum.objects.filter(user=user)
+        lists = List.objects.filter(pk=list_obj.pk).annotate(num_albums=Count('albums'))
+        list_albums = ListAlbum.objects.filter(list=list_obj).order_by('rank', 'id')
+        slow, fast = JSONRenderer(), ORJSONRenderer()
+        return [
+            (
+                'logs',
+                lambda: slow.render(LogSerializer(logs.select_related('user', 'album').prefetch_related('album__genres'), many=True).data),
+                lambda: fast.render(fast_serializers.serialize_logs(list(fast_serializers.log_rows(logs)), user)),
+            ),
+            (
+                'favorites',
+                lambda: slow.render(FavoriteAlbumSerializer(favorites.select_related('album').prefetch_related('album__genres'), many=True).data),
+                lambda: fast.render(fast_serializers.serialize_favorites(favorites)),
+            ),
+            (
+                'list detail',
+                lambda: slow.render(ListDetailSerializer(lists.get(), context={'albums': list(list_albums.select_related('album').prefetch_related('album__genres'))}).data),
+                lambda: fast.render(fast_serializers.serialize_list(lists, list(fast_serializers.list_album_rows(list_obj.pk).order_by('rank', 'id')))),
+            ),
+        ]
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api import tracks
+from api.models import Album
+
+class Command(BaseCommand):
+    help = 'Store tracklists for albums that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of albums to fetch')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        pending = Album.objects.filter(tracks_fetched_at__isnull=True).order_by('id')
+        album_ids = list(pending.values_list('spotify_id', flat=True)[:options['limit']])
+
+        stored = 0
+        chunk_size = options['chunk_size']
+        for start in range(0, len(album_ids), chunk_size):
+            stored += tracks.prefetch(album_ids[start:start + chunk_size])
+            self.stdout.write(f'Stored {stored}/{len(album_ids)} tracklists')
+
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} tracklists'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api import catalog_search
+
+class Command(BaseCommand):
+    help = 'Rebuild the local album search catalog from Album rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=catalog_search.REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        count = catalog_search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} albums'))
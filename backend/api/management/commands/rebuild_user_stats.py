@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api import user_stats
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized per-user stats from logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        count = 0
+        for user in users.iterator(chunk_size=500):
+            user_stats.rebuild(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {count} users'))
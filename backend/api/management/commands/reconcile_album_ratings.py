@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api import ratings
+
+class Command(BaseCommand):
+    help = 'Recompute album rating aggregates from logs and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = ratings.reconcile(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {fixed} albums'))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import trending
+
+class Command(BaseCommand):
+    help = 'Fetch new releases for the configured markets and store a new trending snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--markets',
+            default=','.join(settings.TRENDING_MARKETS),
+            help='Comma-separated ISO country codes'
+        )
+        parser.add_argument('--limit', type=int, default=trending.MAX_NEW_RELEASES)
+        parser.add_argument(
+            '--keep',
+            type=int,
+            help='Snapshots kept per market, 0 for all (default: TRENDING_SNAPSHOTS_KEPT)'
+        )
+
+    def handle(self, *args, **options):
+        markets = [m.strip() for m in options['markets'].split(',') if m.strip()]
+        version = trending.refresh(markets=markets, limit=options['limit'], keep=options['keep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored trending snapshot v{version} for {", ".join(markets)}'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api import ranking
+from api.models import List
+
+class Command(BaseCommand):
+    help = 'Respace list album ranks evenly so single moves keep fitting between neighbours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('list_ids', nargs='*', type=int, help='Lists to renormalize (default: all)')
+
+    def handle(self, *args, **options):
+        lists = List.objects.order_by('id')
+        if options['list_ids']:
+            lists = lists.filter(id__in=options['list_ids'])
+
+        updated = 0
+        for list_id in lists.values_list('id', flat=True).iterator():
+            updated += ranking.renormalize(list_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} album ranks'))
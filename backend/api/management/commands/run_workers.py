@@ -0,0 +1,57 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from api import jobs
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no runnable jobs are left instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        process_id = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+        self.stdout.write(f'Worker {process_id} started with {concurrency} threads')
+
+        def work(slot):
+            # Each thread holds its own leases, so one can't finish another's job
+            worker_id = f'{process_id}:{slot}'
+            try:
+                while not stopping.is_set():
+                    claimed = jobs.claim(worker_id, limit=1)
+                    if claimed:
+                        job = claimed[0]
+                        outcome = jobs.run(job, worker_id)
+                        self.stdout.write(f'{job.name} #{job.id}: {outcome}')
+                        close_old_connections()
+                        continue
+                    if options['once']:
+                        break
+                    stopping.wait(settings.JOB_POLL_INTERVAL)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            workers = [pool.submit(work, slot) for slot in range(concurrency)]
+            try:
+                for worker in workers:
+                    # Short timeouts keep the main thread responsive to Ctrl+C
+                    while not worker.done():
+                        time.sleep(0.5)
+                    worker.result()
+            except KeyboardInterrupt:
+                self.stdout.write('Shutting down, waiting for running jobs...')
+                stopping.set()
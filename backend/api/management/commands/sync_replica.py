@@ -0,0 +1,24 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from api.replicas import REPLICA_ALIAS, replica_configured
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file (DATABASE_REPLICA_NAME)'
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('No replica database is configured; set DATABASE_REPLICA_NAME')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite' or connections[REPLICA_ALIAS].vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite databases')
+
+        primary.ensure_connection()
+        # Online backup: consistent even while the primary is being written
+        target = sqlite3.connect(str(connections[REPLICA_ALIAS].settings_dict['NAME']))
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} to {connections[REPLICA_ALIAS].settings_dict['NAME']}"))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import feeds
+
+class Command(BaseCommand):
+    help = 'Cap every feed inbox at the newest N entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-entries',
+            type=int,
+            default=settings.FEED_INBOX_SIZE,
+            help='Entries kept per inbox'
+        )
+
+    def handle(self, *args, **options):
+        deleted = feeds.trim(max_entries=options['max_entries'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} feed entries'))
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+FTS_TABLE = 'api_catalogentry_fts'
+
+CREATE_FTS = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, artist, genres,
+        content='api_catalogentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER api_catalogentry_ai AFTER INSERT ON api_catalogentry BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, artist, genres)
+        VALUES (new.id, new.name, new.artist, new.genres);
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_catalogentry_ad AFTER DELETE ON api_catalogentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, artist, genres)
+        VALUES ('delete', old.id, old.name, old.artist, old.genres);
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_catalogentry_au AFTER UPDATE ON api_catalogentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, artist, genres)
+        VALUES ('delete', old.id, old.name, old.artist, old.genres);
+        INSERT INTO {FTS_TABLE}(rowid, name, artist, genres)
+        VALUES (new.id, new.name, new.artist, new.genres);
+    END
+    """,
+]
+
+DROP_FTS = [
+    'DROP TRIGGER IF EXISTS api_catalogentry_ai',
+    'DROP TRIGGER IF EXISTS api_catalogentry_ad',
+    'DROP TRIGGER IF EXISTS api_catalogentry_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts(apps, schema_editor):
+    # The FTS5 mirror only exists on SQLite; other databases fall back to
+    # api.catalog_search.DatabaseBackend.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_FTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS:
+        schema_editor.execute(statement)
+
+
+def populate_catalog(apps, schema_editor):
+    Album = apps.get_model('api', 'Album')
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    CatalogEntry = apps.get_model('api', 'CatalogEntry')
+
+    seen = set()
+    entries = []
+    for model in (Album, ListAlbum):
+        rows = model.objects.values_list(
+            'spotify_id', 'name', 'artist', 'genres', 'image_url', 'release_date'
+        ).iterator(chunk_size=2000)
+        for spotify_id, name, artist, genres, image_url, release_date in rows:
+            if not spotify_id or spotify_id in seen:
+                continue
+            seen.add(spotify_id)
+            entries.append(CatalogEntry(
+                spotify_id=spotify_id,
+                name=name or '',
+                artist=artist or '',
+                genres=genres or '',
+                image_url=image_url or '',
+                release_date=release_date,
+            ))
+    CatalogEntry.objects.bulk_create(entries, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_listalbum_genres'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spotify_id', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('artist', models.CharField(blank=True, max_length=255)),
+                ('genres', models.CharField(blank=True, max_length=500)),
+                ('image_url', models.URLField(blank=True, max_length=500)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+        migrations.RunPython(populate_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_trendingsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Artist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spotify_id', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('genres', models.JSONField(blank=True, default=list)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='tracks_fetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Track',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spotify_id', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('track_number', models.PositiveSmallIntegerField()),
+                ('disc_number', models.PositiveSmallIntegerField(default=1)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('explicit', models.BooleanField(default=False)),
+                ('preview_url', models.URLField(blank=True, max_length=500, null=True)),
+                ('artists', models.JSONField(blank=True, default=list)),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='api.album')),
+            ],
+            options={
+                'ordering': ['disc_number', 'track_number'],
+                'unique_together': {('album', 'spotify_id')},
+            },
+        ),
+    ]
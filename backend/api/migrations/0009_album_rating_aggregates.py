@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_aggregates(apps, schema_editor):
+    Album = apps.get_model('api', 'Album')
+    Log = apps.get_model('api', 'Log')
+    rows = Log.objects.values('album_id').annotate(
+        total=Count('id'),
+        total_rating=Sum('rating'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)}
+    )
+    for row in rows.iterator():
+        Album.objects.filter(id=row['album_id']).update(
+            total_logs=row['total'],
+            rating_sum=row['total_rating'] or 0,
+            **{f'rating_{star}_count': row[f'stars_{star}'] for star in range(1, 6)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_track'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_aggregates, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='album',
+            name='average_rating',
+        ),
+    ]
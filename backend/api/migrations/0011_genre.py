@@ -0,0 +1,98 @@
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+
+def split_genres(value):
+    return [genre.strip() for genre in (value or '').split(',') if genre.strip()]
+
+
+def chunks(queryset, size):
+    """``(id, genres_text)`` rows, ``size`` at a time, by id."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'genres_text')[:size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def backfill_genres(apps, schema_editor):
+    Genre = apps.get_model('api', 'Genre')
+    Album = apps.get_model('api', 'Album')
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+
+    for model in (Album, ListAlbum):
+        through = model.genres.through
+        owner_field = f'{model._meta.model_name}_id'
+        tagged = model.objects.exclude(genres_text__isnull=True).exclude(genres_text='')
+        for rows in chunks(tagged, CHUNK_SIZE):
+            names = {name for _, text in rows for name in split_genres(text)}
+            Genre.objects.bulk_create([Genre(name=name) for name in names], ignore_conflicts=True)
+            genre_ids = dict(Genre.objects.filter(name__in=names).values_list('name', 'id'))
+            through.objects.bulk_create([
+                through(**{owner_field: row_id, 'genre_id': genre_ids[name]})
+                for row_id, text in rows
+                for name in dict.fromkeys(split_genres(text))
+            ], ignore_conflicts=True)
+
+
+def restore_genres_text(apps, schema_editor):
+    Album = apps.get_model('api', 'Album')
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    for model in (Album, ListAlbum):
+        for obj in model.objects.prefetch_related('genres').iterator(chunk_size=CHUNK_SIZE):
+            names = [genre.name for genre in obj.genres.all()]
+            if names:
+                model.objects.filter(id=obj.id).update(genres_text=','.join(names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                # As long as the text field it replaces, so any one genre in it fits
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RenameField(
+            model_name='album',
+            old_name='genres',
+            new_name='genres_text',
+        ),
+        migrations.RenameField(
+            model_name='listalbum',
+            old_name='genres',
+            new_name='genres_text',
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='genres',
+            field=models.ManyToManyField(blank=True, related_name='albums', to='api.genre'),
+        ),
+        migrations.AddField(
+            model_name='listalbum',
+            name='genres',
+            field=models.ManyToManyField(blank=True, related_name='list_albums', to='api.genre'),
+        ),
+        migrations.RunPython(backfill_genres, restore_genres_text),
+        migrations.RemoveField(
+            model_name='album',
+            name='genres_text',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='genres_text',
+        ),
+    ]
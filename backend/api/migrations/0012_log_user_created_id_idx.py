@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_genre'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='log_user_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+RANK_GAP = 1024
+
+
+def spread_ranks(apps, schema_editor):
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    changed = []
+    list_id, position = None, 0
+    for album in ListAlbum.objects.order_by('list_id', 'rank', 'id').only('id', 'list_id', 'rank').iterator():
+        if album.list_id != list_id:
+            list_id, position = album.list_id, 0
+        position += 1
+        album.rank = position * RANK_GAP
+        changed.append(album)
+    ListAlbum.objects.bulk_update(changed, ['rank'], batch_size=500)
+
+
+def compact_ranks(apps, schema_editor):
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    changed = []
+    list_id, position = None, 0
+    for album in ListAlbum.objects.order_by('list_id', 'rank', 'id').only('id', 'list_id', 'rank').iterator():
+        if album.list_id != list_id:
+            list_id, position = album.list_id, 0
+        position += 1
+        album.rank = position
+        changed.append(album)
+    ListAlbum.objects.bulk_update(changed, ['rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_ranks, compact_ranks),
+    ]
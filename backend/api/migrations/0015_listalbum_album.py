@@ -0,0 +1,95 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 1000
+METADATA_FIELDS = ('name', 'artist', 'image_url', 'release_date', 'external_url')
+
+
+def link_albums(apps, schema_editor):
+    """
+    Point every list entry at the ``Album`` with its Spotify id, creating
+    albums from the entry's copy of the metadata where none exist yet. Runs
+    one short transaction per chunk and skips linked rows, so it can be
+    interrupted and rerun.
+    """
+    Album = apps.get_model('api', 'Album')
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    AlbumGenre = Album.genres.through
+    alias = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=alias):
+            rows = list(
+                ListAlbum.objects.filter(id__gt=last_id, album__isnull=True)
+                .order_by('id').prefetch_related('genres')[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+            spotify_ids = {row.spotify_id for row in rows}
+
+            known = set(Album.objects.filter(spotify_id__in=spotify_ids).values_list('spotify_id', flat=True))
+            new = {}
+            for row in rows:
+                if row.spotify_id not in known:
+                    new.setdefault(row.spotify_id, row)
+            Album.objects.bulk_create(
+                [
+                    Album(spotify_id=spotify_id, **{field: getattr(row, field) for field in METADATA_FIELDS})
+                    for spotify_id, row in new.items()
+                ],
+                ignore_conflicts=True,
+            )
+            album_ids = dict(Album.objects.filter(spotify_id__in=spotify_ids).values_list('spotify_id', 'id'))
+
+            # Genres only carry over to albums that have none of their own
+            bare = set(Album.objects.filter(id__in=album_ids.values(), genres__isnull=True).values_list('id', flat=True))
+            links = {
+                (album_ids[row.spotify_id], genre.id)
+                for row in rows
+                if album_ids[row.spotify_id] in bare
+                for genre in row.genres.all()
+            }
+            AlbumGenre.objects.bulk_create(
+                [AlbumGenre(album_id=album_id, genre_id=genre_id) for album_id, genre_id in links],
+                ignore_conflicts=True,
+            )
+
+            for row in rows:
+                row.album_id = album_ids[row.spotify_id]
+            ListAlbum.objects.bulk_update(rows, ['album'])
+
+
+def copy_metadata_back(apps, schema_editor):
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    ListAlbumGenre = ListAlbum.genres.through
+    rows = ListAlbum.objects.select_related('album').prefetch_related('album__genres').order_by('id')
+    changed, links = [], []
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        row.spotify_id = row.album.spotify_id
+        for field in METADATA_FIELDS:
+            setattr(row, field, getattr(row.album, field) or ('' if field != 'release_date' else None))
+        row.external_url = row.external_url or f'https://open.spotify.com/album/{row.spotify_id}'
+        changed.append(row)
+        links.extend(ListAlbumGenre(listalbum_id=row.id, genre_id=genre.id) for genre in row.album.genres.all())
+    ListAlbum.objects.bulk_update(changed, ['spotify_id', *METADATA_FIELDS], batch_size=500)
+    ListAlbumGenre.objects.bulk_create(links, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    # Each chunk of link_albums commits on its own
+    atomic = False
+
+    dependencies = [
+        ('api', '0014_sparse_list_ranks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listalbum',
+            name='album',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='list_entries', to='api.album'),
+        ),
+        migrations.RunPython(link_albums, copy_metadata_back),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_listalbum_album'),
+    ]
+
+    operations = [
+        # Defaults let the columns be added back on rollback, before
+        # 0015 copies the metadata into them
+        *(
+            migrations.AlterField(
+                model_name='listalbum',
+                name=name,
+                field=models.CharField(default='', max_length=255),
+            )
+            for name in ('spotify_id', 'name', 'artist')
+        ),
+        migrations.AlterField(
+            model_name='listalbum',
+            name='album',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='list_entries', to='api.album'),
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='spotify_id',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='artist',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='image_url',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='release_date',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='external_url',
+        ),
+        migrations.RemoveField(
+            model_name='listalbum',
+            name='genres',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_entries(apps, schema_editor):
+    """Keep the first placement of an album that was added to a list twice."""
+    ListAlbum = apps.get_model('api', 'ListAlbum')
+    previous, duplicates = None, []
+    entries = ListAlbum.objects.order_by('list_id', 'album_id', 'rank', 'id').values_list('id', 'list_id', 'album_id')
+    for entry_id, list_id, album_id in entries.iterator(chunk_size=2000):
+        if (list_id, album_id) == previous:
+            duplicates.append(entry_id)
+        previous = (list_id, album_id)
+    for start in range(0, len(duplicates), 500):
+        ListAlbum.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_remove_listalbum_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_entries, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='listalbum',
+            unique_together={('list', 'album')},
+        ),
+        migrations.AddIndex(
+            model_name='favoritealbum',
+            index=models.Index(fields=['user', '-added_at'], name='favorite_user_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listalbum',
+            index=models.Index(fields=['list', 'rank', 'id'], name='listalbum_list_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['album', 'rating'], name='log_album_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_album_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userstats',
+            name='top_genre',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -1,22 +1,42 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+SPOTIFY_ALBUM_URL = 'https://open.spotify.com/album/{}'
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     bio = models.TextField(max_length=500, blank=True, null=True)
     followers = models.ManyToManyField(User, related_name='following', blank=True)
+    # Too many followers to copy each log into every inbox; followers'
+    # feeds read this user's logs directly instead (see api.feeds)
+    fanout_on_read = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
     
     @property
     def followers_count(self):
+        # Querysets from api.profiles annotate the count up front
+        if hasattr(self, 'num_followers'):
+            return self.num_followers
         return self.followers.count()
 
+class Genre(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
 class Album(models.Model):
     spotify_id = models.CharField(max_length=255, unique=True)
     name = models.CharField(max_length=255, blank=True, null=True)
@@ -24,23 +44,86 @@ class Album(models.Model):
     image_url = models.URLField(max_length=500, blank=True, null=True)
     release_date = models.DateField(null=True, blank=True)
     external_url = models.URLField(max_length=500, default='', blank=True)
-    genres = models.CharField(max_length=200, blank=True, null=True)
+    genres = models.ManyToManyField(Genre, related_name='albums', blank=True)
     
-    average_rating = models.DecimalField(
-        max_digits=3, 
-        decimal_places=2, 
-        default=0
-    )
+    # Rating aggregates, maintained incrementally by api.ratings
     total_logs = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Set once the full tracklist is stored in Track
+    tracks_fetched_at = models.DateTimeField(null=True, blank=True)
+    # Also bumped by the rating aggregate and genre updates, which bypass save()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-release_date']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def remember_loaded_state(self):
+        # Lets the save hook move users' artist tallies when the artist changes
+        if 'artist' in self.__dict__:
+            self._loaded_artist = self.artist
+
+    @staticmethod
+    def compute_average_rating(rating_sum, total_logs):
+        if not total_logs:
+            return Decimal('0.00')
+        return (Decimal(rating_sum) / total_logs).quantize(Decimal('0.01'))
+
+    @property
+    def average_rating(self):
+        return self.compute_average_rating(self.rating_sum, self.total_logs)
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
     def __str__(self):
         artist_name = self.artist or 'Unknown Artist'
         album_name = self.name or 'Untitled Album'
         return f"{album_name} by {artist_name}"
 
+class Track(models.Model):
+    album = models.ForeignKey(Album, related_name='tracks', on_delete=models.CASCADE)
+    spotify_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    track_number = models.PositiveSmallIntegerField()
+    disc_number = models.PositiveSmallIntegerField(default=1)
+    duration_ms = models.PositiveIntegerField(default=0)
+    explicit = models.BooleanField(default=False)
+    preview_url = models.URLField(max_length=500, blank=True, null=True)
+    artists = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['disc_number', 'track_number']
+        unique_together = ['album', 'spotify_id']
+
+    def __str__(self):
+        return f"{self.track_number}. {self.name}"
+
+class Artist(models.Model):
+    """Spotify artist metadata cached locally; see ``api.artists``."""
+    spotify_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255, db_index=True)
+    genres = models.JSONField(default=list, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def primary_genre(self):
+        return self.genres[0] if self.genres else ''
+
 class Log(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     album = models.ForeignKey(Album, on_delete=models.CASCADE)
@@ -57,10 +140,92 @@ class Log(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'album', 'listen_date']
+        indexes = [
+            # Keyset pagination of a user's logs; see api.pagination
+            models.Index(fields=['user', '-created_at', '-id'], name='log_user_created_id_idx'),
+            # Covers the per-album rating aggregates in api.ratings
+            models.Index(fields=['album', 'rating'], name='log_album_rating_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def remember_loaded_state(self):
+        # What the row looked like in the database, so save hooks can apply
+        # aggregate deltas instead of recomputing
+        self._loaded_rating = self.__dict__.get('rating')
+        self._loaded_album_id = self.__dict__.get('album_id')
+        self._loaded_relisten = self.__dict__.get('relisten')
+
+    def album_changed(self):
+        # LogSerializer writes album_id as a string, so compare them as strings
+        return str(self._loaded_album_id) != str(self.album_id)
 
     def __str__(self):
         return f"{self.user.username} - {self.album.name} ({self.rating}★)"
 
+class UserStats(models.Model):
+    """
+    Per-user log statistics, kept current by Log save/delete hooks in
+    ``api.user_stats`` so stats and profile reads are a single row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_logs = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    relisten_count = models.PositiveIntegerField(default=0)
+    # Time-windowed counts, recomputed when windows_date is not today
+    logs_this_year = models.PositiveIntegerField(default=0)
+    logs_last_30_days = models.PositiveIntegerField(default=0)
+    windows_date = models.DateField(null=True, blank=True)
+    top_artist = models.CharField(max_length=255, blank=True, null=True)
+    top_genre = models.CharField(max_length=255, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s stats"
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.total_logs if self.total_logs else 0
+
+class FeedEntry(models.Model):
+    """One log in a follower's feed inbox, written on fan-out by ``api.feeds``."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    log = models.ForeignKey(Log, on_delete=models.CASCADE, related_name='+')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Copied from the log so the inbox index covers the feed order
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['owner', 'log']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-log'], name='feedentry_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='feedentry_owner_author_idx'),
+        ]
+
+class UserTally(models.Model):
+    """How many of a user's logs are by an artist or in a genre; used to keep top_artist/top_genre current."""
+    ARTIST = 'artist'
+    GENRE = 'genre'
+    KIND_CHOICES = [(ARTIST, 'Artist'), (GENRE, 'Genre')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tallies')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'kind', 'value']
+        indexes = [models.Index(fields=['user', 'kind', '-count'])]
+
 class FavoriteAlbum(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_albums')
     album = models.ForeignKey(Album, on_delete=models.CASCADE)
@@ -69,6 +234,7 @@ class FavoriteAlbum(models.Model):
     class Meta:
         unique_together = ('user', 'album')
         ordering = ['-added_at']
+        indexes = [models.Index(fields=['user', '-added_at'], name='favorite_user_added_idx')]
 
     def __str__(self):
         return f"{self.album.name} by {self.album.artist}"
@@ -83,19 +249,101 @@ class List(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+    @classmethod
+    def touch(cls, list_id):
+        """Bump ``updated_at`` after its entries change; bulk writes to them skip signals."""
+        cls.objects.filter(id=list_id).update(updated_at=timezone.now())
+
 class ListAlbum(models.Model):
+    """An album's place in a list. Metadata and genres live on ``Album``, shared by every list."""
     list = models.ForeignKey(List, related_name='albums', on_delete=models.CASCADE)
-    spotify_id = models.CharField(max_length=255)
-    name = models.CharField(max_length=255)
-    artist = models.CharField(max_length=255)
-    image_url = models.URLField(max_length=500, blank=True)
-    release_date = models.DateField(null=True, blank=True)
-    external_url = models.URLField(max_length=500, blank=True)
-    genres = models.CharField(max_length=500, blank=True)
+    album = models.ForeignKey(Album, related_name='list_entries', on_delete=models.CASCADE)
     rank = models.IntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['rank']
+        unique_together = ['list', 'album']
+        indexes = [models.Index(fields=['list', 'rank', 'id'], name='listalbum_list_rank_idx')]
+
+    @property
+    def external_url(self):
+        return SPOTIFY_ALBUM_URL.format(self.album.spotify_id)
+
+    @property
+    def genres(self):
+        # Prefetch with 'album__genres'
+        return self.album.genres
+
+class CatalogEntry(models.Model):
+    """
+    One searchable row per Spotify album known locally, i.e. per ``Album``
+    (list entries reference albums too). On SQLite it is mirrored into an FTS5 table
+    by triggers (see migration 0004).
+    """
+    spotify_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    artist = models.CharField(max_length=255, blank=True)
+    genres = models.CharField(max_length=500, blank=True)
+    image_url = models.URLField(max_length=500, blank=True)
+    release_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} by {self.artist}"
+
+class TrendingSnapshot(models.Model):
+    """
+    Precomputed new releases for one market, written by ``refresh_trending``.
+    Every market of a refresh shares the same ``version`` and is written in
+    one transaction, so readers only ever see complete snapshots.
+    """
+    version = models.PositiveIntegerField()
+    country = models.CharField(max_length=2)
+    albums = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version']
+        unique_together = ['version', 'country']
+        indexes = [models.Index(fields=['country', '-version'])]
+
+    def __str__(self):
+        return f"Trending {self.country} v{self.version}"
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_workers``; see ``api.jobs``."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (DEAD, 'Dead'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are ordered by ``(created_at, id)`` descending and each page starts
+strictly after the last row of the previous one, so fetching page N is an
+index seek plus ``page_size`` rows no matter how deep N is. The cursor is
+an opaque urlsafe-base64 token of the last row's key.
+
+``RankPagination`` does the same for list albums in ``(rank, id)`` order.
+"""
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def _pack(self, value, pk):
+        key = f'{value}|{pk}'
+        return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+    def _unpack(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+            return value, int(pk)
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        # Pages hold model instances or values() rows
+        if isinstance(obj, dict):
+            created_at, pk = obj['created_at'], obj['id']
+        else:
+            created_at, pk = obj.created_at, obj.pk
+        return self._pack(created_at.isoformat(), pk)
+
+    def decode_cursor(self, cursor):
+        created_at, pk = self._unpack(cursor)
+        try:
+            created_at = parse_datetime(created_at)
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def get_cursor_key(self, request):
+        """The key the requested page starts after, or None for the first page."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        return self.decode_cursor(cursor) if cursor else None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by('-created_at', '-id')
+        key = self.get_cursor_key(request)
+        if key:
+            created_at, pk = key
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        # One extra row tells us whether there is a next page
+        return self.paginate_rows(list(queryset[:page_size + 1]), request, page_size)
+
+    def paginate_rows(self, rows, request, page_size):
+        """Page from up to ``page_size + 1`` rows already fetched after the cursor, in page order."""
+        self.request = request
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('cursor', self.next_cursor),
+            ('results', data),
+        ]))
+
+
+class RankPagination(KeysetPagination):
+    """Keyset pages of a list's albums, in list order."""
+    page_size = 100
+    max_page_size = 500
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            rank, pk = obj['rank'], obj['id']
+        else:
+            rank, pk = obj.rank, obj.pk
+        return self._pack(rank, pk)
+
+    def decode_cursor(self, cursor):
+        rank, pk = self._unpack(cursor)
+        try:
+            return int(rank), pk
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by('rank', 'id')
+        key = self.get_cursor_key(request)
+        if key:
+            rank, pk = key
+            queryset = queryset.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=pk))
+
+        return self.paginate_rows(list(queryset[:page_size + 1]), request, page_size)
@@ -0,0 +1,113 @@
+"""
+Cached ``/user/profile/`` payloads.
+
+The payload is built from one profile query (user, stats and follower
+count joined or annotated in) plus the favorite albums prefetch, then kept
+in the default cache per user. Signals in ``api.signals`` drop the entry
+whenever anything it shows changes: the user's logs, favorites, profile or
+followers, or the rating aggregates of an album they favorited. Entries
+also expire at the end of the day because the year and last-30-days counts
+roll daily.
+
+The payload is cached without the request's host; ``avatar`` and
+``avatar_url`` are made absolute on the way out. Each entry carries a
+version and build time, the validators for conditional GETs
+(``api.conditional``).
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+
+from . import user_stats
+from .models import FavoriteAlbum, Profile
+from .serializers import ProfileSerializer
+
+KEY_PREFIX = 'profile'
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def make_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def _count(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def load_profile(user_id):
+    favorites = FavoriteAlbum.objects.select_related('album').prefetch_related('album__genres')
+    return (
+        Profile.objects.select_related('user', 'user__stats')
+        .annotate(num_followers=Count('followers'))
+        .prefetch_related(Prefetch('user__favorite_albums', queryset=favorites))
+        .get(user_id=user_id)
+    )
+
+
+def build_payload(profile):
+    data = dict(ProfileSerializer(profile).data)
+    stats = user_stats.get_stats(profile.user)
+    avg_rating = stats.average_rating
+    data.update({
+        'lastMonth': stats.logs_last_30_days,
+        'averageRating': round(avg_rating, 1) if avg_rating else 0,
+        'topArtist': stats.top_artist,
+        'topGenre': stats.top_genre or 'None yet'
+    })
+    return data
+
+
+def get_entry(user_id):
+    """The cached ``{'day', 'data', 'version', 'built_at'}`` for ``user_id``, built on a miss."""
+    today = timezone.localdate().isoformat()
+    key = make_key(user_id)
+    entry = cache.get(key)
+    if entry is not None and entry['day'] == today:
+        _count('hits')
+        return entry
+
+    _count('misses')
+    entry = {
+        'day': today,
+        'data': build_payload(load_profile(user_id)),
+        'version': uuid.uuid4().hex,
+        'built_at': timezone.now(),
+    }
+    cache.set(key, entry, settings.PROFILE_CACHE_TTL)
+    return entry
+
+
+def get_payload(user_id, request, entry=None):
+    data = dict((entry or get_entry(user_id))['data'])
+    if data['avatar']:
+        data['avatar'] = data['avatar_url'] = request.build_absolute_uri(data['avatar'])
+    return data
+
+
+def invalidate(*user_ids):
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        cache.delete_many([make_key(user_id) for user_id in user_ids])
+        _count('invalidations', len(user_ids))
+
+
+def invalidate_album_fans(*album_ids):
+    """Drop the payloads that show ``album_ids`` among their favorites."""
+    album_ids = {album_id for album_id in album_ids if album_id is not None}
+    if album_ids:
+        invalidate(*FavoriteAlbum.objects.filter(album_id__in=album_ids).values_list('user_id', flat=True))
+
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+    total = counters['hits'] + counters['misses']
+    counters['hit_ratio'] = round(counters['hits'] / total, 3) if total else 0
+    return counters
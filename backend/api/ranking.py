@@ -0,0 +1,144 @@
+"""
+Sparse ranks for list albums.
+
+``ListAlbum.rank`` values are spaced ``RANK_GAP`` apart, so moving one album
+only rewrites that album's rank: it takes the midpoint between its new
+neighbours. When two neighbours end up adjacent the list is renormalized
+back to even spacing, which also happens in bulk through
+``manage.py renormalize_ranks``. A whole new order is applied with a single
+``bulk_update``.
+"""
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import List, ListAlbum
+
+RANK_GAP = 1024
+
+
+class RankError(ValueError):
+    pass
+
+
+def next_rank(list_id):
+    """Rank for an album appended to the end of the list."""
+    last = ListAlbum.objects.filter(list_id=list_id).aggregate(last=Max('rank'))['last']
+    return RANK_GAP if last is None else last + RANK_GAP
+
+
+def append_ranks(list_id, count):
+    """
+    ``count`` consecutive ranks after the end of the list. Must be called in
+    a transaction, so concurrent appends can't be handed the same ranks:
+    the list row is locked where the backend supports ``select_for_update()``.
+    SQLite ignores it and relies on the ``IMMEDIATE`` transaction mode set in
+    settings instead, which serializes writing transactions.
+    """
+    list(List.objects.select_for_update().filter(id=list_id).values_list('id', flat=True))
+    first = next_rank(list_id)
+    return [first + position * RANK_GAP for position in range(count)]
+
+
+def _ordered(list_id):
+    # Same order as ListAlbum.Meta.ordering, with a tiebreaker
+    return ListAlbum.objects.filter(list_id=list_id).order_by('rank', 'id')
+
+
+def renormalize(list_id):
+    """Respace the list's ranks to ``RANK_GAP`` apart, keeping the current order."""
+    albums = list(_ordered(list_id).only('id', 'rank'))
+    return _apply_order(list_id, albums)
+
+
+def _apply_order(list_id, albums):
+    changed = []
+    for position, album in enumerate(albums, start=1):
+        if album.rank != position * RANK_GAP:
+            album.rank = position * RANK_GAP
+            changed.append(album)
+    ListAlbum.objects.bulk_update(changed, ['rank'])
+    if changed:
+        List.touch(list_id)
+    return len(changed)
+
+
+def reorder(list_id, album_ids):
+    """
+    Put the list in the order of ``album_ids``, which must name every album
+    in the list exactly once. Returns the number of rows updated.
+    """
+    with transaction.atomic():
+        albums = {album.id: album for album in ListAlbum.objects.select_for_update().filter(list_id=list_id).only('id', 'rank')}
+        if len(album_ids) != len(set(album_ids)) or set(album_ids) != set(albums):
+            raise RankError('The new order must contain every album in the list exactly once')
+        return _apply_order(list_id, [albums[album_id] for album_id in album_ids])
+
+
+def _between(previous, following):
+    if previous is None:
+        return following - RANK_GAP
+    if following is None:
+        return previous + RANK_GAP
+    if following - previous > 1:
+        return (previous + following) // 2
+    return None
+
+
+def _neighbour(list_id, album_id, rank, pk, following):
+    """``(id, rank)`` of the album right after (or before) ``(rank, pk)``, skipping ``album_id``."""
+    others = _ordered(list_id).exclude(id=album_id)
+    if following:
+        others = others.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=pk))
+    else:
+        others = others.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=pk)).order_by('-rank', '-id')
+    return others.values_list('id', 'rank').first()
+
+
+def _ranks(list_id, ids):
+    return dict(ListAlbum.objects.select_for_update().filter(list_id=list_id, id__in=ids).values_list('id', 'rank'))
+
+
+def move(list_id, album_id, after_id=None, before_id=None):
+    """
+    Move one album to sit right after ``after_id`` or right before
+    ``before_id``. Only the moved album's row is written unless its new
+    neighbours have run out of room between them. Returns the new rank.
+    """
+    if after_id is None and before_id is None:
+        raise RankError('Give the album to place it after or before')
+    if album_id in (after_id, before_id):
+        raise RankError('An album cannot be placed next to itself')
+
+    with transaction.atomic():
+        ids = {album_id, after_id, before_id} - {None}
+        ranks = _ranks(list_id, ids)
+        if ids - set(ranks):
+            raise RankError('Albums must belong to the list')
+        if None in ranks.values():
+            renormalize(list_id)
+            ranks = _ranks(list_id, ids)
+
+        if before_id is None:
+            found = _neighbour(list_id, album_id, ranks[after_id], after_id, following=True)
+            if found:
+                before_id, ranks[found[0]] = found
+        elif after_id is None:
+            found = _neighbour(list_id, album_id, ranks[before_id], before_id, following=False)
+            if found:
+                after_id, ranks[found[0]] = found
+
+        # Stale or inverted neighbours from the client have no gap to fill
+        if after_id is not None and before_id is not None and (ranks[after_id], after_id) >= (ranks[before_id], before_id):
+            raise RankError('The album to place it after must come before the album to place it before')
+
+        rank = _between(ranks.get(after_id), ranks.get(before_id))
+        if rank is None:
+            renormalize(list_id)
+            ranks = _ranks(list_id, {after_id, before_id})
+            rank = _between(ranks[after_id], ranks[before_id])
+        if rank is None:
+            raise RankError('No room between the given albums')
+
+        ListAlbum.objects.filter(id=album_id).update(rank=rank)
+        List.touch(list_id)
+        return rank
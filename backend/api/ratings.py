@@ -0,0 +1,101 @@
+"""
+Incremental album rating aggregates.
+
+``Album`` stores the number of logs, the sum of their ratings and a per-star
+histogram. Every Log write applies its delta with a single ``F()`` UPDATE
+(see ``api.signals``), so concurrent writes never lose increments and the
+cost doesn't grow with the number of logs. ``reconcile()`` repairs any drift
+left by bulk operations that bypass signals. Decrements stop at 0, so a
+counter that drifted low can't break the fields' ``>= 0`` check on delete.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Album, Log
+
+STARS = range(1, 6)
+AGGREGATE_FIELDS = ['total_logs', 'rating_sum'] + [f'rating_{star}_count' for star in STARS]
+
+
+def _deltas(old_rating, new_rating):
+    """Per-field increments for replacing ``old_rating`` by ``new_rating`` (either may be None)."""
+    deltas = {
+        'total_logs': (new_rating is not None) - (old_rating is not None),
+        'rating_sum': (new_rating or 0) - (old_rating or 0),
+    }
+    if old_rating != new_rating:
+        if old_rating is not None:
+            deltas[f'rating_{old_rating}_count'] = -1
+        if new_rating is not None:
+            deltas[f'rating_{new_rating}_count'] = 1
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def _applied(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def apply_change(album_id, old_rating=None, new_rating=None):
+    """Atomically move one log's contribution on ``album_id`` from ``old_rating`` to ``new_rating``."""
+    deltas = _deltas(old_rating, new_rating)
+    if album_id is None or not deltas:
+        return
+    Album.objects.filter(id=album_id).update(
+        updated_at=timezone.now(),
+        **{field: _applied(field, delta) for field, delta in deltas.items()}
+    )
+
+
+def log_saved(log, created):
+    loaded_album_id = getattr(log, '_loaded_album_id', None)
+    loaded_rating = getattr(log, '_loaded_rating', None)
+    if created or loaded_album_id is None:
+        apply_change(log.album_id, new_rating=log.rating)
+    elif log.album_changed():
+        apply_change(loaded_album_id, old_rating=loaded_rating)
+        apply_change(log.album_id, new_rating=log.rating)
+    else:
+        apply_change(log.album_id, old_rating=loaded_rating, new_rating=log.rating)
+
+
+def log_deleted(log):
+    apply_change(log.album_id, old_rating=log.rating)
+
+
+def compute(log_queryset):
+    """``{album_id: {field: value}}`` from scratch with one grouped query."""
+    rows = log_queryset.values('album_id').annotate(
+        total_logs=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in STARS}
+    )
+    return {row.pop('album_id'): row for row in rows}
+
+
+def reconcile(chunk_size=1000):
+    """Recompute aggregates chunk by chunk and fix albums that drifted. Returns the fix count."""
+    fixed = 0
+    last_id = 0
+    while True:
+        albums = list(
+            Album.objects.filter(id__gt=last_id).order_by('id').only('id', *AGGREGATE_FIELDS)[:chunk_size]
+        )
+        if not albums:
+            return fixed
+        last_id = albums[-1].id
+
+        actual = compute(Log.objects.filter(album_id__gte=albums[0].id, album_id__lte=last_id))
+        drifted = []
+        for album in albums:
+            values = actual.get(album.id, {})
+            expected = {field: values.get(field) or 0 for field in AGGREGATE_FIELDS}
+            if any(getattr(album, field) != value for field, value in expected.items()):
+                for field, value in expected.items():
+                    setattr(album, field, value)
+                album.updated_at = timezone.now()
+                drifted.append(album)
+        Album.objects.bulk_update(drifted, [*AGGREGATE_FIELDS, 'updated_at'])
+        fixed += len(drifted)
@@ -0,0 +1,29 @@
+"""
+orjson-backed JSON rendering for the hot read endpoints.
+
+``ORJSONRenderer`` is a drop-in for DRF's ``JSONRenderer``: compact output,
+UTF-8 rather than ASCII escapes, ``\\u2028``/``\\u2029`` escaped, and dates,
+datetimes and decimals formatted by DRF's own encoder. It only differs for
+floats that Python writes with an exponent (``1e+16`` vs ``1e16``), which
+the endpoints using it never return. Indented output (the browsable API,
+``Accept: application/json; indent=4``) is left to ``JSONRenderer``.
+"""
+import orjson
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=OPTIONS)
+        # Same escaping as JSONRenderer, keeping the output a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+FAST_RENDERER_CLASSES = [ORJSONRenderer, BrowsableAPIRenderer]
@@ -0,0 +1,105 @@
+"""
+Read replica routing.
+
+When ``settings.DATABASE_REPLICA_NAME`` is set, the ``replica`` alias points
+at a copy of the primary database (for SQLite, a second file kept in sync
+with ``manage.py sync_replica``, Litestream or similar). ``ReplicaRouter``
+sends reads there only inside views wrapped with ``replica_reads``: the
+read-only stats, feed and list endpoints. Everything else, and every write,
+stays on ``default``. Code that writes back what it reads, like the
+materialized user stats, wraps those reads in ``primary()``.
+
+Replicas lag, so a user who just changed something must not read it back
+from one. ``ReplicaPinMiddleware`` pins a user to the primary for
+``settings.REPLICA_PIN_SECONDS`` after any successful unsafe request of
+theirs; pins live in the default cache so every worker sees them.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+KEY_PREFIX = 'replica-pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.databases
+
+
+def make_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def pin(user_id):
+    """Serve ``user_id``'s reads from the primary for the next few seconds."""
+    cache.set(make_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(make_key(user_id), False)
+
+
+def replica_reads(method):
+    """Route the reads of a view method (``self, request, ...``) to the replica."""
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        user_id = getattr(request.user, 'pk', None)
+        use = replica_configured() and not (user_id is not None and is_pinned(user_id))
+        token = _use_replica.set(use)
+        try:
+            return method(self, request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. for results that get written back."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction on the primary must see its writes
+        if _use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return db != REPLICA_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Pin users to the primary after they write; see ``pin()``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if replica_configured() and request.method not in SAFE_METHODS and response.status_code < 400:
+            # DRF copies the token-authenticated user back onto the HttpRequest
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin(user.pk)
+        return response
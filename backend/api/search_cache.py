@@ -0,0 +1,72 @@
+"""
+Result cache for ``/spotify/search/``.
+
+Search queries are driven by keystrokes and the same popular queries repeat
+all day, so results are kept in a dedicated Django cache alias keyed by the
+normalized query, search type and limit. Expired results are served stale
+and refreshed in the background; see ``api.swr``.
+"""
+import hashlib
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import swr
+
+CACHE_ALIAS = 'spotify_search'
+KEY_PREFIX = 'spotify-search'
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def normalize_query(query):
+    """Fold case, unicode compatibility forms, accents and whitespace."""
+    query = unicodedata.normalize('NFKD', query or '')
+    query = ''.join(ch for ch in query if not unicodedata.combining(ch))
+    return ' '.join(query.casefold().split())
+
+
+def make_key(query, search_type, limit):
+    raw = f"{normalize_query(query)}|{search_type}|{limit}"
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def cached_search(query, search_type, limit, fetch):
+    """
+    Return cached results for the query, calling ``fetch()`` on a miss.
+
+    Empty results are cached too, so nonsense queries don't keep hitting
+    Spotify either.
+    """
+    policy = settings.SPOTIFY_PROXY_CACHE['search']
+    key = make_key(query, search_type, limit)
+    results, state = swr.get(caches[CACHE_ALIAS], key, fetch, policy['ttl'], policy['stale'])
+    _count('misses' if state == 'miss' else 'hits')
+    return results
+
+
+def get_stats():
+    with _lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else 0,
+    }
+
+
+def clear():
+    caches[CACHE_ALIAS].clear()
+    with _lock:
+        _counters['hits'] = 0
+        _counters['misses'] = 0
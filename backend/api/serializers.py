@@ -1,7 +1,12 @@
+import calendar
+from datetime import date
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Album, Log, Profile, FavoriteAlbum, List, ListAlbum
-from django.utils import timezone
+from .user_stats import get_stats
+from .genres import format_genres, parse_genres, set_genres
+from . import list_albums, stats_query
 
 
 # User Serializer
@@ -21,8 +26,45 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+# Genres Field
+class GenresField(serializers.Field):
+    """Genres as the comma-separated string the API has always used."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', '*')
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        return format_genres(obj)
+
+    def to_internal_value(self, data):
+        if data is not None and not isinstance(data, (str, list)):
+            raise serializers.ValidationError("genres must be a comma-separated string or a list")
+        return {'genres': parse_genres(data)}
+
+
+class GenresMixin:
+    """Saves the names collected by GenresField into the genres M2M."""
+
+    def create(self, validated_data):
+        names = validated_data.pop('genres', None)
+        instance = super().create(validated_data)
+        if names:
+            set_genres(instance, names)
+        return instance
+
+    def update(self, instance, validated_data):
+        names = validated_data.pop('genres', None)
+        instance = super().update(instance, validated_data)
+        # An empty value leaves enriched genres alone
+        if names:
+            set_genres(instance, names)
+        return instance
+
 # Album Serializer
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(GenresMixin, serializers.ModelSerializer):
+    genres = GenresField()
     average_rating = serializers.DecimalField(
         max_digits=3, 
         decimal_places=2, 
@@ -130,7 +172,10 @@ class ProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'followers_count', 'favorite_albums', 'total_logs', 'logs_this_year']
 
     def get_favorite_albums(self, obj):
-        favorites = FavoriteAlbum.objects.filter(user=obj.user)
+        if 'favorite_albums' in getattr(obj.user, '_prefetched_objects_cache', {}):
+            favorites = obj.user.favorite_albums.all()
+        else:
+            favorites = FavoriteAlbum.objects.filter(user=obj.user).select_related('album').prefetch_related('album__genres')
         return FavoriteAlbumSerializer(favorites, many=True).data
 
     def get_avatar_url(self, obj):
@@ -152,25 +197,36 @@ class ProfileSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
     def get_total_logs(self, obj):
-        return Log.objects.filter(user=obj.user).count()
+        return get_stats(obj.user).total_logs
 
     def get_logs_this_year(self, obj):
-        current_year = timezone.now().year
-        return Log.objects.filter(
-            user=obj.user,
-            created_at__year=current_year
-        ).count()
+        return get_stats(obj.user).logs_this_year
 
 # List Album Serializer
 class ListAlbumSerializer(serializers.ModelSerializer):
+    """A list entry with its album's metadata flattened in; read with select_related('album')."""
+    spotify_id = serializers.CharField(source='album.spotify_id', max_length=255)
+    name = serializers.CharField(source='album.name', max_length=255)
+    artist = serializers.CharField(source='album.artist', max_length=255)
+    image_url = serializers.URLField(source='album.image_url', max_length=500, required=False, allow_blank=True, allow_null=True)
+    release_date = serializers.DateField(source='album.release_date', required=False, allow_null=True)
+    external_url = serializers.CharField(read_only=True)
+    genres = GenresField()
+
     class Meta:
         model = ListAlbum
         fields = ['id', 'spotify_id', 'name', 'artist', 'image_url', 'release_date', 'external_url', 'list', 'rank', 'genres']
         read_only_fields = ['id']
 
+    def create(self, validated_data):
+        album_data = validated_data.pop('album')
+        names = validated_data.pop('genres', None)
+        album = list_albums.get_album(album_data.pop('spotify_id'), album_data, names)
+        return ListAlbum.objects.create(album=album, **validated_data)
+
 # List Serializer
 class ListSerializer(serializers.ModelSerializer):
-    albums = ListAlbumSerializer(many=True, read_only=True)
+    albums = serializers.SerializerMethodField()
     album_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -178,9 +234,106 @@ class ListSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'created_at', 'updated_at', 'albums', 'album_count']
         read_only_fields = ['user']
 
+    def get_albums(self, obj):
+        albums = obj.albums.select_related('album').prefetch_related('album__genres')
+        return ListAlbumSerializer(albums, many=True).data
+
     def get_album_count(self, obj):
+        # Annotated by the list views; counted for freshly saved lists
+        if hasattr(obj, 'num_albums'):
+            return obj.num_albums
         return obj.albums.count()
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
+
+class ListDetailSerializer(ListSerializer):
+    """A list with one page of its albums, passed in as ``context['albums']``."""
+    albums = serializers.SerializerMethodField()
+
+    def get_albums(self, obj):
+        return ListAlbumSerializer(self.context['albums'], many=True).data
+
+class ListSummarySerializer(serializers.ModelSerializer):
+    """A list for the overview: its album count and first covers, passed in as ``context['covers']``."""
+    album_count = serializers.IntegerField(source='num_albums', read_only=True)
+    covers = serializers.SerializerMethodField()
+
+    class Meta:
+        model = List
+        fields = ['id', 'title', 'description', 'created_at', 'updated_at', 'album_count', 'covers']
+
+    def get_covers(self, obj):
+        return self.context['covers'].get(obj.id, [])
+
+# Stats Query Serializer
+class StatsQuerySerializer(serializers.Serializer):
+    """Validates /stats/query/ parameters and resolves them to a date window."""
+    year = serializers.IntegerField(required=False, min_value=1900, max_value=2100)
+    month = serializers.RegexField(r'^\d{4}-(0[1-9]|1[0-2])$', required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=stats_query.GROUPINGS, required=False)
+    metrics = serializers.CharField(required=False)
+
+    def validate_metrics(self, value):
+        metrics = [metric.strip() for metric in value.split(',') if metric.strip()]
+        unknown = sorted(set(metrics) - set(stats_query.METRICS))
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown metrics: {', '.join(unknown)}. Choose from {', '.join(stats_query.METRICS)}"
+            )
+        return metrics
+
+    def validate(self, data):
+        windows = [key for key in ('year', 'month') if key in data]
+        if 'start' in data or 'end' in data:
+            windows.append('start/end')
+        if len(windows) > 1:
+            raise serializers.ValidationError(f"Use only one of: {', '.join(windows)}")
+
+        if 'year' in data:
+            data['start'] = date(data['year'], 1, 1)
+            data['end'] = date(data['year'], 12, 31)
+        elif 'month' in data:
+            year, month = (int(part) for part in data['month'].split('-'))
+            data['start'] = date(year, month, 1)
+            data['end'] = date(year, month, calendar.monthrange(year, month)[1])
+        elif data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError("start must be on or before end")
+
+        data['metrics'] = data.get('metrics') or list(stats_query.METRICS)
+        return data
+
+
+class LogFilterSerializer(serializers.Serializer):
+    """Validates the /logs/ filters."""
+    rating = serializers.IntegerField(required=False, min_value=1, max_value=5)
+    relisten = serializers.BooleanField(required=False, allow_null=True, default=None)
+    listened_after = serializers.DateField(required=False)
+    listened_before = serializers.DateField(required=False)
+    artist = serializers.CharField(required=False)
+    genre = serializers.CharField(required=False)
+
+    def validate(self, data):
+        after, before = data.get('listened_after'), data.get('listened_before')
+        if after and before and after > before:
+            raise serializers.ValidationError("listened_after must be on or before listened_before")
+        return data
+
+    def filter(self, logs):
+        data = self.validated_data
+        if 'rating' in data:
+            logs = logs.filter(rating=data['rating'])
+        if data.get('relisten') is not None:
+            logs = logs.filter(relisten=data['relisten'])
+        if 'listened_after' in data:
+            logs = logs.filter(listen_date__gte=data['listened_after'])
+        if 'listened_before' in data:
+            logs = logs.filter(listen_date__lte=data['listened_before'])
+        if data.get('artist'):
+            logs = logs.filter(album__artist__iexact=data['artist'])
+        if data.get('genre'):
+            logs = logs.filter(album__genres__name=data['genre'])
+        return logs
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Album, FavoriteAlbum, Genre, List, ListAlbum, Log, Profile, UserStats
+from . import catalog_search, feeds, profiles, ratings, user_stats
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def sync_catalog_entry(sender, instance, **kwargs):
+    catalog_search.sync(instance.spotify_id)
+
+
+@receiver(m2m_changed, sender=Album.genres.through)
+def sync_catalog_entry_genres(sender, instance, action, reverse, **kwargs):
+    if action.startswith('post_') and not reverse:
+        catalog_search.sync(instance.spotify_id)
+        profiles.invalidate_album_fans(instance.id)
+        # Genres show in every payload the album is part of; see api.conditional
+        Album.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Album.genres.through)
+def update_genre_tallies(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        album_ids = pk_set if action != 'pre_clear' else list(instance.albums.values_list('id', flat=True))
+        genres = Genre.objects.filter(pk=instance.pk)
+    else:
+        album_ids = [instance.pk]
+        genres = Genre.objects.filter(id__in=pk_set) if action != 'pre_clear' else instance.genres.all()
+    user_stats.genres_changed(album_ids, genres, sign)
+
+
+@receiver(post_save, sender=Album)
+def update_artist_tallies(sender, instance, created, **kwargs):
+    loaded_artist = getattr(instance, '_loaded_artist', instance.artist)
+    if not created and loaded_artist != instance.artist:
+        user_stats.artist_changed(instance.pk, loaded_artist, instance.artist)
+    instance.remember_loaded_state()
+
+
+# Deletes touch the list in the view: a delete receiver would turn the
+# cascade from deleting a list into one query per entry
+@receiver(post_save, sender=ListAlbum)
+def touch_list(sender, instance, **kwargs):
+    List.touch(instance.list_id)
+
+
+@receiver(post_save, sender=Log)
+def update_aggregates_on_log_save(sender, instance, created, **kwargs):
+    ratings.log_saved(instance, created)
+    user_stats.log_saved(instance, created)
+    profiles.invalidate(instance.user_id)
+    profiles.invalidate_album_fans(instance.album_id, getattr(instance, '_loaded_album_id', None))
+    if created:
+        feeds.log_created(instance)
+    instance.remember_loaded_state()
+
+
+@receiver(post_delete, sender=Log)
+def update_aggregates_on_log_delete(sender, instance, **kwargs):
+    ratings.log_deleted(instance)
+    user_stats.log_deleted(instance)
+    profiles.invalidate(instance.user_id)
+    profiles.invalidate_album_fans(instance.album_id)
+
+
+@receiver(post_save, sender=Album)
+def invalidate_album_fan_profiles(sender, instance, **kwargs):
+    profiles.invalidate_album_fans(instance.id)
+
+
+@receiver(post_save, sender=FavoriteAlbum)
+@receiver(post_delete, sender=FavoriteAlbum)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=UserStats)
+def invalidate_profile(sender, instance, **kwargs):
+    profiles.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Profile.followers.through)
+def invalidate_followed_profiles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        profiles.invalidate(instance.user_id)
+    else:
+        # instance is the follower; pk_set holds profile ids (None on clear)
+        followed = Profile.objects.filter(pk__in=pk_set) if pk_set else instance.following.all()
+        profiles.invalidate(*followed.values_list('user_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Profile.followers.through)
+def update_feeds_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is None on clear; remember what is about to go
+        related = instance.following if reverse else instance.followers
+        instance._cleared_follow_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_follow_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        pairs = [(profile_id, instance.pk) for profile_id in pk_set]
+    else:
+        pairs = [(instance.pk, user_id) for user_id in pk_set]
+    if not pairs:
+        return
+    if action == 'post_add':
+        feeds.followed(pairs)
+    else:
+        feeds.unfollowed(pairs)
@@ -0,0 +1,162 @@
+"""
+Process-wide Spotify client shared by every Spotify-backed view.
+
+Building ``spotipy.Spotify(SpotifyClientCredentials(...))`` per request
+costs a fresh TLS handshake plus a token round trip each time. This module
+keeps a single keep-alive ``requests.Session`` and a client-credentials
+token that is only refreshed shortly before it expires.
+"""
+import threading
+import time
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+SPOTIFY_AUTH_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_BASE_URL = "https://api.spotify.com/v1"
+
+# Refresh the token this many seconds before Spotify says it expires
+TOKEN_REFRESH_MARGIN = 60
+REQUEST_TIMEOUT = 5
+POOL_SIZE = 20
+
+
+class SpotifyTokenError(Exception):
+    pass
+
+
+class CachedClientCredentials:
+    """
+    Client-credentials auth manager that keeps the token in memory.
+
+    Implements the ``get_access_token`` hook spotipy calls before each
+    request, so it can be passed as ``auth_manager`` to ``spotipy.Spotify``.
+    """
+
+    def __init__(self, client_id, client_secret, session, margin=TOKEN_REFRESH_MARGIN):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = session
+        self.margin = margin
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.reuses = 0
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.margin
+
+    def get_access_token(self, as_dict=False):
+        if self._is_fresh():
+            with self._lock:
+                self.reuses += 1
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we were waiting
+            if self._is_fresh():
+                self.reuses += 1
+                return self._token
+
+            response = self.session.post(
+                SPOTIFY_AUTH_URL,
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id or '', self.client_secret or ''),
+                timeout=REQUEST_TIMEOUT,
+            )
+            if response.status_code != 200:
+                raise SpotifyTokenError("Failed to get Spotify access token")
+
+            payload = response.json()
+            self._token = payload["access_token"]
+            self._expires_at = time.time() + int(payload.get("expires_in", 3600))
+            self.fetches += 1
+            return self._token
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+    def stats(self):
+        return {
+            'token_fetches': self.fetches,
+            'token_reuses': self.reuses,
+            'token_expires_in': max(0, int(self._expires_at - time.time())),
+        }
+
+
+_lock = threading.Lock()
+_session = None
+_auth_manager = None
+_client = None
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Shared keep-alive HTTP session used for every Spotify call."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_auth_manager():
+    global _auth_manager
+    if _auth_manager is None:
+        session = get_session()
+        with _lock:
+            if _auth_manager is None:
+                _auth_manager = CachedClientCredentials(
+                    settings.SPOTIFY_CLIENT_ID,
+                    settings.SPOTIFY_CLIENT_SECRET,
+                    session,
+                )
+    return _auth_manager
+
+
+def get_access_token():
+    return get_auth_manager().get_access_token()
+
+
+def get_spotify():
+    """Return the shared ``spotipy.Spotify`` instance, creating it on first use."""
+    global _client
+    if _client is None:
+        auth_manager = get_auth_manager()
+        with _lock:
+            if _client is None:
+                _client = spotipy.Spotify(
+                    auth_manager=auth_manager,
+                    requests_session=auth_manager.session,
+                    requests_timeout=REQUEST_TIMEOUT,
+                )
+    return _client
+
+
+def get_stats():
+    if _auth_manager is None:
+        return {'token_fetches': 0, 'token_reuses': 0, 'token_expires_in': 0}
+    return _auth_manager.stats()
+
+
+def reset():
+    """Drop the shared client, e.g. after credentials change or in tests."""
+    global _session, _auth_manager, _client
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _auth_manager = None
+        _client = None
@@ -0,0 +1,117 @@
+"""
+Windowed log statistics computed in a single query.
+
+``run()`` filters a user's logs to an optional date window, optionally groups
+them into buckets (month, release decade, rating or genre) and computes
+every requested metric with conditional aggregation in the same GROUP BY
+query. All metrics are additive, so the totals are summed from the buckets
+instead of queried again, except for genres: an album can have several, so
+those buckets overlap and the totals need their own aggregate. Unwindowed, ungrouped queries are answered from the
+materialized ``UserStats`` row.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, ExtractYear, Mod, TruncDate, TruncMonth
+
+from .models import Log
+from .user_stats import get_stats
+
+STARS = range(1, 6)
+METRICS = ('count', 'average_rating', 'relistens', 'ratings')
+GROUPINGS = ('month', 'decade', 'rating', 'genre')
+OVERLAPPING_GROUPINGS = ('genre',)
+
+
+def log_date():
+    """The day a log counts towards: when it was listened to, else when it was logged."""
+    return Coalesce('listen_date', TruncDate('created_at'))
+
+
+def _bucket_expression(group_by):
+    if group_by == 'month':
+        return TruncMonth(log_date())
+    if group_by == 'decade':
+        year = ExtractYear('album__release_date')
+        return year - Mod(year, 10)
+    if group_by == 'genre':
+        return F('album__genres__name')
+    return F('rating')
+
+
+def _bucket_key(group_by, value):
+    if group_by == 'month' and value is not None:
+        return value.strftime('%Y-%m')
+    return value
+
+
+def _aggregates(metrics):
+    # count and rating_sum are always needed to derive averages and totals
+    aggregates = {'count': Count('id'), 'rating_sum': Coalesce(Sum('rating'), 0)}
+    if 'relistens' in metrics:
+        aggregates['relistens'] = Count('id', filter=Q(relisten=True))
+    if 'ratings' in metrics:
+        aggregates.update({f'rating_{star}': Count('id', filter=Q(rating=star)) for star in STARS})
+    return aggregates
+
+
+def _format(row, metrics):
+    result = {}
+    if 'count' in metrics:
+        result['count'] = row['count']
+    if 'average_rating' in metrics:
+        result['average_rating'] = row['rating_sum'] / row['count'] if row['count'] else 0
+    if 'relistens' in metrics:
+        result['relistens'] = row['relistens']
+    if 'ratings' in metrics:
+        result['ratings'] = {str(star): row[f'rating_{star}'] for star in STARS}
+    return result
+
+
+def _materialized_row(user):
+    stats = get_stats(user)
+    row = {
+        'count': stats.total_logs,
+        'rating_sum': stats.rating_sum,
+        'relistens': stats.relisten_count,
+    }
+    row.update({f'rating_{star}': getattr(stats, f'rating_{star}_count') for star in STARS})
+    return row
+
+
+def run(user, start=None, end=None, group_by=None, metrics=METRICS):
+    """
+    Statistics for ``user``'s logs dated between ``start`` and ``end``
+    (inclusive, either may be None).
+
+    Returns ``{'totals': {...}, 'buckets': [{'key': ..., ...}]}``; buckets is
+    empty when ``group_by`` is None.
+    """
+    if start is None and end is None and group_by is None:
+        return {'totals': _format(_materialized_row(user), metrics), 'buckets': []}
+
+    logs = Log.objects.filter(user=user)
+    if start is not None or end is not None:
+        logs = logs.annotate(log_day=log_date())
+        if start is not None:
+            logs = logs.filter(log_day__gte=start)
+        if end is not None:
+            logs = logs.filter(log_day__lte=end)
+
+    aggregates = _aggregates(metrics)
+    if group_by is None:
+        return {'totals': _format(logs.aggregate(**aggregates), metrics), 'buckets': []}
+
+    rows = list(
+        logs.annotate(bucket=_bucket_expression(group_by))
+        .values('bucket')
+        .annotate(**aggregates)
+        .order_by('bucket')
+    )
+    if group_by in OVERLAPPING_GROUPINGS:
+        totals = logs.aggregate(**aggregates)
+    else:
+        totals = {field: sum(row[field] for row in rows) for field in aggregates}
+    buckets = [
+        {'key': _bucket_key(group_by, row['bucket']), **_format(row, metrics)}
+        for row in rows
+    ]
+    return {'totals': _format(totals, metrics), 'buckets': buckets}
@@ -0,0 +1,166 @@
+"""
+Stale-while-revalidate caching for the Spotify proxies.
+
+Entries carry the time they go stale. A fresh entry is served as is. A
+stale one is served too, and the one worker that wins a ``cache.add`` lock
+on the key refreshes it in the background, so once a key has been filled
+nobody waits on Spotify again. If the refresh fails the stale entry keeps
+being served until it expires for good, ``ttl + stale`` seconds after it
+was stored.
+
+A cold miss is filled by the lock holder; other requests for the same key
+wait up to ``LOCK_WAIT`` seconds for it before fetching themselves.
+
+``stale_while_revalidate`` applies this to whole function views, using the
+policies in ``settings.SPOTIFY_PROXY_CACHE``.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'spotify_proxy'
+KEY_PREFIX = 'swr'
+# Seconds a refresh may hold a key's lock before another worker can take over
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+POLL_INTERVAL = 0.05
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='swr-refresh')
+_lock = threading.Lock()
+_counters = {'fresh': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _store(cache, key, value, ttl, stale):
+    cache.set(key, {'value': value, 'stale_at': time.time() + ttl}, ttl + stale)
+
+
+def _closing_connections(fn):
+    try:
+        fn()
+    finally:
+        # Pool threads outlive requests; don't leave their connections open
+        connections.close_all()
+
+
+def submit(fn):
+    """Run ``fn`` on the refresh pool."""
+    _executor.submit(_closing_connections, fn)
+
+
+def _refresh(cache, key, fetch, ttl, stale):
+    try:
+        _store(cache, key, fetch(), ttl, stale)
+        _count('refreshes')
+    except Exception as e:
+        _count('refresh_errors')
+        logger.warning("Refreshing %s failed, still serving the stale entry: %s", key, e)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def get(cache, key, fetch, ttl, stale):
+    """
+    ``(value, state)`` for ``key``, calling ``fetch()`` to fill or refresh it.
+    ``state`` is ``'fresh'``, ``'stale'`` or ``'miss'``. Exceptions from
+    ``fetch()`` only propagate on a miss, when there is nothing to serve.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() < entry['stale_at']:
+            _count('fresh')
+            return entry['value'], 'fresh'
+        _count('stale')
+        if cache.add(_lock_key(key), True, LOCK_TIMEOUT):
+            submit(lambda: _refresh(cache, key, fetch, ttl, stale))
+        return entry['value'], 'stale'
+
+    _count('misses')
+    if not cache.add(_lock_key(key), True, LOCK_TIMEOUT):
+        # Someone else is filling it; give them a moment
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value'], 'fresh'
+        value = fetch()
+        _store(cache, key, value, ttl, stale)
+        return value, 'miss'
+
+    try:
+        value = fetch()
+        _store(cache, key, value, ttl, stale)
+    finally:
+        cache.delete(_lock_key(key))
+    return value, 'miss'
+
+
+class Uncacheable(Exception):
+    """A view answered with something other than a 200; it is passed through uncached."""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def stale_while_revalidate(name, key):
+    """
+    Cache a function view's 200 responses under ``key(request, *args, **kwargs)``
+    with the ``settings.SPOTIFY_PROXY_CACHE[name]`` policy. Goes under
+    ``@api_view``, so the view is refreshed with the same DRF request.
+    Responses carry ``X-Cache: FRESH``, ``STALE`` or ``MISS``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            def fetch():
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    raise Uncacheable(response)
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                return {'data': response.data, 'headers': headers}
+
+            policy = settings.SPOTIFY_PROXY_CACHE[name]
+            cache_key = f'{KEY_PREFIX}:{name}:{key(request, *args, **kwargs)}'
+            try:
+                cached, state = get(caches[CACHE_ALIAS], cache_key, fetch, policy['ttl'], policy['stale'])
+            except Uncacheable as e:
+                return e.response
+
+            if 'ETag' in cached['headers']:
+                not_modified = get_conditional_response(request, etag=cached['headers']['ETag'])
+                if not_modified is not None:
+                    return not_modified
+            response = Response(cached['data'], headers=cached['headers'])
+            response['X-Cache'] = state.upper()
+            return response
+        return wrapper
+    return decorator
+
+
+def get_stats():
+    with _lock:
+        counters = dict(_counters)
+    total = counters['fresh'] + counters['stale'] + counters['misses']
+    counters['hit_ratio'] = round((counters['fresh'] + counters['stale']) / total, 3) if total else 0
+    return counters
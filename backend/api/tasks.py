@@ -0,0 +1,50 @@
+"""Background job handlers; see ``api.jobs``."""
+import logging
+
+from . import feeds
+from .artists import get_artists
+from .genres import get_genres
+from .jobs import task
+from .models import Album
+from .spotify_client import get_spotify
+
+logger = logging.getLogger(__name__)
+
+ALBUMS_BATCH_SIZE = 20
+
+
+@task('enrich_genres')
+def enrich_genres(spotify_ids, artist_ids=None):
+    """
+    Fill empty ``Album.genres`` for the given albums from their primary
+    artist. List entries show their album's genres.
+
+    ``artist_ids`` maps album ids to artist ids the caller already knows;
+    the rest are discovered with the batched ``albums`` endpoint.
+    """
+    artist_ids = dict(artist_ids or {})
+    spotify = get_spotify()
+
+    unknown = [spotify_id for spotify_id in spotify_ids if spotify_id not in artist_ids]
+    for start in range(0, len(unknown), ALBUMS_BATCH_SIZE):
+        batch = unknown[start:start + ALBUMS_BATCH_SIZE]
+        for album in spotify.albums(batch)['albums']:
+            if album and album['artists']:
+                artist_ids[album['id']] = album['artists'][0]['id']
+
+    artists_by_id = get_artists(artist_ids.values(), spotify=spotify)
+    for spotify_id, artist_id in artist_ids.items():
+        artist = artists_by_id.get(artist_id)
+        if artist is None or not artist.genres:
+            continue
+        genres = get_genres(artist.genres)
+        # genres.add() fires m2m_changed, which refreshes the search entry
+        for album in Album.objects.filter(spotify_id=spotify_id, genres__isnull=True):
+            album.genres.add(*genres)
+    logger.info("Enriched genres for %d albums", len(artist_ids))
+
+
+@task('reseed_feeds')
+def reseed_feeds(author_id):
+    """Copy an account's recent logs to all its followers; see ``api.feeds``."""
+    feeds.reseed(author_id)
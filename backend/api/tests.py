@@ -1,3 +1,1862 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import brotli
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Count, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import artists, catalog_search, compression, jobs, ranking, ratings, replicas, search_cache, spotify_client, swr, tracks, trending, urls, user_stats
+from .genres import get_genres, set_genres
+from .models import Album, Artist, CatalogEntry, FavoriteAlbum, FeedEntry, Job, List, ListAlbum, Log, Profile, Track, TrendingSnapshot, UserStats, UserTally
+from .renderers import ORJSONRenderer
+
+
+class StatsQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        albums = [
+            Album.objects.create(spotify_id='a1', name='Kind of Blue', artist='Miles Davis', release_date=date(1959, 8, 17)),
+            Album.objects.create(spotify_id='a2', name='OK Computer', artist='Radiohead', release_date=date(1997, 5, 21)),
+            Album.objects.create(spotify_id='a3', name='Kid A', artist='Radiohead', release_date=date(2000, 10, 2)),
+        ]
+        set_genres(albums[0], 'jazz,modal jazz')
+        set_genres(albums[1], 'alternative rock,art rock')
+        set_genres(albums[2], 'art rock')
+        Log.objects.create(user=self.user, album=albums[0], rating=5, listen_date=date(2024, 1, 10))
+        Log.objects.create(user=self.user, album=albums[1], rating=4, listen_date=date(2024, 1, 20), relisten=True)
+        Log.objects.create(user=self.user, album=albums[2], rating=3, listen_date=date(2024, 3, 5))
+        Log.objects.create(user=self.user, album=albums[1], rating=2, listen_date=date(2023, 12, 31))
+
+    def test_fixed_stats_reads_one_row(self):
+        # As loaded by authentication, without the stats row cached on it
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_albums'], 4)
+        self.assertEqual(response.data['average_rating'], 3.5)
+        self.assertEqual(response.data['total_relistens'], 1)
+        self.assertEqual(response.data['ratings_distribution'], {'5': 1, '4': 1, '3': 1, '2': 1, '1': 0})
+
+    def test_year_by_month_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stats/query/', {'year': 2024, 'group_by': 'month'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['count'], 3)
+        self.assertEqual(response.data['totals']['average_rating'], 4)
+        self.assertEqual(
+            [(bucket['key'], bucket['count']) for bucket in response.data['buckets']],
+            [('2024-01', 2), ('2024-03', 1)]
+        )
+
+    def test_date_range_by_decade(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stats/query/', {
+                'start': '2023-12-01',
+                'end': '2024-01-31',
+                'group_by': 'decade',
+                'metrics': 'count,relistens',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'count': 3, 'relistens': 1})
+        self.assertEqual(
+            [(bucket['key'], bucket['count']) for bucket in response.data['buckets']],
+            [(1950, 1), (1990, 2)]
+        )
+
+    def test_month_by_rating(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stats/query/', {'month': '2024-01', 'group_by': 'rating'})
+
+        self.assertEqual([bucket['key'] for bucket in response.data['buckets']], [4, 5])
+        self.assertEqual(response.data['totals']['ratings']['5'], 1)
+
+    def test_genre_buckets_overlap(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/stats/query/', {'year': 2024, 'group_by': 'genre', 'metrics': 'count'})
+
+        self.assertEqual(response.data['totals'], {'count': 3})
+        self.assertEqual(
+            [(bucket['key'], bucket['count']) for bucket in response.data['buckets']],
+            [('alternative rock', 1), ('art rock', 2), ('jazz', 1), ('modal jazz', 1)]
+        )
+
+    def test_top_genre_and_genre_filter(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['topGenre'], 'art rock')
+
+        response = self.client.get('/api/logs/', {'genre': 'art rock'})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'year': 2024, 'month': '2024-01'},
+            {'start': '2024-02-01', 'end': '2024-01-01'},
+            {'month': '2024-13'},
+            {'group_by': 'weekday'},
+            {'metrics': 'count,median'},
+        ):
+            with self.subTest(params=params):
+                with self.assertNumQueries(0):
+                    response = self.client.get('/api/stats/query/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fast', password='secret', email='fast@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        albums = [
+            Album.objects.create(spotify_id='b1', name='Björk\u2028Homogenic', artist='Björk', release_date=date(1997, 9, 22)),
+            Album.objects.create(spotify_id='b2', name=None, artist=None, image_url='https://img/2'),
+        ]
+        set_genres(albums[0], 'art pop,electronica')
+        Log.objects.create(user=self.user, album=albums[0], rating=5, review='“Jóga”', listen_date=date(2024, 2, 1))
+        Log.objects.create(user=self.user, album=albums[0], rating=2, relisten=True)
+        Log.objects.create(user=self.user, album=albums[1], rating=4, favorite_song='Bachelorette')
+        FavoriteAlbum.objects.create(user=self.user, album=albums[0])
+        FavoriteAlbum.objects.create(user=self.user, album=albums[1])
+
+        for title in ('Empty', 'Nineties'):
+            List.objects.create(user=self.user, title=title)
+        nineties = List.objects.get(title='Nineties')
+        albums.append(Album.objects.create(spotify_id='b3', name='b3', artist='Various'))
+        set_genres(albums[2], ['trip hop'])
+        for rank, album in enumerate(albums):
+            ListAlbum.objects.create(list=nineties, album=album, rank=rank)
+        self.list_id = nineties.id
+
+    def test_output_matches_the_model_serializers(self):
+        for url in ('/api/logs/', '/api/favorites/', '/api/lists/', f'/api/lists/{self.list_id}/', '/api/lists/0/'):
+            with self.subTest(url=url):
+                # The model serializers through DRF's own renderer
+                with override_settings(FAST_READ_SERIALIZERS=False), \
+                        mock.patch.object(ORJSONRenderer, 'render', JSONRenderer.render):
+                    expected = self.client.get(url)
+                with override_settings(FAST_READ_SERIALIZERS=True):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='secret')
+        self.fan = User.objects.create_user(username='fan', password='secret')
+        self.album = Album.objects.create(spotify_id='c1', name='Loveless', artist='My Bloody Valentine')
+        set_genres(self.album, 'shoegaze')
+        FavoriteAlbum.objects.create(user=self.user, album=self.album)
+        Log.objects.create(user=self.user, album=self.album, rating=5)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+
+    def get_profile(self):
+        response = self.client.get('/api/user/profile/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cold_profile_is_three_queries_and_warm_is_free(self):
+        with self.assertNumQueries(3):
+            cold = self.get_profile()
+        with self.assertNumQueries(0):
+            warm = self.get_profile()
+
+        self.assertEqual(warm, cold)
+        self.assertEqual(cold['total_logs'], 1)
+        self.assertEqual(cold['topGenre'], 'shoegaze')
+        self.assertEqual(cold['favorite_albums'][0]['album']['genres'], 'shoegaze')
+
+    def test_changes_invalidate_the_payload(self):
+        self.get_profile()
+        Log.objects.create(user=self.fan, album=self.album, rating=3)
+        self.assertEqual(self.get_profile()['favorite_albums'][0]['album']['average_rating'], '4.00')
+
+        self.user.profile.followers.add(self.fan)
+        self.assertEqual(self.get_profile()['followers_count'], 1)
+        self.fan.following.clear()
+        self.assertEqual(self.get_profile()['followers_count'], 0)
+
+        FavoriteAlbum.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get_profile()['favorite_albums'], [])
+
+        Log.objects.filter(user=self.user).get().delete()
+        self.assertEqual(self.get_profile()['total_logs'], 0)
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='secret')
+        self.friend = User.objects.create_user(username='friend', password='secret')
+        self.star = User.objects.create_user(username='star', password='secret')
+        self.albums = [Album.objects.create(spotify_id=f'f{i}', name=f'Album {i}') for i in range(6)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def follow(self, user):
+        response = self.client.post(f'/api/users/{user.username}/follow/')
+        self.assertEqual(response.status_code, 200)
+
+    def read_feed(self, **params):
+        response = self.client.get('/api/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_follow_backfills_and_new_logs_fan_out(self):
+        Log.objects.create(user=self.friend, album=self.albums[0], rating=4)
+        self.follow(self.friend)
+        Log.objects.create(user=self.friend, album=self.albums[1], rating=5)
+
+        with self.assertNumQueries(3):
+            feed = self.read_feed()
+        self.assertEqual([item['album']['name'] for item in feed['results']], ['Album 1', 'Album 0'])
+        self.assertEqual(feed['results'][0]['user'], {'username': 'friend'})
+
+        self.client.delete(f'/api/users/{self.friend.username}/follow/')
+        self.assertEqual(self.read_feed()['results'], [])
+
+    def test_high_follower_accounts_are_merged_on_read(self):
+        self.follow(self.friend)
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            self.follow(self.star)
+        for i, user in enumerate([self.friend, self.star, self.friend, self.star]):
+            Log.objects.create(user=user, album=self.albums[i], rating=3)
+        self.assertFalse(FeedEntry.objects.filter(author=self.star).exists())
+
+        first = self.read_feed(page_size=3)
+        second = self.client.get(first['next']).data
+        self.assertEqual(
+            [item['album']['name'] for item in first['results'] + second['results']],
+            ['Album 3', 'Album 2', 'Album 1', 'Album 0']
+        )
+        self.assertIsNone(second['next'])
+
+    def test_follow_backfill_never_overfills_the_inbox(self):
+        for album in self.albums:
+            Log.objects.create(user=self.friend, album=album, rating=3)
+
+        with self.settings(FEED_BACKFILL=100, FEED_INBOX_SIZE=4):
+            self.follow(self.friend)
+        self.assertEqual(FeedEntry.objects.filter(owner=self.reader).count(), 4)
+
+    def test_dropping_back_to_fanout_on_write_reseeds_in_a_job(self):
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            self.follow(self.star)
+        for album in self.albums[:3]:
+            Log.objects.create(user=self.star, album=album, rating=3)
+
+        # Unfollowed by a fan, the star is under the limit again
+        fan = APIClient()
+        fan.force_authenticate(self.friend)
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            fan.post(f'/api/users/{self.star.username}/follow/')
+        with self.settings(FEED_FANOUT_LIMIT=1):
+            fan.delete(f'/api/users/{self.star.username}/follow/')
+        self.assertFalse(Profile.objects.get(user=self.star).fanout_on_read)
+        self.assertFalse(FeedEntry.objects.filter(owner=self.reader).exists())
+
+        job = jobs.claim('test')[0]
+        self.assertEqual((job.name, job.payload), ('reseed_feeds', {'author_id': self.star.id}))
+        self.assertEqual(jobs.run(job, 'test'), Job.DONE)
+        self.assertEqual(len(self.read_feed()['results']), 3)
+
+    def test_trim_caps_inboxes(self):
+        self.follow(self.friend)
+        for album in self.albums:
+            Log.objects.create(user=self.friend, album=album, rating=3)
+
+        call_command('trim_feeds', max_entries=2, stdout=StringIO())
+        feed = self.read_feed()
+        self.assertEqual([item['album']['name'] for item in feed['results']], ['Album 5', 'Album 4'])
+
+
+class ListRankingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ranker', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.list = List.objects.create(user=self.user, title='Top 50')
+        for i in range(50):
+            self.client.post(f'/api/lists/{self.list.id}/albums/', {
+                'spotify_id': f'r{i}', 'name': f'r{i}', 'artist': 'Various', 'external_url': 'https://open.spotify.com',
+            })
+        self.ids = list(ListAlbum.objects.filter(list=self.list).order_by('rank').values_list('id', flat=True))
+
+    def order(self):
+        return list(ListAlbum.objects.filter(list=self.list).values_list('id', flat=True))
+
+    def move(self, album_id, **neighbours):
+        response = self.client.post(f'/api/lists/{self.list.id}/albums/{album_id}/move/', neighbours, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_move_writes_one_row(self):
+        # Plus the list's updated_at
+        with self.assertNumQueries(7):
+            self.move(self.ids[-1], after_id=self.ids[0])
+        expected = [self.ids[0], self.ids[-1], *self.ids[1:-1]]
+        self.assertEqual(self.order(), expected)
+
+        self.move(self.ids[5], before_id=self.ids[0])
+        self.assertEqual(self.order()[:2], [self.ids[5], self.ids[0]])
+
+    def test_inverted_neighbours_are_rejected(self):
+        response = self.client.post(
+            f'/api/lists/{self.list.id}/albums/{self.ids[0]}/move/',
+            {'after_id': self.ids[3], 'before_id': self.ids[1]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ranking.RankError):
+            ranking.move(self.list.id, self.ids[0], after_id=self.ids[3], before_id=self.ids[1])
+        self.assertEqual(self.order(), self.ids)
+        self.assertFalse(ListAlbum.objects.filter(list=self.list, rank__isnull=True).exists())
+
+    def test_exhausted_gap_renormalizes(self):
+        for _ in range(12):
+            self.move(self.ids[-1], after_id=self.ids[0], before_id=self.order()[1])
+            self.move(self.ids[-2], after_id=self.ids[0], before_id=self.order()[1])
+        order = self.order()
+        self.assertEqual(order[:3], [self.ids[0], self.ids[-2], self.ids[-1]])
+        self.assertEqual(len(set(ListAlbum.objects.filter(list=self.list).values_list('rank', flat=True))), 50)
+
+    def test_bulk_reorder_is_constant_queries(self):
+        new_order = list(reversed(self.ids))
+        with self.assertNumQueries(6):
+            response = self.client.put(
+                f'/api/lists/{self.list.id}/update_ranks/',
+                [{'id': album_id, 'rank': position} for position, album_id in enumerate(new_order, start=1)],
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), new_order)
+
+        response = self.client.put(f'/api/lists/{self.list.id}/update_ranks/', [{'id': self.ids[0], 'rank': 1}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 catalog index')
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        self.backend = catalog_search.SQLiteFTSBackend()
+
+    def found(self, query):
+        return [entry['spotify_id'] for entry in self.backend.search(query, 10)]
+
+    def test_matches_are_ranked_name_then_artist_then_genre(self):
+        by_genre = Album.objects.create(spotify_id='genre', name='Kind of Green', artist='Miles')
+        set_genres(by_genre, 'blues')
+        Album.objects.create(spotify_id='artist', name='Moanin', artist='Blues Messengers')
+        Album.objects.create(spotify_id='name', name='Blues Walk', artist='Lou Donaldson')
+        Album.objects.create(spotify_id='other', name='Giant Steps', artist='Coltrane')
+
+        self.assertEqual(self.found('blues'), ['name', 'artist', 'genre'])
+        # The last term is a prefix, for search-as-you-type
+        self.assertEqual(self.found('BLU'), ['name', 'artist', 'genre'])
+        self.assertEqual(self.found('blues walk'), ['name'])
+        self.assertEqual(self.found('!!'), [])
+
+    def test_index_follows_album_changes_through_the_triggers(self):
+        album = Album.objects.create(spotify_id='renamed', name='Working Title', artist='Someone')
+        self.assertEqual(self.found('working'), ['renamed'])
+
+        album.name = 'Final Cut'
+        album.save()
+        self.assertEqual(self.found('working'), [])
+        self.assertEqual(self.found('final'), ['renamed'])
+
+        set_genres(album, 'art rock')
+        self.assertEqual(self.found('art rock'), ['renamed'])
+
+        album.delete()
+        self.assertEqual(self.found('final'), [])
+        self.assertFalse(CatalogEntry.objects.filter(spotify_id='renamed').exists())
+
+    def test_bulk_created_albums_are_indexed_by_sync_many(self):
+        Album.objects.bulk_create(Album(spotify_id=f'bulk{i}', name=f'Bulk Album {i}') for i in range(3))
+        self.assertEqual(self.found('bulk'), [])
+
+        catalog_search.sync_many(['bulk0', 'bulk1', 'bulk2'])
+        self.assertEqual(sorted(self.found('bulk')), ['bulk0', 'bulk1', 'bulk2'])
+        # Upserting again leaves one index row per entry
+        catalog_search.sync_many(['bulk0'])
+        self.assertEqual(len(self.found('bulk')), 3)
+
+    def test_rebuild_reloads_the_catalog(self):
+        Album.objects.create(spotify_id='kept', name='Spiderland', artist='Slint')
+        CatalogEntry.objects.create(spotify_id='orphan', name='Spiderland Demos')
+
+        self.assertEqual(catalog_search.rebuild(), 1)
+        self.assertEqual(self.found('spiderland'), ['kept'])
+
+
+class FakeTokenSession:
+    """Stands in for the requests session on the token endpoint."""
+
+    def __init__(self, status_code=200, expires_in=3600):
+        self.status_code = status_code
+        self.expires_in = expires_in
+        self.posts = 0
+
+    def post(self, url, data=None, auth=None, timeout=None):
+        self.posts += 1
+        payload = {'access_token': f'token-{self.posts}', 'expires_in': self.expires_in}
+        return SimpleNamespace(status_code=self.status_code, json=lambda: payload)
+
+
+class SpotifyClientTests(TestCase):
+    def test_token_is_fetched_once_then_reused(self):
+        session = FakeTokenSession()
+        credentials = spotify_client.CachedClientCredentials('id', 'secret', session)
+
+        tokens = {credentials.get_access_token() for _ in range(5)}
+        self.assertEqual(tokens, {'token-1'})
+        self.assertEqual(session.posts, 1)
+        self.assertEqual(credentials.stats()['token_fetches'], 1)
+        self.assertEqual(credentials.stats()['token_reuses'], 4)
+
+    def test_token_is_refreshed_shortly_before_it_expires(self):
+        session = FakeTokenSession(expires_in=120)
+        credentials = spotify_client.CachedClientCredentials('id', 'secret', session, margin=60)
+        now = time.time()
+        with mock.patch('api.spotify_client.time.time', return_value=now):
+            self.assertEqual(credentials.get_access_token(), 'token-1')
+        with mock.patch('api.spotify_client.time.time', return_value=now + 59):
+            self.assertEqual(credentials.get_access_token(), 'token-1')
+        with mock.patch('api.spotify_client.time.time', return_value=now + 61):
+            self.assertEqual(credentials.get_access_token(), 'token-2')
+
+        credentials.invalidate()
+        self.assertEqual(credentials.get_access_token(), 'token-3')
+
+    def test_failed_token_requests_raise(self):
+        credentials = spotify_client.CachedClientCredentials('id', 'secret', FakeTokenSession(status_code=401))
+        with self.assertRaises(spotify_client.SpotifyTokenError):
+            credentials.get_access_token()
+
+    def test_client_and_session_are_shared(self):
+        spotify_client.reset()
+        self.addCleanup(spotify_client.reset)
+
+        client = spotify_client.get_spotify()
+        self.assertIs(spotify_client.get_spotify(), client)
+        self.assertIs(client._session, spotify_client.get_session())
+        self.assertIs(client.auth_manager, spotify_client.get_auth_manager())
+
+
+class FakeSpotify:
+    """Answers the batched albums/artists endpoints and records the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def albums(self, ids):
+        self.calls.append(('albums', list(ids)))
+        return {'albums': [
+            None if spotify_id == 'missing' else {
+                'id': spotify_id,
+                'name': f'Album {spotify_id}',
+                'artists': [{'id': f'artist-{spotify_id}', 'name': 'Someone'}],
+                'images': [{'url': f'https://img/{spotify_id}'}],
+                'release_date': '1994',
+                'external_urls': {'spotify': f'https://open.spotify.com/album/{spotify_id}'},
+            }
+            for spotify_id in ids
+        ]}
+
+    def artists(self, ids):
+        self.calls.append(('artists', list(ids)))
+        return {'artists': [{'id': artist_id, 'name': 'Someone', 'genres': ['trip hop', 'electronica']} for artist_id in ids]}
+
+
+class ArtistCacheTests(TestCase):
+    def test_misses_are_fetched_in_batches_of_50(self):
+        spotify = FakeSpotify()
+        ids = [f'artist{i}' for i in range(120)]
+
+        found = artists.get_artists(ids + ['artist0', None], spotify=spotify)
+        self.assertEqual(len(found), 120)
+        self.assertEqual([len(batch) for name, batch in spotify.calls], [50, 50, 20])
+        self.assertEqual(Artist.objects.count(), 120)
+        self.assertEqual(found['artist7'].genres, ['trip hop', 'electronica'])
+
+    def test_fresh_rows_are_served_without_spotify(self):
+        artists.get_artists(['a1', 'a2'], spotify=FakeSpotify())
+        spotify = FakeSpotify()
+
+        with self.assertNumQueries(1):
+            found = artists.get_artists(['a1', 'a2'], spotify=spotify)
+        self.assertEqual(set(found), {'a1', 'a2'})
+        self.assertEqual(spotify.calls, [])
+        self.assertEqual(artists.find_cached(artist_id='a1').spotify_id, 'a1')
+
+    def test_only_stale_rows_are_refetched(self):
+        artists.get_artists(['fresh', 'stale'], spotify=FakeSpotify())
+        Artist.objects.filter(spotify_id='stale').update(
+            fetched_at=timezone.now() - timedelta(seconds=settings.ARTIST_CACHE_MAX_AGE + 1)
+        )
+        spotify = FakeSpotify()
+
+        artists.get_artists(['fresh', 'stale', 'new'], spotify=spotify)
+        self.assertEqual(spotify.calls, [('artists', ['stale', 'new'])])
+
+    def test_stale_rows_are_served_when_spotify_fails(self):
+        artists.get_artists(['a1'], spotify=FakeSpotify())
+        Artist.objects.update(fetched_at=timezone.now() - timedelta(seconds=settings.ARTIST_CACHE_MAX_AGE + 1))
+        spotify = mock.Mock()
+        spotify.artists.side_effect = RuntimeError('Spotify is down')
+
+        with self.assertLogs('api.artists', 'WARNING'):
+            found = artists.get_artists(['a1'], spotify=spotify)
+        self.assertEqual(found['a1'].genres, ['trip hop', 'electronica'])
+        self.assertIsNone(artists.find_cached(artist_id='a1'))
+
+
+class BulkAddAlbumsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='builder', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.list = List.objects.create(user=self.user, title='Top of the decade')
+        ListAlbum.objects.create(list=self.list, album=Album.objects.create(spotify_id='already'), rank=1024)
+        Album.objects.create(spotify_id='known', name='Known', artist='Local')
+        self.spotify = FakeSpotify()
+
+    def test_adds_in_order_with_batched_lookups(self):
+        spotify_ids = ['known', 'already', *[f'new{i}' for i in range(25)], 'missing', 'new0']
+        with mock.patch('api.list_albums.get_spotify', return_value=self.spotify), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/lists/{self.list.id}/add_albums/', {'spotify_ids': spotify_ids}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['skipped'], ['already'])
+        self.assertEqual(response.data['not_found'], ['missing'])
+        self.assertEqual([call[0] for call in self.spotify.calls], ['albums', 'albums', 'artists'])
+        self.assertEqual([len(call[1]) for call in self.spotify.calls], [20, 6, 25])
+
+        order = list(ListAlbum.objects.filter(list=self.list).values_list('album__spotify_id', flat=True))
+        self.assertEqual(order, ['already', 'known', *[f'new{i}' for i in range(25)]])
+        self.assertEqual(response.data['added'][1]['genres'], 'electronica,trip hop')
+        self.assertEqual(response.data['added'][1]['external_url'], 'https://open.spotify.com/album/new0')
+        self.assertEqual(CatalogEntry.objects.get(spotify_id='new3').genres, 'electronica,trip hop')
+
+
+class ListSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='curator', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.lists = []
+        for title in ('Short', 'Long', 'Empty'):
+            list_obj = List.objects.create(user=self.user, title=title)
+            count = {'Short': 2, 'Long': 7, 'Empty': 0}[title]
+            ListAlbum.objects.bulk_create(
+                ListAlbum(list=list_obj, rank=(count - i) * 1024, album=Album.objects.create(
+                    spotify_id=f'{title}{i}', name=f'{title}{i}', artist='Various',
+                    image_url='' if i == 1 else f'https://img/{title}{i}',
+                ))
+                for i in range(count)
+            )
+            self.lists.append(list_obj)
+
+    def test_overview_has_counts_and_covers_in_constant_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/lists/')
+        summaries = {summary['title']: summary for summary in response.json()}
+        self.assertNotIn('albums', summaries['Long'])
+        self.assertEqual(summaries['Long']['album_count'], 7)
+        self.assertEqual(summaries['Long']['covers'], [f'https://img/Long{i}' for i in (6, 5, 4, 3)])
+        self.assertEqual(summaries['Short']['covers'], ['https://img/Short0'])
+        self.assertEqual(summaries['Empty']['covers'], [])
+
+    def test_detail_pages_through_albums(self):
+        url = f'/api/lists/{self.lists[1].id}/?page_size=3'
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertEqual(data['album_count'], 7)
+            names += [album['name'] for album in data['albums']]
+            url = data['next']
+        self.assertEqual(names, [f'Long{i}' for i in range(6, -1, -1)])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rater', password='secret')
+        self.album = Album.objects.create(spotify_id='agg1', name='Blue Train', artist='John Coltrane')
+        self.other = Album.objects.create(spotify_id='agg2', name='Giant Steps', artist='John Coltrane')
+
+    def aggregates(self, album):
+        album.refresh_from_db()
+        return {field: getattr(album, field) for field in ratings.AGGREGATE_FIELDS}
+
+    def expected(self, album):
+        computed = ratings.compute(Log.objects.filter(album=album)).get(album.id, {})
+        return {field: computed.get(field) or 0 for field in ratings.AGGREGATE_FIELDS}
+
+    def test_create_update_and_delete_apply_deltas(self):
+        first = Log.objects.create(user=self.user, album=self.album, rating=4)
+        Log.objects.create(user=self.user, album=self.album, rating=2)
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+        self.assertEqual(self.aggregates(self.album)['total_logs'], 2)
+
+        first.rating = 5
+        first.save()
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+        self.assertEqual(self.aggregates(self.album)['rating_4_count'], 0)
+
+        first.album = self.other
+        first.save()
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+        self.assertEqual(self.aggregates(self.other), self.expected(self.other))
+
+        first.delete()
+        self.assertEqual(self.aggregates(self.other), {field: 0 for field in ratings.AGGREGATE_FIELDS})
+
+    def test_rating_edit_through_the_api_updates_the_album_once(self):
+        log = Log.objects.create(user=self.user, album=self.album, rating=4)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.put(f'/api/logs/{log.id}/', {'album_id': self.album.id, 'rating': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        album_updates = [query for query in captured if query['sql'].startswith('UPDATE "api_album"')]
+        self.assertEqual(len(album_updates), 1)
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+
+    def test_cascaded_deletes_apply_deltas(self):
+        Log.objects.create(user=self.user, album=self.album, rating=3)
+        Log.objects.create(user=User.objects.create_user(username='other'), album=self.album, rating=5)
+
+        self.user.delete()
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+        self.assertEqual(self.aggregates(self.album)['rating_sum'], 5)
+
+    def test_drifted_counters_stop_at_zero(self):
+        log = Log.objects.create(user=self.user, album=self.album, rating=3)
+        Album.objects.filter(id=self.album.id).update(total_logs=0, rating_sum=1, rating_3_count=0)
+
+        log.rating = 1
+        log.save()
+        self.assertEqual(self.aggregates(self.album)['rating_sum'], 0)
+        log.delete()
+        self.assertEqual(self.aggregates(self.album), {field: 0 for field in ratings.AGGREGATE_FIELDS})
+
+    def test_reconcile_repairs_drift(self):
+        Log.objects.create(user=self.user, album=self.album, rating=4)
+        Log.objects.create(user=self.user, album=self.other, rating=2)
+        Album.objects.filter(id=self.album.id).update(total_logs=7, rating_sum=0, rating_4_count=0)
+
+        out = StringIO()
+        call_command('reconcile_album_ratings', chunk_size=1, stdout=out)
+        self.assertIn('Repaired 1 albums', out.getvalue())
+        self.assertEqual(self.aggregates(self.album), self.expected(self.album))
+        self.assertEqual(ratings.reconcile(), 0)
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tallied', password='secret')
+        self.album = Album.objects.create(spotify_id='tally1', name='Blue Train', artist='John Coltrane')
+        self.other = Album.objects.create(spotify_id='tally2', name='Mingus Ah Um', artist='Charles Mingus')
+        set_genres(self.other, 'jazz')
+        self.logs = [
+            Log.objects.create(user=self.user, album=self.album, rating=4),
+            Log.objects.create(user=self.user, album=self.album, rating=5),
+            Log.objects.create(user=self.user, album=self.other, rating=3),
+        ]
+
+    def stored(self):
+        stats = UserStats.objects.get(user=self.user)
+        tallies = {
+            (kind, value): count
+            for kind, value, count in UserTally.objects.filter(user=self.user, count__gt=0).values_list('kind', 'value', 'count')
+        }
+        return stats.total_logs, stats.rating_sum, stats.top_artist, stats.top_genre, tallies
+
+    def assertMatchesRebuild(self):
+        stored = self.stored()
+        user_stats.rebuild(self.user)
+        self.assertEqual(stored, self.stored())
+
+    def test_log_writes_match_a_rebuild(self):
+        self.assertEqual(self.stored()[:3], (3, 12, 'John Coltrane'))
+        self.logs[0].album = self.other
+        self.logs[0].save()
+        self.assertMatchesRebuild()
+        self.logs[1].delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.stored()[2], 'Charles Mingus')
+
+    def test_rating_only_edit_leaves_tallies_alone(self):
+        before = self.stored()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.put(f'/api/logs/{self.logs[0].id}/', {'album_id': self.album.id, 'rating': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in captured if 'api_usertally' in query['sql']])
+        stored = self.stored()
+        self.assertEqual((stored[1], stored[2:]), (before[1] - 2, before[2:]))
+        self.assertMatchesRebuild()
+
+    def test_drifted_counters_stop_at_zero(self):
+        UserStats.objects.filter(user=self.user).update(total_logs=0, rating_sum=1, rating_4_count=0, logs_this_year=0)
+
+        self.logs[0].delete()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.total_logs, stats.rating_sum, stats.rating_4_count, stats.logs_this_year), (0, 0, 0, 0)
+        )
+
+    def test_genre_changes_move_tallies(self):
+        set_genres(self.album, 'hard bop,jazz')
+        self.assertEqual(self.stored()[3], 'jazz')
+        self.assertMatchesRebuild()
+
+        set_genres(self.album, 'hard bop')
+        self.assertEqual(self.stored()[3], 'hard bop')
+        self.assertMatchesRebuild()
+
+        self.album.genres.clear()
+        self.assertEqual(self.stored()[3], 'jazz')
+        self.assertMatchesRebuild()
+
+        # From the genre's side, as the enrichment job's bulk paths could
+        get_genres(['modal'])[0].albums.add(self.album, self.other)
+        self.assertEqual(self.stored()[3], 'modal')
+        self.assertMatchesRebuild()
+
+    def test_artist_change_moves_tallies(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/albums/create/', {
+            'spotify_id': self.other.spotify_id, 'name': 'Mingus Ah Um', 'artist': 'The Charles Mingus Jazz Workshop',
+            'release_date': '1959', 'genres': 'jazz',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.stored()[4][(UserTally.ARTIST, 'The Charles Mingus Jazz Workshop')], 1)
+        self.assertNotIn((UserTally.ARTIST, 'Charles Mingus'), self.stored()[4])
+        self.assertMatchesRebuild()
+
+        Log.objects.create(user=self.user, album=self.other, rating=2)
+        Log.objects.create(user=self.user, album=self.other, rating=2)
+        self.assertEqual(self.stored()[2], 'The Charles Mingus Jazz Workshop')
+        self.assertMatchesRebuild()
+
+    def test_reads_roll_windows_without_writing(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        UserStats.objects.filter(user=self.user).update(windows_date=yesterday, logs_last_30_days=0)
+
+        stats = user_stats.get_stats(User.objects.get(pk=self.user.pk))
+        self.assertEqual((stats.logs_last_30_days, stats.windows_date), (3, timezone.localdate()))
+        self.assertEqual(UserStats.objects.get(user=self.user).windows_date, yesterday)
+
+        # The next write stores them
+        self.logs[2].delete()
+        stored = UserStats.objects.get(user=self.user)
+        self.assertEqual((stored.logs_last_30_days, stored.windows_date), (2, timezone.localdate()))
+
+    def test_missing_row_is_computed_not_stored(self):
+        UserStats.objects.filter(user=self.user).delete()
+
+        stats = user_stats.get_stats(User.objects.get(pk=self.user.pk))
+        self.assertEqual((stats.total_logs, stats.top_artist, stats.top_genre), (3, 'John Coltrane', 'jazz'))
+        self.assertFalse(UserStats.objects.filter(user=self.user).exists())
+
+
+ran_jobs = []
+
+
+@jobs.task('test-record')
+def record_job(value):
+    ran_jobs.append(value)
+
+
+@jobs.task('test-fail')
+def failing_job():
+    raise RuntimeError('Spotify is down')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        ran_jobs.clear()
+
+    def expire(self, job):
+        Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_a_job_is_leased_to_one_worker(self):
+        job = jobs.enqueue('test-record', value=1)
+
+        self.assertEqual(jobs.claim('a'), [job])
+        self.assertEqual(jobs.claim('b'), [])
+        self.assertEqual(jobs.run(Job.objects.get(id=job.id), 'a'), Job.DONE)
+        self.assertEqual(ran_jobs, [1])
+
+    def test_expired_leases_are_reclaimed(self):
+        job = jobs.enqueue('test-record', value=2)
+        stale = jobs.claim('a', lease=60)[0]
+        self.expire(job)
+
+        fresh = jobs.claim('b')[0]
+        self.assertEqual((fresh.locked_by, fresh.attempts), ('b', 2))
+        # The first worker's late result doesn't touch b's lease
+        jobs.run(stale, 'a')
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.RUNNING)
+        self.assertEqual(jobs.run(fresh, 'b'), Job.DONE)
+
+    def test_failures_back_off_then_die(self):
+        job = jobs.enqueue('test-fail', max_attempts=2)
+
+        self.assertEqual(jobs.run(jobs.claim('a')[0], 'a'), Job.PENDING)
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('Spotify is down', job.last_error)
+        self.assertEqual(jobs.claim('a'), [])
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        self.assertEqual(jobs.run(jobs.claim('a')[0], 'a'), Job.DEAD)
+        self.assertEqual(jobs.requeue_dead(id=job.id), 1)
+        self.assertEqual(Job.objects.get(id=job.id).attempts, 0)
+
+    def test_crashing_jobs_are_dead_lettered(self):
+        job = jobs.enqueue('test-record', max_attempts=2, value=3)
+        for _ in range(2):
+            jobs.claim('a')
+            # The worker died without recording anything
+            self.expire(job)
+
+        self.assertEqual(jobs.claim('b'), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        self.assertEqual(ran_jobs, [])
+
+    def test_backoff_grows_and_is_capped(self):
+        with override_settings(JOB_BACKOFF_BASE=10, JOB_BACKOFF_MAX=60):
+            self.assertTrue(5 <= jobs.backoff(1) <= 10)
+            self.assertTrue(20 <= jobs.backoff(3) <= 40)
+            self.assertTrue(30 <= jobs.backoff(10) <= 60)
+
+
+class RunWorkersTests(TransactionTestCase):
+    def test_each_thread_claims_under_its_own_id(self):
+        ran_jobs.clear()
+        for value in range(6):
+            jobs.enqueue('test-record', value=value)
+
+        # The in-memory test database's shared-cache table locks don't wait
+        # out busy_timeout, so the threads take turns at it
+        turn = threading.Lock()
+
+        def serialized(fn):
+            def wrapper(*args, **kwargs):
+                with turn:
+                    return fn(*args, **kwargs)
+            return wrapper
+
+        with mock.patch('api.jobs.claim', serialized(jobs.claim)), mock.patch('api.jobs.run', serialized(jobs.run)):
+            call_command('run_workers', once=True, concurrency=3, stdout=StringIO())
+
+        self.assertEqual(sorted(ran_jobs), list(range(6)))
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        for worker_id in Job.objects.values_list('locked_by', flat=True):
+            self.assertRegex(worker_id, r':\d+:[0-2]$')
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.spotify = LocalSpotify()
+
+    def versions(self, country):
+        return list(TrendingSnapshot.objects.filter(country=country).order_by('version').values_list('version', flat=True))
+
+    def test_pruning_only_touches_the_refreshed_markets(self):
+        trending.refresh(markets=['US', 'GB'], limit=3, keep=2, spotify=self.spotify)
+        for _ in range(3):
+            trending.refresh(markets=['US'], limit=3, keep=2, spotify=self.spotify)
+
+        self.assertEqual(self.versions('US'), [3, 4])
+        self.assertEqual(self.versions('GB'), [1])
+        # GB still has its own albums rather than the US fallback
+        self.assertEqual(trending.get_trending('GB', 1)[0]['spotify_id'], 'new-GB-0')
+
+    def test_keep_zero_keeps_every_snapshot(self):
+        for _ in range(4):
+            trending.refresh(markets=['US'], limit=2, keep=0, spotify=self.spotify)
+        self.assertEqual(self.versions('US'), [1, 2, 3, 4])
+
+        with override_settings(TRENDING_SNAPSHOTS_KEPT=1):
+            trending.refresh(markets=['US'], limit=2, spotify=self.spotify)
+        self.assertEqual(self.versions('US'), [5])
+
+    def test_snapshots_are_enriched_in_batches(self):
+        trending.refresh(markets=['US'], limit=25, keep=1, spotify=self.spotify)
+
+        albums = trending.get_trending('US', 50)
+        self.assertEqual(len(albums), 25)
+        self.assertEqual(albums[0]['genres'], ['trip hop', 'electronica'])
+        # The first call is LocalSpotify building the new releases themselves
+        self.assertEqual([len(ids) for name, ids in self.spotify.calls if name == 'albums'][1:], [20, 5])
+        # Unknown markets fall back to the default one
+        self.assertEqual(trending.get_trending('ZZ', 1), albums[:1])
+
+
+class PagedSpotify(FakeSpotify):
+    """An album whose tracklist spans several pages, across two discs."""
+
+    PAGE_SIZE = 50
+    TRACKS_PER_DISC = 60
+
+    def __init__(self):
+        super().__init__()
+        self.items = [
+            {'id': f'track-{disc}-{number}', 'name': f'Disc {disc} track {number}', 'track_number': number,
+             'disc_number': disc, 'duration_ms': 1000 * number, 'explicit': number == 7, 'preview_url': None,
+             'artists': [{'id': 'artist-1', 'name': 'Someone', 'href': 'ignored'}]}
+            for disc in (1, 2) for number in range(1, self.TRACKS_PER_DISC + 1)
+        ]
+
+    def page(self, offset):
+        end = offset + self.PAGE_SIZE
+        return {'items': self.items[offset:end], 'offset': offset, 'next': end if end < len(self.items) else None}
+
+    def album(self, spotify_id):
+        self.calls.append(('album', spotify_id))
+        album = self.albums([spotify_id])['albums'][0]
+        album['tracks'] = self.page(0)
+        return album
+
+    def next(self, page):
+        self.calls.append(('next', page['next']))
+        return self.page(page['next'])
+
+
+class TracklistTests(TestCase):
+    def setUp(self):
+        self.spotify = PagedSpotify()
+
+    def test_every_page_is_stored(self):
+        stored_at, album_tracks = tracks.get_tracks('boxset', spotify=self.spotify)
+
+        self.assertIsNotNone(stored_at)
+        self.assertEqual(len(album_tracks), 120)
+        self.assertEqual([call[0] for call in self.spotify.calls], ['album', 'albums', 'next', 'next'])
+        self.assertEqual(
+            [(track['disc_number'], track['track_number']) for track in album_tracks[58:62]],
+            [(1, 59), (1, 60), (2, 1), (2, 2)],
+        )
+        # The keys LogAlbum.jsx reads, plus the rest of Spotify's shape
+        self.assertEqual(album_tracks[6], {
+            'id': 'track-1-7', 'name': 'Disc 1 track 7', 'track_number': 7, 'disc_number': 1,
+            'duration_ms': 7000, 'explicit': True, 'preview_url': None,
+            'artists': [{'id': 'artist-1', 'name': 'Someone'}],
+        })
+        self.assertEqual(Album.objects.get(spotify_id='boxset').name, 'Album boxset')
+
+    def test_stored_tracklists_are_served_from_the_database(self):
+        tracks.get_tracks('boxset', spotify=self.spotify)
+        spotify = PagedSpotify()
+
+        with self.assertNumQueries(2):
+            _, album_tracks = tracks.get_tracks('boxset', spotify=spotify)
+        self.assertEqual(len(album_tracks), 120)
+        self.assertEqual(spotify.calls, [])
+
+    def test_view_revalidates_with_the_stored_etag(self):
+        spotify_client.reset()
+        spotify_client._client = self.spotify
+        self.addCleanup(spotify_client.reset)
+        cache.clear()
+        caches[swr.CACHE_ALIAS].clear()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='tracklister', password='secret'))
+
+        first = client.get('/api/spotify/tracks/boxset/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()['tracks']), 120)
+        caches[swr.CACHE_ALIAS].clear()
+        again = client.get('/api/spotify/tracks/boxset/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+
+class LogPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='paged', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        jazz = Album.objects.create(spotify_id='p-jazz', name='Jazz', artist='Bill Evans')
+        rock = Album.objects.create(spotify_id='p-rock', name='Rock', artist='Wire')
+        set_genres(jazz, 'jazz')
+        set_genres(rock, 'post-punk')
+        now = timezone.now()
+        for i in range(45):
+            log = Log.objects.create(
+                user=self.user, album=jazz if i % 3 else rock, rating=i % 5 + 1,
+                relisten=not i % 4, listen_date=date(2024, 1, 1) + timedelta(days=i),
+            )
+            # Pairs share a timestamp, so the id has to break ties
+            Log.objects.filter(id=log.id).update(created_at=now - timedelta(minutes=i // 2))
+        self.expected = list(Log.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, params):
+        ids, queries = [], []
+        response = self.client.get('/api/logs/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [log['id'] for log in response.data['results']]
+            if response.data['next'] is None:
+                self.assertIsNone(response.data['cursor'])
+                return ids, queries
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(response.data['next'])
+            queries.append(len(captured))
+
+    def test_next_cursor_walks_every_log_once(self):
+        ids, queries = self.walk({'page_size': 10})
+
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(len(queries), 4)
+        # Page 5 costs what page 2 does
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.client.get('/api/logs/', {'page_size': 0}).data['results']), 1)
+        self.assertEqual(len(self.client.get('/api/logs/', {'page_size': 'many'}).data['results']), 20)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/logs/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_each_filter(self):
+        logs = Log.objects.filter(user=self.user)
+        for params, expected in (
+            ({'rating': 3}, logs.filter(rating=3)),
+            ({'relisten': 'true'}, logs.filter(relisten=True)),
+            ({'relisten': 'false'}, logs.filter(relisten=False)),
+            ({'listened_after': '2024-02-01'}, logs.filter(listen_date__gte=date(2024, 2, 1))),
+            ({'listened_before': '2024-01-10'}, logs.filter(listen_date__lte=date(2024, 1, 10))),
+            ({'artist': 'wire'}, logs.filter(album__artist='Wire')),
+            ({'genre': 'jazz'}, logs.filter(album__spotify_id='p-jazz')),
+            ({'genre': 'jazz', 'rating': 2, 'relisten': 'true'},
+             logs.filter(album__spotify_id='p-jazz', rating=2, relisten=True)),
+        ):
+            with self.subTest(params=params):
+                ids, _ = self.walk({**params, 'page_size': 7})
+                expected_ids = list(expected.order_by('-created_at', '-id').values_list('id', flat=True))
+                self.assertTrue(expected_ids)
+                self.assertEqual(ids, expected_ids)
+
+    def test_invalid_filters(self):
+        for params in (
+            {'rating': 6},
+            {'listened_after': '2024-02-01', 'listened_before': '2024-01-01'},
+            {'listened_after': 'yesterday'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/logs/', params).status_code, 400)
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('api', target)])
+        return executor.loader.project_state([('api', target)]).apps
+
+
+class GenreBackfillMigrationTests(MigrationTestCase):
+    """Runs 0011's backfill against rows written with the pre-0011 schema."""
+
+    def test_genres_text_is_split_into_genre_rows_in_chunks(self):
+        old_apps = self.migrate('0010_userstats')
+        self.addCleanup(self.migrate, MigrationLoader(connection).graph.leaf_nodes('api')[0][1])
+        OldAlbum = old_apps.get_model('api', 'Album')
+        long_name = 'g' * 200
+        OldAlbum.objects.bulk_create(
+            OldAlbum(spotify_id=f'old{i}', name=f'Old {i}', genres=f'jazz, {long_name},jazz,genre {i % 3}')
+            for i in range(7)
+        )
+        OldAlbum.objects.create(spotify_id='untagged', name='Untagged', genres='')
+
+        backfill = import_module('api.migrations.0011_genre')
+        # 7 tagged albums over three chunks
+        with mock.patch.object(backfill, 'CHUNK_SIZE', 3):
+            new_apps = self.migrate('0011_genre')
+
+        NewAlbum = new_apps.get_model('api', 'Album')
+        Genre = new_apps.get_model('api', 'Genre')
+        self.assertEqual(Genre.objects.count(), 5)
+        self.assertEqual(
+            sorted(NewAlbum.objects.get(spotify_id='old4').genres.values_list('name', flat=True)),
+            ['genre 1', long_name, 'jazz'],
+        )
+        self.assertEqual(Genre.objects.get(name='jazz').albums.count(), 7)
+        self.assertFalse(NewAlbum.objects.get(spotify_id='untagged').genres.exists())
+
+
+class ListAlbumLinkMigrationTests(MigrationTestCase):
+    """Runs 0015's linking, and its reverse, against list entries written with the pre-0015 schema."""
+
+    def test_entries_are_linked_to_albums_and_restored_on_rollback(self):
+        old_apps = self.migrate('0014_sparse_list_ranks')
+        self.addCleanup(self.migrate, MigrationLoader(connection).graph.leaf_nodes('api')[0][1])
+        OldAlbum = old_apps.get_model('api', 'Album')
+        OldList = old_apps.get_model('api', 'List')
+        OldListAlbum = old_apps.get_model('api', 'ListAlbum')
+        OldGenre = old_apps.get_model('api', 'Genre')
+        user = old_apps.get_model('auth', 'User').objects.create(username='lister')
+        jazz, rock = OldGenre.objects.create(name='jazz'), OldGenre.objects.create(name='rock')
+        known = OldAlbum.objects.create(spotify_id='known', name='Known', artist='Known Artist', external_url='https://k')
+        known.genres.add(rock)
+
+        def entry(lst, spotify_id, rank, *genres):
+            row = OldListAlbum.objects.create(
+                list=lst, spotify_id=spotify_id, name=f'{spotify_id} name', artist=f'{spotify_id} artist',
+                image_url=f'https://i/{spotify_id}', external_url=f'https://e/{spotify_id}', rank=rank,
+            )
+            row.genres.add(*genres)
+
+        lists = [OldList.objects.create(user=user, title=f'List {i}') for i in range(3)]
+        for i, lst in enumerate(lists):
+            entry(lst, 'shared', 1, jazz)
+            entry(lst, f'only{i}', 2)
+        entry(lists[0], 'known', 3, jazz)
+
+        link = import_module('api.migrations.0015_listalbum_album')
+        # 7 entries over four chunks, with 'shared' in each of them
+        with mock.patch.object(link, 'CHUNK_SIZE', 2):
+            new_apps = self.migrate('0016_remove_listalbum_metadata')
+
+        Album = new_apps.get_model('api', 'Album')
+        ListAlbum = new_apps.get_model('api', 'ListAlbum')
+        shared = Album.objects.get(spotify_id='shared')
+        self.assertEqual(Album.objects.count(), 5)
+        self.assertEqual((shared.name, shared.artist), ('shared name', 'shared artist'))
+        self.assertEqual(list(shared.genres.values_list('name', flat=True)), ['jazz'])
+        self.assertEqual(ListAlbum.objects.filter(album=shared).count(), 3)
+        # An album that was already known keeps its own metadata and genres
+        self.assertEqual(ListAlbum.objects.get(album__spotify_id='known').album_id, known.id)
+        self.assertEqual(Album.objects.get(id=known.id).name, 'Known')
+        self.assertEqual(list(Album.objects.get(id=known.id).genres.values_list('name', flat=True)), ['rock'])
+
+        old_apps = self.migrate('0014_sparse_list_ranks')
+        OldListAlbum = old_apps.get_model('api', 'ListAlbum')
+        self.assertEqual(OldListAlbum.objects.count(), 7)
+        restored = OldListAlbum.objects.get(list_id=lists[1].id, spotify_id='shared')
+        self.assertEqual(
+            (restored.name, restored.artist, restored.image_url, restored.external_url),
+            ('shared name', 'shared artist', 'https://i/shared', 'https://e/shared'),
+        )
+        self.assertEqual(list(restored.genres.values_list('name', flat=True)), ['jazz'])
+        self.assertEqual(OldListAlbum.objects.get(spotify_id='known').name, 'Known')
+
+
+class LocalSpotify(FakeSpotify):
+    """Stands in for the shared Spotify client so no test ever leaves the machine."""
+
+    def search(self, q, type='track', limit=20):
+        self.calls.append(('search', q))
+        items = [{'id': f'{q}-{i}', 'name': f'{q} {i}'} for i in range(limit)]
+        return {f'{type}s': {'items': items, 'total': limit}}
+
+    def album(self, spotify_id):
+        self.calls.append(('album', spotify_id))
+        album = self.albums([spotify_id])['albums'][0]
+        album['tracks'] = {
+            'items': [
+                {'id': f'{spotify_id}-t{i}', 'name': f'Track {i}', 'track_number': i, 'duration_ms': 180000,
+                 'artists': album['artists']}
+                for i in range(1, 13)
+            ],
+            'next': None,
+        }
+        return album
+
+    def new_releases(self, country=None, limit=20, offset=0):
+        self.calls.append(('new_releases', country))
+        albums = self.albums([f'new-{country}-{i}' for i in range(offset, offset + limit)])['albums']
+        return {'albums': {'items': albums, 'next': None}}
+
+
+BUDGETS_PATH = Path(__file__).with_name('query_budgets.json')
+# Timings are only written when a path is given, e.g. to compare two runs
+REPORT_PATH = os.getenv('QUERY_BUDGET_REPORT')
+BUDGET_SCALES = (1, 4)
+
+
+def seed_budget_fixtures(scale):
+    """A listener with ``scale`` times a few weeks' worth of logs, lists, follows and feed."""
+    now = timezone.now()
+    user = User.objects.create_user(username='budget', password='secret', is_staff=True)
+    friends = [User.objects.create_user(username=f'friend{i}', password='secret') for i in range(3 * scale)]
+    stranger = User.objects.create_user(username='stranger', password='secret')
+    for friend in friends:
+        user.profile.followers.add(friend)
+        friend.profile.followers.add(user)
+
+    albums = Album.objects.bulk_create(
+        Album(spotify_id=f'album{i}', name=f'Album {i}', artist=f'Artist {i % (5 * scale)}',
+              image_url=f'https://img/{i}', release_date=date(1990 + i % 30, 1, 1))
+        for i in range(40 * scale)
+    )
+    genres = get_genres(['ambient', 'jazz', 'krautrock', 'post-punk', 'shoegaze'])
+    Album.genres.through.objects.bulk_create(
+        Album.genres.through(album_id=album.id, genre_id=genres[(i + offset) % len(genres)].id)
+        for i, album in enumerate(albums)
+        for offset in range(2)
+    )
+
+    logs = Log.objects.bulk_create(
+        Log(user=author, album=album, rating=i % 5 + 1, review='Worth it' if i % 3 else None,
+            listen_date=(now - timedelta(days=i)).date(), relisten=not i % 7)
+        for author in (user, *friends)
+        for i, album in enumerate(albums)
+    )
+    FeedEntry.objects.bulk_create(
+        FeedEntry(owner=user, log=log, author_id=log.user_id, created_at=log.created_at)
+        for log in logs if log.user_id != user.id
+    )
+    FavoriteAlbum.objects.bulk_create(FavoriteAlbum(user=user, album=album) for album in albums[:3])
+
+    lists = [List.objects.create(user=user, title=f'List {i}') for i in range(3 * scale)]
+    ListAlbum.objects.bulk_create(
+        ListAlbum(list=list_obj, album=album, rank=(position + 1) * ranking.RANK_GAP)
+        for list_obj in lists
+        for position, album in enumerate(albums[:10 * scale])
+    )
+
+    Track.objects.bulk_create(
+        Track(album=albums[0], spotify_id=f'album0-t{i}', name=f'Track {i}', track_number=i) for i in range(1, 13)
+    )
+    Album.objects.filter(id=albums[0].id).update(tracks_fetched_at=now)
+    trending.refresh(markets=['US'], spotify=spotify_client.get_spotify())
+    ratings.reconcile()
+    for listener in (user, *friends):
+        user_stats.rebuild(listener)
+
+    list_entries = list(ListAlbum.objects.filter(list=lists[0]).values_list('id', flat=True))
+    return SimpleNamespace(
+        user=user, stranger=stranger, albums=albums, log=logs[0], list=lists[0], spare_list=lists[-1],
+        list_entries=list_entries,
+    )
+
+
+def album_payload(spotify_id):
+    return {
+        'spotify_id': spotify_id, 'name': 'New album', 'artist': 'Artist 0', 'release_date': '1999-01-01',
+        'image_url': 'https://i.scdn.co/image/new', 'external_url': 'https://open.spotify.com/album/new', 'genres': 'jazz',
+    }
+
+
+# (url name, method, url kwargs, request data), each built from the seeded fixtures
+BUDGET_CASES = [
+    ('token_obtain_pair', 'post', lambda f: {}, lambda f: {'username': 'budget', 'password': 'secret'}),
+    ('token_refresh', 'post', lambda f: {}, lambda f: {'refresh': f.refresh}),
+    ('register', 'post', lambda f: {}, lambda f: {'username': 'newcomer', 'password': 'secret'}),
+    ('profile', 'get', lambda f: {}, None),
+    ('profile', 'patch', lambda f: {}, lambda f: {'bio': 'Crate digger'}),
+    ('user-stats', 'get', lambda f: {}, None),
+    ('user-stats-query', 'get', lambda f: {}, lambda f: {'year': timezone.localdate().year, 'group_by': 'genre'}),
+    ('spotify-search', 'get', lambda f: {}, lambda f: {'q': 'album', 'type': 'album'}),
+    ('spotify-search', 'get', lambda f: {}, lambda f: {'q': 'album', 'type': 'album', 'source': 'local'}),
+    ('favorite-albums', 'get', lambda f: {}, None),
+    ('add-favorite', 'post', lambda f: {}, lambda f: album_payload(f.albums[5].spotify_id)),
+    ('remove-favorite', 'delete', lambda f: {'album_id': f.albums[0].spotify_id}, None),
+    ('album-logs', 'get', lambda f: {}, None),
+    ('album-logs', 'get', lambda f: {}, lambda f: {'genre': 'jazz', 'rating': 5}),
+    ('album-logs', 'post', lambda f: {}, lambda f: {'album_id': f.albums[1].spotify_id, 'rating': 4}),
+    ('log-detail', 'get', lambda f: {'log_id': f.log.id}, None),
+    ('log-detail', 'put', lambda f: {'log_id': f.log.id}, lambda f: {'album_id': f.log.album_id, 'rating': 2, 'review': 'Grew on me'}),
+    ('log-detail', 'delete', lambda f: {'log_id': f.log.id}, None),
+    ('feed', 'get', lambda f: {}, None),
+    ('follow-user', 'post', lambda f: {'username': 'stranger'}, None),
+    ('follow-user', 'delete', lambda f: {'username': 'friend0'}, None),
+    ('create-album', 'post', lambda f: {}, lambda f: album_payload('brand-new')),
+    ('api-root', 'get', lambda f: {}, None),
+    ('list-list', 'get', lambda f: {}, None),
+    ('list-list', 'post', lambda f: {}, lambda f: {'title': 'Another list'}),
+    ('list-detail', 'get', lambda f: {'pk': f.list.id}, None),
+    ('list-detail', 'patch', lambda f: {'pk': f.list.id}, lambda f: {'title': 'Renamed'}),
+    ('list-detail', 'delete', lambda f: {'pk': f.spare_list.id}, None),
+    ('list-albums', 'post', lambda f: {'pk': f.list.id}, lambda f: album_payload(f.albums[-1].spotify_id)),
+    ('list-remove-album', 'delete', lambda f: {'pk': f.list.id}, lambda f: {'album_id': f.albums[0].spotify_id}),
+    ('trending-albums', 'get', lambda f: {}, lambda f: {'country': 'US'}),
+    ('add-album-to-list', 'post', lambda f: {'list_id': f.list.id}, lambda f: album_payload('brand-new')),
+    ('add-albums-to-list', 'post', lambda f: {'list_id': f.list.id},
+     lambda f: {'spotify_ids': [album.spotify_id for album in f.albums[-5:]] + ['fetched-1', 'fetched-2']}),
+    ('album-tracks', 'get', lambda f: {'spotify_id': f.albums[0].spotify_id}, None),
+    ('album-tracks', 'get', lambda f: {'spotify_id': f.albums[2].spotify_id}, None),
+    ('update-album-ranks', 'put', lambda f: {'list_id': f.list.id},
+     lambda f: [{'id': entry_id, 'rank': rank} for rank, entry_id in enumerate(reversed(f.list_entries), start=1)]),
+    ('move-list-album', 'post', lambda f: {'list_id': f.list.id, 'album_id': f.list_entries[-1]},
+     lambda f: {'after_id': f.list_entries[0]}),
+    ('service-metrics', 'get', lambda f: {}, None),
+]
+
+
+def budget_key(name, method, number):
+    # Numbered when a route has several cases for the same method
+    return f'{method.upper()} {name}' + (f' #{number}' if number > 1 else '')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TestCase):
+    """
+    Hits every route in ``api.urls`` against fixtures seeded at a small and a
+    large volume. Each request must issue the same number of queries at both
+    sizes (no N+1) and stay within its budget in ``query_budgets.json``.
+    ``QUERY_BUDGET_REPORT=<path>`` also writes query counts and timings there
+    for comparing runs; ``UPDATE_QUERY_BUDGETS=1`` rewrites the budgets.
+    """
+
+    def setUp(self):
+        spotify_client.reset()
+        spotify_client._client = LocalSpotify()
+        self.addCleanup(spotify_client.reset)
+        self.client = APIClient()
+
+    def cases(self):
+        seen = {}
+        for name, method, url_kwargs, data in BUDGET_CASES:
+            seen[(name, method)] = seen.get((name, method), 0) + 1
+            yield budget_key(name, method, seen[(name, method)]), name, method, url_kwargs, data
+
+    def measure(self, scale):
+        results = {}
+        with transaction.atomic():
+            fixtures = seed_budget_fixtures(scale)
+            fixtures.refresh = self.client.post(
+                reverse('token_obtain_pair'), {'username': 'budget', 'password': 'secret'}
+            ).data['refresh']
+
+            for key, name, method, url_kwargs, data in self.cases():
+                # Every request sees the freshly seeded data and a cold cache
+                with transaction.atomic():
+                    url = reverse(name, kwargs=url_kwargs(fixtures))
+                    payload = data(fixtures) if data else None
+                    # As loaded by the authentication backend, nothing cached on it
+                    self.client.force_authenticate(User.objects.get(pk=fixtures.user.pk))
+                    for alias in settings.CACHES:
+                        caches[alias].clear()
+
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        if method == 'get':
+                            response = self.client.get(url, payload)
+                        elif method == 'delete' and payload:
+                            response = self.client.delete(f'{url}?album_id={payload["album_id"]}')
+                        else:
+                            response = getattr(self.client, method)(url, payload, format='json')
+                        elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+
+                self.assertLess(response.status_code, 400, f'{key}: {getattr(response, "data", response)}')
+                results[key] = {'queries': len(queries), 'ms': round(elapsed * 1000, 2)}
+            transaction.set_rollback(True)
+        return results
+
+    def test_every_route_is_covered(self):
+        names = {getattr(pattern, 'name', None) for pattern in [*urls.urlpatterns, *urls.router.urls]} - {None}
+        covered = {name for name, *_ in BUDGET_CASES}
+        self.assertEqual(names - covered, set())
+
+    def test_query_counts_stay_within_budget(self):
+        runs = {scale: self.measure(scale) for scale in BUDGET_SCALES}
+        small, large = runs[min(BUDGET_SCALES)], runs[max(BUDGET_SCALES)]
+
+        if REPORT_PATH:
+            Path(REPORT_PATH).write_text(json.dumps({
+                'scales': list(BUDGET_SCALES),
+                'endpoints': {
+                    key: {
+                        'queries': {str(scale): runs[scale][key]['queries'] for scale in BUDGET_SCALES},
+                        'ms': {str(scale): runs[scale][key]['ms'] for scale in BUDGET_SCALES},
+                    }
+                    for key in small
+                },
+            }, indent=2, sort_keys=True) + '\n')
+
+        if os.getenv('UPDATE_QUERY_BUDGETS'):
+            budgets = {key: result['queries'] for key, result in large.items()}
+            BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
+        budgets = json.loads(BUDGETS_PATH.read_text())
+
+        for key in small:
+            with self.subTest(endpoint=key):
+                self.assertEqual(small[key]['queries'], large[key]['queries'], 'query count grows with row count')
+                self.assertIn(key, budgets, 'no budget committed; run with UPDATE_QUERY_BUDGETS=1')
+                self.assertLessEqual(large[key]['queries'], budgets[key])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """The hot lookups must be index searches: no full scans and no sorting in a temp b-tree."""
+
+    def hot_queries(self):
+        since = timezone.now() - timedelta(days=30)
+        return {
+            'logs in a window': Log.objects.filter(user_id=1, created_at__gte=since),
+            'logs page': Log.objects.filter(user_id=1).order_by('-created_at', '-id')[:20],
+            'album rating aggregates': Log.objects.filter(album_id=1).values('album_id').annotate(
+                total_logs=Count('id'), rating_sum=Sum('rating')
+            ),
+            'album already in list': ListAlbum.objects.filter(list_id=1, album__spotify_id='album0'),
+            'list in rank order': ListAlbum.objects.filter(list_id=1).order_by('rank', 'id'),
+            'favorites newest first': FavoriteAlbum.objects.filter(user_id=1).order_by('-added_at'),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertNotIn('SCAN', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+                self.assertIn('USING', plan)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='revisiting', password='secret')
+        self.other = User.objects.create_user(username='other', password='secret')
+        self.albums = [Album.objects.create(spotify_id=f'c{i}', name=f'Album {i}') for i in range(3)]
+        self.log = Log.objects.create(user=self.user, album=self.albums[0], rating=4)
+        FavoriteAlbum.objects.create(user=self.user, album=self.albums[1])
+        self.list = List.objects.create(user=self.user, title='Revisited')
+        self.entries = [
+            ListAlbum.objects.create(list=self.list, album=album, rank=(i + 1) * 1024)
+            for i, album in enumerate(self.albums)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, first):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_resources_get_304_from_the_validator_query_alone(self):
+        for url in ('/api/logs/', '/api/favorites/', f'/api/lists/{self.list.id}/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn('no-cache', first['Cache-Control'])
+                with self.assertNumQueries(1):
+                    again = self.revalidate(url, first)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again['ETag'], first['ETag'])
+
+        detail = self.client.get(f'/api/lists/{self.list.id}/')
+        since = self.client.get(f'/api/lists/{self.list.id}/', HTTP_IF_MODIFIED_SINCE=detail['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_deletes_are_not_hidden_behind_if_modified_since(self):
+        for url in ('/api/logs/', '/api/favorites/'):
+            with self.subTest(url=url):
+                self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+
+        since = http_date(time.time() + 60)
+        self.log.delete()
+        FavoriteAlbum.objects.filter(user=self.user).delete()
+        for url in ('/api/logs/', '/api/favorites/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        # List entries removed through the API bump the list instead
+        List.objects.filter(id=self.list.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        Album.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        detail = self.client.get(f'/api/lists/{self.list.id}/')
+        self.client.delete(f'/api/lists/{self.list.id}/remove_album/?album_id={self.albums[0].spotify_id}')
+        since = self.client.get(f'/api/lists/{self.list.id}/', HTTP_IF_MODIFIED_SINCE=detail['Last-Modified'])
+        self.assertEqual(since.status_code, 200)
+
+    def test_changes_produce_a_new_etag(self):
+        logs = self.client.get('/api/logs/')
+        favorites = self.client.get('/api/favorites/')
+        detail = self.client.get(f'/api/lists/{self.list.id}/')
+
+        self.log.delete()
+        self.assertEqual(self.revalidate('/api/logs/', logs).status_code, 200)
+        # Another user's rating changes the album average shown among the favorites
+        Log.objects.create(user=self.other, album=self.albums[1], rating=1)
+        self.assertEqual(self.revalidate('/api/favorites/', favorites).status_code, 200)
+
+        ranking.reorder(self.list.id, [entry.id for entry in reversed(self.entries)])
+        self.assertEqual(self.revalidate(f'/api/lists/{self.list.id}/', detail).status_code, 200)
+        detail = self.client.get(f'/api/lists/{self.list.id}/')
+        set_genres(self.albums[2], 'shoegaze')
+        self.assertEqual(self.revalidate(f'/api/lists/{self.list.id}/', detail).status_code, 200)
+
+    def test_profile_revalidates_against_the_cached_payload(self):
+        first = self.client.get('/api/user/profile/')
+        self.assertEqual(self.revalidate('/api/user/profile/', first).status_code, 304)
+
+        Log.objects.create(user=self.user, album=self.albums[2], rating=5)
+        self.assertEqual(self.revalidate('/api/user/profile/', first).status_code, 200)
+
+
+class CompressionTests(TestCase):
+    body = json.dumps([{'name': f'Track {i}', 'artists': ['Someone']} for i in range(200)]).encode()
+
+    def setUp(self):
+        compression.clear()
+        self.addCleanup(compression.clear)
+
+    def respond(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compression.CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiation_honours_q_values(self):
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(compression.negotiate(''))
+        self.assertEqual(compression.negotiate('*'), 'br')
+        self.assertEqual(compression.negotiate('gzip, br'), 'br')
+        self.assertEqual(compression.negotiate('gzip;q=1, br;q=0.5'), 'gzip')
+        with mock.patch.object(compression, 'brotli', None):
+            self.assertEqual(compression.negotiate('gzip, br'), 'gzip')
+            self.assertEqual(compression.negotiate('*'), 'gzip')
+
+    def test_large_bodies_are_compressed(self):
+        response = self.respond(HttpResponse(self.body, content_type='application/json', headers={'ETag': '"v1"'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_and_precompressed_bodies_are_left_alone(self):
+        for response in (
+            HttpResponse(b'{"ok": true}', content_type='application/json'),
+            HttpResponse(self.body, content_type='image/jpeg'),
+            HttpResponse(self.body, content_type='application/json', headers={'Content-Encoding': 'br'}),
+        ):
+            with self.subTest(content_type=response['Content-Type']):
+                before = response.get('Content-Encoding')
+                self.assertEqual(self.respond(response).get('Content-Encoding'), before)
+
+    def test_streams_are_compressed_chunk_by_chunk(self):
+        chunks = [self.body[start:start + 500] for start in range(0, len(self.body), 500)]
+        response = self.respond(StreamingHttpResponse(iter(chunks), content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body)
+
+    def test_brotli_bodies_match_the_uncompressed_response(self):
+        spotify_client.reset()
+        spotify_client._client = LocalSpotify()
+        self.addCleanup(spotify_client.reset)
+        self.addCleanup(caches[search_cache.CACHE_ALIAS].clear)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='brotli', password='secret'))
+        params = {'q': 'album', 'type': 'track'}
+
+        plain = client.get('/api/spotify/search/', params, HTTP_ACCEPT_ENCODING='identity')
+        compressed = client.get('/api/spotify/search/', params, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(compressed.content), plain.content)
+        self.assertLess(len(compressed.content), len(plain.content))
+
+    def test_brotli_streams(self):
+        chunks = [self.body[start:start + 500] for start in range(0, len(self.body), 500)]
+        response = self.respond(StreamingHttpResponse(iter(chunks), content_type='application/json'), 'br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), self.body)
+
+    def test_sizes_are_recorded_per_route(self):
+        spotify_client.reset()
+        spotify_client._client = LocalSpotify()
+        self.addCleanup(spotify_client.reset)
+        self.addCleanup(caches[search_cache.CACHE_ALIAS].clear)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='searcher', password='secret'))
+        response = client.get('/api/spotify/search/', {'q': 'album', 'type': 'track'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), response.data)
+
+        stats = compression.get_stats()['spotify-search']
+        self.assertEqual((stats['responses'], stats['compressed']), (1, 1))
+        self.assertLess(stats['sent_bytes'], stats['raw_bytes'])
+        self.assertEqual(sum(stats['raw'].values()), 1)
+
+
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        self.cache = caches[swr.CACHE_ALIAS]
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        # Background refreshes are queued here and run by the test
+        self.refreshes = []
+        patcher = mock.patch('api.swr.submit', side_effect=self.refreshes.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_refreshes(self):
+        while self.refreshes:
+            self.refreshes.pop(0)()
+
+    def get(self, fetch):
+        # ttl=0: every stored entry is immediately stale
+        return swr.get(self.cache, 'key', fetch, ttl=0, stale=60)
+
+    def test_stale_entries_are_served_while_one_worker_refreshes(self):
+        self.assertEqual(self.get(lambda: 'v1'), ('v1', 'miss'))
+        self.assertEqual(self.get(lambda: 'v2'), ('v1', 'stale'))
+        self.assertEqual(self.get(lambda: 'v2'), ('v1', 'stale'))
+        self.assertEqual(len(self.refreshes), 1)
+
+        self.run_refreshes()
+        self.assertEqual(self.get(lambda: 'v3'), ('v2', 'stale'))
+
+    def test_failed_refresh_keeps_serving_stale(self):
+        def failing():
+            raise RuntimeError('Spotify is down')
+
+        self.get(lambda: 'v1')
+        self.assertEqual(self.get(failing), ('v1', 'stale'))
+        with self.assertLogs('api.swr', 'WARNING'):
+            self.run_refreshes()
+        self.assertEqual(self.get(failing), ('v1', 'stale'))
+        self.assertEqual(len(self.refreshes), 1, 'the failed refresh released its lock')
+
+    def test_errors_propagate_when_there_is_nothing_to_serve(self):
+        with self.assertRaises(RuntimeError):
+            self.get(mock.Mock(side_effect=RuntimeError('Spotify is down')))
+        self.assertEqual(self.get(lambda: 'v1'), ('v1', 'miss'))
+
+    def test_view_responses_are_cached_with_their_etag(self):
+        user = User.objects.create_user(username='listener', password='secret')
+        Album.objects.create(spotify_id='album0', name='Album 0')
+        spotify_client.reset()
+        spotify_client._client = LocalSpotify()
+        self.addCleanup(spotify_client.reset)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        first = client.get('/api/spotify/tracks/album0/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(len(first.json()['tracks']), 12)
+        with self.assertNumQueries(0):
+            again = client.get('/api/spotify/tracks/album0/')
+            not_modified = client.get('/api/spotify/tracks/album0/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again['X-Cache'], 'FRESH')
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        search_cache.clear()
+        self.addCleanup(search_cache.clear)
+        self.refreshes = []
+        patcher = mock.patch('api.swr.submit', side_effect=self.refreshes.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_equivalent_queries_share_a_key(self):
+        key = search_cache.make_key('  Café   TACUBA ', 'album', 20)
+        self.assertEqual(key, search_cache.make_key('cafe tacuba', 'album', 20))
+        self.assertNotEqual(key, search_cache.make_key('cafe tacuba', 'artist', 20))
+        self.assertNotEqual(key, search_cache.make_key('cafe tacuba', 'album', 10))
+        self.assertEqual(search_cache.normalize_query('ＢＪÖＲＫ'), 'bjork')
+
+    def test_hits_and_misses(self):
+        fetch = mock.Mock(return_value=['result'])
+        self.assertEqual(search_cache.cached_search('Portishead', 'album', 20, fetch), ['result'])
+        self.assertEqual(search_cache.cached_search('portishead', 'album', 20, fetch), ['result'])
+        search_cache.cached_search('portishead', 'track', 20, fetch)
+
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(search_cache.get_stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 0.333})
+
+    def test_entries_go_stale_after_the_ttl_then_expire(self):
+        policy = settings.SPOTIFY_PROXY_CACHE['search']
+        now = time.time()
+        search_cache.cached_search('massive attack', 'album', 20, lambda: ['v1'])
+
+        with mock.patch('time.time', return_value=now + policy['ttl'] + 1):
+            self.assertEqual(search_cache.cached_search('massive attack', 'album', 20, lambda: ['v2']), ['v1'])
+            self.assertEqual(len(self.refreshes), 1)
+        with mock.patch('time.time', return_value=now + policy['ttl'] + policy['stale'] + 1):
+            self.assertEqual(search_cache.cached_search('massive attack', 'album', 20, lambda: ['v3']), ['v3'])
+
+    def test_entries_are_capped(self):
+        backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'capped',
+                   'OPTIONS': {'MAX_ENTRIES': 5}}
+        with override_settings(CACHES={**settings.CACHES, search_cache.CACHE_ALIAS: backend}):
+            for i in range(20):
+                search_cache.cached_search(f'query {i}', 'album', 20, lambda: [])
+            self.assertLessEqual(len(caches[search_cache.CACHE_ALIAS]._cache), 5)
+
+    def test_view_serves_repeated_queries_from_the_cache(self):
+        user = User.objects.create_user(username='searcher', password='secret')
+        spotify = LocalSpotify()
+        spotify_client.reset()
+        spotify_client._client = spotify
+        self.addCleanup(spotify_client.reset)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        first = client.get('/api/spotify/search/', {'q': 'Tricky', 'type': 'album'})
+        again = client.get('/api/spotify/search/', {'q': '  tricky', 'type': 'album'})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual([call for call in spotify.calls if call[0] == 'search'], [('search', 'Tricky')])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SqlitePragmaTests(TestCase):
+    def test_transactions_take_the_write_lock_up_front(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            for name, expected in (('synchronous', 1), ('busy_timeout', settings.SQLITE_PRAGMAS['busy_timeout']),
+                                   ('cache_size', settings.SQLITE_PRAGMAS['cache_size'])):
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], expected, name)
+
+
+# TestCase wraps every test in a transaction, which keeps all reads on the primary
+class ReplicaRoutingTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('api.replicas.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def routes(self, request):
+        """Aliases the router picked for the reads of ``request()``, which still run on the primary."""
+        routed = []
+        db_for_read = replicas.ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            routed.append(db_for_read(router, model, **hints) or 'default')
+
+        # A fresh user each time, so nothing is served from related objects cached on it
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', spy):
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return set(routed)
+
+    def test_read_only_endpoints_use_the_replica(self):
+        user_stats.rebuild(self.user)
+        for url in ('/api/lists/', '/api/stats/', '/api/stats/query/', '/api/feed/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.routes(lambda: self.client.get(url)), {'replica'})
+
+    def test_other_endpoints_use_the_primary(self):
+        self.assertEqual(self.routes(lambda: self.client.get('/api/logs/')), {'default'})
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        self.routes(lambda: self.client.post('/api/lists/', {'title': 'New'}, format='json'))
+        self.assertEqual(self.routes(lambda: self.client.get('/api/lists/')), {'default'})
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='secret'))
+        self.assertEqual(self.routes(lambda: other.get('/api/lists/')), {'replica'})
+
+        cache.delete(replicas.make_key(self.user.pk))
+        self.assertEqual(self.routes(lambda: self.client.get('/api/lists/')), {'replica'})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the replica is a SQLite snapshot')
+class LaggingReplicaTests(TransactionTestCase):
+    """A real second database, snapshotted from the primary and then left behind."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings, so the test runner doesn't try to create it
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings[replicas.REPLICA_ALIAS] = {
+            **connection.settings_dict, 'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        cls.databases = {'default', replicas.REPLICA_ALIAS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[replicas.REPLICA_ALIAS].close()
+        del connections[replicas.REPLICA_ALIAS]
+        del connections.settings[replicas.REPLICA_ALIAS]
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='lagged', password='secret')
+        self.albums = [Album.objects.create(spotify_id=f'lag{i}', name=f'Album {i}') for i in range(2)]
+        Log.objects.create(user=self.user, album=self.albums[0], rating=2)
+        # Neither database has the materialized row yet
+        UserStats.objects.filter(user=self.user).delete()
+
+        replica = connections[replicas.REPLICA_ALIAS]
+        replica.close()
+        connection.ensure_connection()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        connection.connection.backup(target)
+        target.close()
+
+    def test_materialized_stats_are_built_from_the_primary(self):
+        # Only the primary sees this one; logging it builds the row there
+        Log.objects.create(user=self.user, album=self.albums[1], rating=4)
+        UserStats.objects.filter(user=self.user).delete()
+
+        token = replicas._use_replica.set(True)
+        try:
+            user_stats.rebuild(self.user)
+        finally:
+            replicas._use_replica.reset(token)
+
+        stats = UserStats.objects.using('default').get(user=self.user)
+        self.assertEqual((stats.total_logs, stats.rating_sum), (2, 6))
+        self.assertFalse(UserStats.objects.using(replicas.REPLICA_ALIAS).filter(user=self.user).exists())
+
+    def test_stats_reads_write_nothing(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.user.pk))
+        response = client.get('/api/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        # Computed from the replica's copy and not stored anywhere
+        self.assertEqual(response.data['total_albums'], 1)
+        self.assertFalse(UserStats.objects.using('default').filter(user=self.user).exists())
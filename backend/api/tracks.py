@@ -0,0 +1,121 @@
+"""
+Persistent album tracklists.
+
+Tracklists essentially never change, so the first request for an album
+stores every page of it in ``Track`` and later requests are served from the
+database.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .models import Album, Track
+from .spotify_client import get_spotify
+
+ALBUMS_BATCH_SIZE = 20
+TRACK_FIELDS = (
+    'spotify_id', 'name', 'track_number', 'disc_number',
+    'duration_ms', 'explicit', 'preview_url', 'artists',
+)
+
+
+def parse_release_date(value):
+    """Spotify dates come as YYYY, YYYY-MM or YYYY-MM-DD."""
+    if not value:
+        return None
+    parts = [int(part) for part in value.split('-')]
+    parts += [1] * (3 - len(parts))
+    try:
+        return date(*parts[:3])
+    except ValueError:
+        return None
+
+
+def all_track_items(spotify, album_info):
+    """Every track of a full album object, following ``next`` pages."""
+    page = album_info['tracks']
+    items = list(page['items'])
+    while page.get('next'):
+        page = spotify.next(page)
+        items.extend(page['items'])
+    return [item for item in items if item]
+
+
+def store_tracks(spotify, album_info, album=None):
+    """Store the full tracklist for ``album_info``, creating the Album row if needed."""
+    items = all_track_items(spotify, album_info)
+    with transaction.atomic():
+        if album is None:
+            album, _ = Album.objects.get_or_create(
+                spotify_id=album_info['id'],
+                defaults={
+                    'name': album_info.get('name'),
+                    'artist': album_info['artists'][0]['name'] if album_info.get('artists') else None,
+                    'image_url': album_info['images'][0]['url'] if album_info.get('images') else None,
+                    'release_date': parse_release_date(album_info.get('release_date')),
+                    'external_url': album_info.get('external_urls', {}).get('spotify', ''),
+                },
+            )
+        Track.objects.filter(album=album).delete()
+        Track.objects.bulk_create([
+            Track(
+                album=album,
+                spotify_id=item['id'],
+                name=item['name'],
+                track_number=item.get('track_number') or 0,
+                disc_number=item.get('disc_number') or 1,
+                duration_ms=item.get('duration_ms') or 0,
+                explicit=bool(item.get('explicit')),
+                preview_url=item.get('preview_url'),
+                artists=[{'id': a.get('id'), 'name': a.get('name')} for a in item.get('artists', [])],
+            )
+            for item in items
+        ])
+        album.tracks_fetched_at = timezone.now()
+        Album.objects.filter(id=album.id).update(tracks_fetched_at=album.tracks_fetched_at)
+    return album
+
+
+def fetched_at(spotify_id):
+    """When the tracklist was stored, or None if it hasn't been yet. One small query."""
+    return Album.objects.filter(spotify_id=spotify_id).values_list('tracks_fetched_at', flat=True).first()
+
+
+def make_etag(spotify_id, stored_at):
+    return quote_etag(f"{spotify_id}-{int(stored_at.timestamp())}")
+
+
+def get_tracks(spotify_id, spotify=None):
+    """Return ``(stored_at, [track dicts])``, fetching from Spotify on first use."""
+    stored_at = fetched_at(spotify_id)
+    if stored_at is None:
+        spotify = spotify or get_spotify()
+        album = Album.objects.filter(spotify_id=spotify_id).first()
+        album = store_tracks(spotify, spotify.album(spotify_id), album=album)
+        stored_at = album.tracks_fetched_at
+
+    tracks = Track.objects.filter(album__spotify_id=spotify_id).values(*TRACK_FIELDS)
+    return stored_at, [serialize_track(track) for track in tracks]
+
+
+def serialize_track(track):
+    """Same keys the Spotify track objects had, so clients don't change."""
+    track = dict(track)
+    track['id'] = track.pop('spotify_id')
+    return track
+
+
+def prefetch(album_ids, spotify=None):
+    """Store tracklists for many albums using the batched ``albums`` endpoint."""
+    spotify = spotify or get_spotify()
+    albums = {a.spotify_id: a for a in Album.objects.filter(spotify_id__in=album_ids)}
+    stored = 0
+    for start in range(0, len(album_ids), ALBUMS_BATCH_SIZE):
+        batch = album_ids[start:start + ALBUMS_BATCH_SIZE]
+        for album_info in spotify.albums(batch)['albums']:
+            if album_info:
+                store_tracks(spotify, album_info, album=albums.get(album_info['id']))
+                stored += 1
+    return stored
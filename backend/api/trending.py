@@ -0,0 +1,122 @@
+"""
+Trending albums snapshot.
+
+``refresh()`` is run on a schedule by the ``refresh_trending`` command; the
+``/trending-albums/`` view only ever reads the latest stored snapshot.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .artists import get_artists
+from .models import TrendingSnapshot
+from .spotify_client import get_spotify
+
+logger = logging.getLogger(__name__)
+
+# Spotify's batch endpoint limits
+ALBUMS_BATCH_SIZE = 20
+MAX_NEW_RELEASES = 50
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_new_releases(spotify, country, limit):
+    response = spotify.new_releases(country=country, limit=min(limit, MAX_NEW_RELEASES))
+    return [album for album in response['albums']['items'] if album]
+
+
+def enrich(spotify, releases):
+    """
+    Turn simplified album objects into trending entries, adding track counts
+    and primary-artist genres with batched ``albums`` calls and the artist
+    cache.
+    """
+    album_ids = list(dict.fromkeys(album['id'] for album in releases))
+    full_albums = {}
+    for batch in chunked(album_ids, ALBUMS_BATCH_SIZE):
+        for album in spotify.albums(batch)['albums']:
+            if album:
+                full_albums[album['id']] = album
+
+    artist_ids = list(dict.fromkeys(
+        album['artists'][0]['id'] for album in releases if album['artists']
+    ))
+    artist_genres = {
+        artist_id: artist.genres
+        for artist_id, artist in get_artists(artist_ids, spotify=spotify).items()
+    }
+
+    entries = []
+    for album in releases:
+        full = full_albums.get(album['id'], {})
+        primary_artist = album['artists'][0] if album['artists'] else {}
+        entries.append({
+            'spotify_id': album['id'],
+            'name': album['name'],
+            'artist': primary_artist.get('name'),
+            'image_url': album['images'][0]['url'] if album['images'] else None,
+            'release_date': album['release_date'],
+            'external_url': album.get('external_urls', {}).get('spotify', ''),
+            'total_tracks': full.get('total_tracks', album.get('total_tracks')),
+            'popularity': full.get('popularity'),
+            'genres': artist_genres.get(primary_artist.get('id'), []),
+        })
+    return entries
+
+
+def refresh(markets=None, limit=MAX_NEW_RELEASES, keep=None, spotify=None):
+    """
+    Fetch and store a new snapshot version for every market.
+
+    Everything is fetched before the write transaction starts, so a Spotify
+    failure part way through leaves the previous snapshot untouched. Each
+    refreshed market then keeps its ``keep`` newest snapshots; ``keep=0``
+    keeps them all. Markets not in ``markets`` are left alone.
+    """
+    spotify = spotify or get_spotify()
+    markets = [market.upper() for market in (markets or settings.TRENDING_MARKETS)]
+    if keep is None:
+        keep = settings.TRENDING_SNAPSHOTS_KEPT
+
+    snapshots = {}
+    for country in markets:
+        snapshots[country] = enrich(spotify, fetch_new_releases(spotify, country, limit))
+        logger.info("Fetched %d trending albums for %s", len(snapshots[country]), country)
+
+    with transaction.atomic():
+        latest = TrendingSnapshot.objects.aggregate(latest=Max('version'))['latest'] or 0
+        version = latest + 1
+        TrendingSnapshot.objects.bulk_create([
+            TrendingSnapshot(version=version, country=country, albums=albums)
+            for country, albums in snapshots.items()
+        ])
+        if keep:
+            for country in snapshots:
+                prune(country, keep)
+    return version
+
+
+def prune(country, keep):
+    """Delete all but the ``keep`` newest snapshots of ``country``."""
+    snapshots = TrendingSnapshot.objects.filter(country=country)
+    oldest_kept = snapshots.order_by('-version').values_list('version', flat=True)[keep - 1:keep].first()
+    if oldest_kept is not None:
+        snapshots.filter(version__lt=oldest_kept).delete()
+
+
+def get_trending(country, limit):
+    """Latest snapshot for ``country``, falling back to the default market."""
+    snapshot = (
+        TrendingSnapshot.objects.filter(country=country).order_by('-version').first()
+        or TrendingSnapshot.objects.filter(country=settings.TRENDING_DEFAULT_MARKET).order_by('-version').first()
+    )
+    if snapshot is None:
+        logger.warning("No trending snapshot stored yet; run manage.py refresh_trending")
+        return None
+    return snapshot.albums[:limit]
@@ -10,14 +10,20 @@ from .views import (
     remove_favorite_album,
     LogAlbumView,
     LogDetailView,
+    FeedView,
+    follow_user,
     UserStatsView,
+    StatsQueryView,
     create_album,
     register_user,
     ListViewSet,
     get_trending_albums,
     add_album_to_list,
+    add_albums_to_list,
     get_album_tracks,
-    update_album_ranks
+    update_album_ranks,
+    move_list_album,
+    service_metrics
 )
 
 router = DefaultRouter()
@@ -32,6 +38,7 @@ urlpatterns = [
     path('user/register/', CreateUserView.as_view(), name='register'),
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('stats/', UserStatsView.as_view(), name='user-stats'),
+    path('stats/query/', StatsQueryView.as_view(), name='user-stats-query'),
     
     # Spotify search
     path('spotify/search/', spotify_search, name='spotify-search'),
@@ -44,6 +51,10 @@ urlpatterns = [
     # Logging endpoints
     path('logs/', LogAlbumView.as_view(), name='album-logs'),
     path('logs/<int:log_id>/', LogDetailView.as_view(), name='log-detail'),
+
+    # Activity feed
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('users/<str:username>/follow/', follow_user, name='follow-user'),
     path('albums/create/', create_album, name='create-album'),
     path('', include(router.urls)),
 
@@ -52,10 +63,15 @@ urlpatterns = [
 
     # Add album to list
     path('lists/<int:list_id>/add_album/', add_album_to_list, name='add-album-to-list'),
+    path('lists/<int:list_id>/add_albums/', add_albums_to_list, name='add-albums-to-list'),
 
     # Tracks endpoint
     path('spotify/tracks/<str:spotify_id>/', get_album_tracks, name='album-tracks'),
 
     # Update album ranks
     path('lists/<int:list_id>/update_ranks/', update_album_ranks, name='update-album-ranks'),
+    path('lists/<int:list_id>/albums/<int:album_id>/move/', move_list_album, name='move-list-album'),
+
+    # Internal service counters (admin only)
+    path('metrics/', service_metrics, name='service-metrics'),
 ]
@@ -0,0 +1,245 @@
+"""
+Materialized per-user statistics.
+
+``UserStats`` holds one row per user that ``/stats/`` and ``/profile/`` read
+directly. Log save/delete hooks apply deltas to it; artist and genre counts
+live in ``UserTally`` so the top artist/genre can be re-picked with one
+index seek; they follow the album when its artist or genres change too.
+The year and last-30-days counts are day-granular. Reads roll them to a new
+day in memory with two indexed counts, and the next write stores them.
+
+Reads never write: a user without a row yet gets an unsaved one, computed
+on the fly, and the row is stored by their first log or ``rebuild_user_stats``.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import replicas
+from .models import Album, Genre, Log, UserStats, UserTally
+
+STARS = range(1, 6)
+WINDOW_DAYS = 30
+
+
+def window_start(day):
+    """Start of the last-30-days window as of ``day``."""
+    return timezone.make_aware(datetime.combine(day - timedelta(days=WINDOW_DAYS), time.min))
+
+
+def _window_counts(user, day):
+    logs = Log.objects.filter(user=user)
+    return {
+        'logs_this_year': logs.filter(created_at__year=day.year).count(),
+        'logs_last_30_days': logs.filter(created_at__gte=window_start(day)).count(),
+        'windows_date': day,
+    }
+
+
+def _top(user, kind):
+    return (
+        UserTally.objects.filter(user=user, kind=kind, count__gt=0)
+        .order_by('-count', 'value')
+        .values_list('value', flat=True)
+        .first()
+    )
+
+
+def _first(counts):
+    """The value ``_top()`` would pick from ``(value, count)`` pairs."""
+    counts = [(value, count) for value, count in counts if count > 0]
+    return min(counts, key=lambda pair: (-pair[1], pair[0]))[0] if counts else None
+
+
+def _compute(user):
+    """``(values, artist counts, genre counts)`` for ``user``, from their logs."""
+    logs = Log.objects.filter(user=user).order_by()
+    values = logs.aggregate(
+        total_logs=Count('id'),
+        rating_sum=Coalesce(Sum('rating'), 0),
+        relisten_count=Count('id', filter=Q(relisten=True)),
+        **{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in STARS}
+    )
+    artists = list(
+        logs.exclude(album__artist='').filter(album__artist__isnull=False)
+        .values_list('album__artist').annotate(count=Count('id'))
+    )
+    genres = list(
+        logs.filter(album__genres__isnull=False)
+        .values_list('album__genres__name').annotate(count=Count('id'))
+    )
+    values.update(_window_counts(user, timezone.localdate()))
+    values['top_artist'] = _first(artists)
+    values['top_genre'] = _first(genres)
+    return values, artists, genres
+
+
+def rebuild(user):
+    """Recompute every statistic for ``user`` from their logs and store it."""
+    # The result is stored, so it must not come from a lagging replica
+    with replicas.primary():
+        values, artists, genres = _compute(user)
+        with transaction.atomic():
+            UserTally.objects.filter(user=user).delete()
+            UserTally.objects.bulk_create(
+                [UserTally(user=user, kind=UserTally.ARTIST, value=v, count=c) for v, c in artists]
+                + [UserTally(user=user, kind=UserTally.GENRE, value=v, count=c) for v, c in genres]
+            )
+            stats, _ = UserStats.objects.update_or_create(user=user, defaults=values)
+    return stats
+
+
+def get_stats(user):
+    """The user's stats with windows rolled to today. Never writes; see the module docstring."""
+    stats = getattr(user, '_user_stats', None)
+    if stats is None:
+        try:
+            # Free when the caller used select_related('stats')
+            stats = user.stats
+        except UserStats.DoesNotExist:
+            values, _, _ = _compute(user)
+            stats = UserStats(user=user, **values)
+        else:
+            if stats.windows_date != timezone.localdate():
+                for field, value in _window_counts(user, timezone.localdate()).items():
+                    setattr(stats, field, value)
+        user._user_stats = stats
+    return stats
+
+
+def _roll_windows(user_id, windows_date):
+    """Store today's window counts if the row, last rolled on ``windows_date``, has an earlier day's."""
+    today = timezone.localdate()
+    if windows_date != today:
+        UserStats.objects.filter(user_id=user_id).update(**_window_counts(user_id, today))
+
+
+def _tally(user_id, kind, value, delta):
+    if not value or not delta:
+        return
+    tally = UserTally.objects.filter(user_id=user_id, kind=kind, value=value)
+    if not tally.update(count=Greatest(F('count') + delta, 0)) and delta > 0:
+        try:
+            with transaction.atomic():
+                UserTally.objects.create(user_id=user_id, kind=kind, value=value, count=delta)
+        except IntegrityError:
+            # Someone else created it first
+            tally.update(count=F('count') + delta)
+
+
+def _album_labels(album_id):
+    artist = Album.objects.filter(id=album_id).values_list('artist', flat=True).first()
+    genres = Genre.objects.filter(albums=album_id).values_list('name', flat=True)
+    return artist, list(genres)
+
+
+def _added(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def _apply(user_id, windows_date, sign, rating, relisten, album_id, created_at, tally=True):
+    """Add (``sign=1``) or remove (``sign=-1``) one log's contribution to a row last rolled on ``windows_date``."""
+    updates = {
+        'total_logs': _added('total_logs', sign),
+        'rating_sum': _added('rating_sum', sign * rating),
+        f'rating_{rating}_count': _added(f'rating_{rating}_count', sign),
+    }
+    if relisten:
+        updates['relisten_count'] = _added('relisten_count', sign)
+
+    # Counts for an earlier day are recomputed after the write instead
+    if windows_date == timezone.localdate():
+        if timezone.localtime(created_at).year == windows_date.year:
+            updates['logs_this_year'] = _added('logs_this_year', sign)
+        if created_at >= window_start(windows_date):
+            updates['logs_last_30_days'] = _added('logs_last_30_days', sign)
+    UserStats.objects.filter(user_id=user_id).update(**updates)
+
+    if not tally:
+        return
+    artist, genres = _album_labels(album_id)
+    _tally(user_id, UserTally.ARTIST, artist, sign)
+    for genre in genres:
+        _tally(user_id, UserTally.GENRE, genre, sign)
+
+
+def _refresh_top(user_id):
+    UserStats.objects.filter(user_id=user_id).update(
+        top_artist=_top(user_id, UserTally.ARTIST),
+        top_genre=_top(user_id, UserTally.GENRE),
+    )
+
+
+def _loggers(album_ids):
+    """``(user_id, log count)`` for users with a stats row who logged any of ``album_ids``."""
+    return (
+        Log.objects.filter(album_id__in=album_ids, user__stats__isnull=False)
+        .order_by().values_list('user_id').annotate(count=Count('id'))
+    )
+
+
+def genres_changed(album_ids, genres, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) ``genres`` of ``album_ids`` in their loggers' tallies."""
+    loggers = list(_loggers(album_ids)) if album_ids else []
+    if not loggers:
+        return
+    names = list(genres.values_list('name', flat=True))
+    for user_id, count in loggers:
+        for name in names:
+            _tally(user_id, UserTally.GENRE, name, sign * count)
+        _refresh_top(user_id)
+
+
+def artist_changed(album_id, old_artist, new_artist):
+    """Move the artist tallies of everyone who logged ``album_id`` to its new artist."""
+    for user_id, count in _loggers([album_id]):
+        _tally(user_id, UserTally.ARTIST, old_artist, -count)
+        _tally(user_id, UserTally.ARTIST, new_artist, count)
+        _refresh_top(user_id)
+
+
+def _apply_saved(log, created, windows_date):
+    loaded_rating = getattr(log, '_loaded_rating', None)
+    if created or loaded_rating is None:
+        _apply(log.user_id, windows_date, 1, log.rating, log.relisten, log.album_id, log.created_at)
+    else:
+        album_changed = log.album_changed()
+        if loaded_rating == log.rating and log._loaded_relisten == log.relisten and not album_changed:
+            return
+        _apply(
+            log.user_id, windows_date, -1, loaded_rating, log._loaded_relisten, log._loaded_album_id,
+            log.created_at, album_changed,
+        )
+        _apply(log.user_id, windows_date, 1, log.rating, log.relisten, log.album_id, log.created_at, album_changed)
+        if not album_changed:
+            return
+    _refresh_top(log.user_id)
+
+
+def _stored_row(user_id):
+    return UserStats.objects.filter(user_id=user_id).values('windows_date').first()
+
+
+def log_saved(log, created):
+    row = _stored_row(log.user_id)
+    if row is None:
+        # First write for this user; a full build already includes this log
+        rebuild(log.user)
+        return
+    _apply_saved(log, created, row['windows_date'])
+    # After the deltas, which were relative to the stored day
+    _roll_windows(log.user_id, row['windows_date'])
+
+
+def log_deleted(log):
+    row = _stored_row(log.user_id)
+    if row is None:
+        return
+    _apply(log.user_id, row['windows_date'], -1, log.rating, log.relisten, log.album_id, log.created_at)
+    _refresh_top(log.user_id)
+    _roll_windows(log.user_id, row['windows_date'])
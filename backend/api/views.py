@@ -1,12 +1,11 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg, Count
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.conf import settings
 from .models import Album, Log, Profile, FavoriteAlbum, List, ListAlbum
 from .serializers import (
@@ -16,11 +15,21 @@ from .serializers import (
     LogSerializer,
     FavoriteAlbumSerializer,
     ListAlbumSerializer,
-    ListSerializer
+    ListSerializer,
+    ListDetailSerializer,
+    ListSummarySerializer,
+    StatsQuerySerializer,
+    LogFilterSerializer
 )
+from .pagination import KeysetPagination, RankPagination
+from .renderers import FAST_RENDERER_CLASSES
+from .replicas import replica_reads
+from .spotify_client import get_spotify, get_stats as get_spotify_client_stats
+from .genres import set_genres
+from . import compression, conditional, search_cache, swr, catalog_search, trending, artists, jobs, tracks, ratings, stats_query, fast_serializers, profiles, feeds, ranking, list_albums
 from rest_framework.parsers import MultiPartParser, FormParser
-from datetime import datetime, timedelta
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.contrib.auth.models import User
 from rest_framework import generics
 from rest_framework import viewsets
@@ -46,46 +55,13 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         return self.request.user.profile
 
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        data = serializer.data
-        
-        # Add additional stats
-        logs = Log.objects.filter(user=request.user)
-        
-        # Calculate last 30 days logs
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        last_month_logs = logs.filter(created_at__gte=thirty_days_ago).count()
-        
-        # Calculate average rating
-        avg_rating = logs.aggregate(Avg('rating'))['rating__avg']
-        
-        # Get most logged artist
-        artist_counts = logs.values('album__artist').annotate(
-            count=Count('album__artist')
-        ).order_by('-count')
-        top_artist = artist_counts[0]['album__artist'] if artist_counts else None
-        
-        # Get most common genre
-        genre_counts = {}
-        for log in logs:
-            if log.album.genres:
-                genres = log.album.genres.split(',')
-                for genre in genres:
-                    genre = genre.strip()
-                    if genre:
-                        genre_counts[genre] = genre_counts.get(genre, 0) + 1
-        
-        top_genre = max(genre_counts.items(), key=lambda x: x[1])[0] if genre_counts else None
-        
-        data.update({
-            'lastMonth': last_month_logs,
-            'averageRating': round(avg_rating, 1) if avg_rating else 0,
-            'topArtist': top_artist,
-            'topGenre': top_genre or 'None yet'
-        })
-        
-        return Response(data)
+        # Serializer data plus stats, cached per user; see api.profiles
+        entry = profiles.get_entry(request.user.id)
+        validators = conditional.for_profile(request, entry)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return validators.apply(Response(profiles.get_payload(request.user.id, request, entry)))
 
     def patch(self, request):
         profile = request.user.profile
@@ -109,29 +85,44 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         print("Validation errors:", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+SEARCH_TYPES = {'album', 'artist', 'track'}
+MAX_SEARCH_LIMIT = 50
+
 @api_view(['GET'])
 def spotify_search(request):
     query = request.GET.get('q', '')
-    print(f"Received search query: {query}")
-    
+    search_type = request.GET.get('type', 'track')
+    if search_type not in SEARCH_TYPES:
+        search_type = 'track'
     try:
-        spotify = spotipy.Spotify(
-            client_credentials_manager=SpotifyClientCredentials(
-                client_id=settings.SPOTIFY_CLIENT_ID,
-                client_secret=settings.SPOTIFY_CLIENT_SECRET
-            )
+        limit = min(max(int(request.GET.get('limit', MAX_SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        limit = MAX_SEARCH_LIMIT
+
+    if not query.strip():
+        return Response(
+            {'error': 'Missing search query'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        
-        # Increase limit to 50 and specify we want tracks
-        results = spotify.search(
-            q=query,
-            type='track',
-            limit=50  # Increased from default 20 to 50
+
+    if request.GET.get('source') == 'local':
+        entries = catalog_search.search(query, limit)
+        return Response(catalog_search.search_response(entries, search_type))
+
+    try:
+        results = search_cache.cached_search(
+            query,
+            search_type,
+            limit,
+            lambda: get_spotify().search(q=query, type=search_type, limit=limit)
         )
-        print(f"Search results: {results}")
         return Response(results)
     except Exception as e:
-        print(f"Search error: {e}")
+        logger.warning("Search error: %s", e)
+        if settings.CATALOG_SEARCH_FALLBACK:
+            entries = catalog_search.search(query, limit)
+            if entries:
+                return Response(catalog_search.search_response(entries, search_type))
         return Response(
             {'error': 'Failed to search Spotify'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -160,7 +151,6 @@ def add_favorite_album(request):
             'image_url': request.data.get('image_url'),
             'release_date': request.data.get('release_date'),
             'external_url': request.data.get('external_url'),
-            'genres': request.data.get('genres', '')
         }
         
         print("Album data:", album_data)  # Debug log
@@ -169,6 +159,8 @@ def add_favorite_album(request):
             spotify_id=album_data['spotify_id'],
             defaults=album_data
         )
+        if created:
+            set_genres(album, request.data.get('genres', ''))
         print(f"Album {'created' if created else 'found'}:", album)  # Debug log
 
         # Check if user already has 4 favorites
@@ -202,14 +194,22 @@ def add_favorite_album(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(FAST_RENDERER_CLASSES)
 def list_favorite_albums(request):
-    favorites = FavoriteAlbum.objects.filter(user=request.user)
+    validators = conditional.for_rows(request, FavoriteAlbum.objects.filter(user=request.user), 'added_at')
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    if settings.FAST_READ_SERIALIZERS:
+        return validators.apply(Response(fast_serializers.serialize_favorites(FavoriteAlbum.objects.filter(user=request.user))))
+
+    favorites = FavoriteAlbum.objects.filter(user=request.user).select_related('album').prefetch_related('album__genres')
     print("Found favorites:", favorites.count())  # Debug log
     for fav in favorites:
         print(f"Favorite: {fav.album.name} by {fav.album.artist}")  # Debug log
     serializer = FavoriteAlbumSerializer(favorites, many=True)
     print("Serialized data:", serializer.data)  # Debug log
-    return Response(serializer.data)
+    return validators.apply(Response(serializer.data))
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -235,6 +235,7 @@ def remove_favorite_album(request, album_id):
 
 class LogAlbumView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = FAST_RENDERER_CLASSES
 
     def post(self, request):
         try:
@@ -260,11 +261,8 @@ class LogAlbumView(APIView):
             if serializer.is_valid():
                 log = serializer.save(user=request.user, album=album)
                 
-                # Update album stats
-                album.total_logs += 1
-                logs = Log.objects.filter(album=album)
-                album.average_rating = logs.aggregate(Avg('rating'))['rating__avg']
-                album.save()
+                # Album rating aggregates are updated by the Log post_save hook
+                album.refresh_from_db(fields=ratings.AGGREGATE_FIELDS)
                 
                 return Response(
                     LogSerializer(log).data,
@@ -283,9 +281,61 @@ class LogAlbumView(APIView):
             )
 
     def get(self, request):
-        logs = Log.objects.filter(user=request.user).select_related('album')
-        serializer = LogSerializer(logs, many=True)
-        return Response(serializer.data)
+        filters = LogFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        logs = filters.filter(Log.objects.filter(user=request.user))
+        validators = conditional.for_rows(request, logs, 'updated_at')
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        paginator = KeysetPagination()
+        if settings.FAST_READ_SERIALIZERS:
+            page = paginator.paginate_queryset(fast_serializers.log_rows(logs), request, view=self)
+            return validators.apply(paginator.get_paginated_response(fast_serializers.serialize_logs(page, request.user)))
+
+        page = paginator.paginate_queryset(
+            logs.select_related('user', 'album').prefetch_related('album__genres'),
+            request,
+            view=self
+        )
+        serializer = LogSerializer(page, many=True)
+        return validators.apply(paginator.get_paginated_response(serializer.data))
+
+class FeedView(APIView):
+    """Logs from the accounts the user follows, newest first; see api.feeds."""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    @replica_reads
+    def get(self, request):
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        rows = feeds.read(request.user, after=paginator.get_cursor_key(request), limit=page_size + 1)
+        page = paginator.paginate_rows(rows, request, page_size)
+        return paginator.get_paginated_response(fast_serializers.serialize_feed(page))
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def follow_user(request, username):
+    profile = get_object_or_404(Profile, user__username=username)
+    if profile.user_id == request.user.id:
+        return Response(
+            {'error': 'You cannot follow yourself'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if request.method == 'POST':
+        profile.followers.add(request.user)
+    else:
+        profile.followers.remove(request.user)
+    return Response({
+        'username': username,
+        'following': request.method == 'POST',
+        'followers_count': profile.followers.count(),
+    })
 
 class LogDetailView(APIView):
     permission_classes = [IsAuthenticated]
@@ -311,24 +361,45 @@ class LogDetailView(APIView):
 class UserStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @replica_reads
     def get(self, request):
-        logs = Log.objects.filter(user=request.user)
+        totals = stats_query.run(request.user)['totals']
         
         stats = {
-            'total_albums': logs.count(),
-            'average_rating': logs.aggregate(Avg('rating'))['rating__avg'] or 0,
-            'total_relistens': logs.filter(relisten=True).count(),
+            'total_albums': totals['count'],
+            'average_rating': totals['average_rating'],
+            'total_relistens': totals['relistens'],
             'ratings_distribution': {
-                '5': logs.filter(rating=5).count(),
-                '4': logs.filter(rating=4).count(),
-                '3': logs.filter(rating=3).count(),
-                '2': logs.filter(rating=2).count(),
-                '1': logs.filter(rating=1).count(),
+                star: totals['ratings'][star] for star in ('5', '4', '3', '2', '1')
             }
         }
         
         return Response(stats)
 
+class StatsQueryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @replica_reads
+    def get(self, request):
+        params = StatsQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = params.validated_data
+
+        result = stats_query.run(
+            request.user,
+            start=query.get('start'),
+            end=query.get('end'),
+            group_by=query.get('group_by'),
+            metrics=query['metrics']
+        )
+        return Response({
+            'start': query.get('start'),
+            'end': query.get('end'),
+            'group_by': query.get('group_by'),
+            **result
+        })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_album(request):
@@ -422,21 +493,52 @@ def register_user(request):
 class ListViewSet(viewsets.ModelViewSet):
     serializer_class = ListSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = FAST_RENDERER_CLASSES
 
     def get_queryset(self):
-        return List.objects.filter(user=self.request.user)
-
+        return List.objects.filter(user=self.request.user).annotate(num_albums=Count('albums'))
+
+    @replica_reads
+    def list(self, request, *args, **kwargs):
+        # Overview only: album counts and the first few covers, no album payloads
+        lists = self.get_queryset()
+        covers = list_albums.covers(List.objects.filter(user=request.user).values('id'))
+        if settings.FAST_READ_SERIALIZERS:
+            return Response(fast_serializers.serialize_list_summaries(lists, covers))
+        return Response(ListSummarySerializer(lists, many=True, context={'covers': covers}).data)
+
+    @replica_reads
     def retrieve(self, request, *args, **kwargs):
         try:
+            validators = conditional.for_list(request, List.objects.filter(pk=kwargs['pk'], user=request.user))
+            if validators is None:
+                raise Http404(f"No {List._meta.object_name} matches the given query.")
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                return not_modified
+
+            # Albums come one page at a time; follow `next` for the rest
+            paginator = RankPagination()
+            if settings.FAST_READ_SERIALIZERS:
+                lists = self.get_queryset().filter(pk=kwargs['pk'])
+                albums = paginator.paginate_queryset(fast_serializers.list_album_rows(kwargs['pk']), request)
+                data = fast_serializers.serialize_list(lists, albums)
+                if data is None:
+                    raise Http404(f"No {List._meta.object_name} matches the given query.")
+                data['next'] = paginator.get_next_link()
+                return validators.apply(Response(data))
+
             instance = self.get_object()
             print(f"Retrieved list: {instance.title}")  # Debug log
-            print(f"Number of albums: {instance.albums.count()}")  # Debug log
-            
-            serializer = self.get_serializer(instance)
+            print(f"Number of albums: {instance.num_albums}")  # Debug log
+
+            albums = paginator.paginate_queryset(instance.albums.select_related('album').prefetch_related('album__genres'), request)
+            serializer = ListDetailSerializer(instance, context={'albums': albums})
             data = serializer.data
+            data['next'] = paginator.get_next_link()
             print(f"Serialized data: {data}")  # Debug log
             
-            return Response(data)
+            return validators.apply(Response(data))
         except Exception as e:
             print(f"Error retrieving list: {str(e)}")  # Debug log
             return Response(
@@ -452,11 +554,13 @@ class ListViewSet(viewsets.ModelViewSet):
             # Add the list ID to the request data
             album_data = request.data.copy()
             album_data['list'] = list_obj.id
+            if album_data.get('rank') in (None, ''):
+                album_data['rank'] = ranking.next_rank(list_obj.id)
             
             # Check if album already exists in list
             existing_album = ListAlbum.objects.filter(
                 list=list_obj,
-                spotify_id=album_data['spotify_id']
+                album__spotify_id=album_data['spotify_id']
             ).first()
             
             if existing_album:
@@ -489,9 +593,10 @@ class ListViewSet(viewsets.ModelViewSet):
         try:
             album = ListAlbum.objects.get(
                 list=list_obj,
-                spotify_id=album_id
+                album__spotify_id=album_id
             )
             album.delete()
+            List.touch(list_obj.id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except ListAlbum.DoesNotExist:
             return Response(
@@ -499,32 +604,25 @@ class ListViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+MAX_TRENDING_LIMIT = 50
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@swr.stale_while_revalidate('trending', key=lambda request: '{}:{}'.format(
+    request.GET.get('country', settings.TRENDING_DEFAULT_MARKET).upper(), request.GET.get('limit', 20)
+))
 def get_trending_albums(request):
+    country = request.GET.get('country', settings.TRENDING_DEFAULT_MARKET).upper()
     try:
-        spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(
-            client_id=settings.SPOTIFY_CLIENT_ID,
-            client_secret=settings.SPOTIFY_CLIENT_SECRET
-        ))
-        
-        # Get new releases instead of featured playlists
-        new_releases = spotify.new_releases(limit=20, country='US')
-        
-        trending_albums = []
-        for album in new_releases['albums']['items']:
-            trending_albums.append({
-                'spotify_id': album['id'],
-                'name': album['name'],
-                'artist': album['artists'][0]['name'],
-                'image_url': album['images'][0]['url'] if album['images'] else None,
-                'release_date': album['release_date']
-            })
-        
-        return Response(trending_albums)
-    except Exception as e:
-        print(f"Error in get_trending_albums: {str(e)}")  # Debug log
-        return Response({'error': str(e)}, status=400)
+        limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_TRENDING_LIMIT)
+    except ValueError:
+        return Response(
+            {'error': 'limit must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    trending_albums = trending.get_trending(country, limit)
+    return Response(trending_albums or [])
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -534,13 +632,10 @@ def add_album_to_list(request, list_id):
         album_data = request.data
         print("Received album data:", album_data)
         
-        # Get the next rank
-        next_rank = ListAlbum.objects.filter(list=list_obj).count() + 1
-        
         # Check if album already exists in the list
         existing_album = ListAlbum.objects.filter(
             list=list_obj,
-            spotify_id=album_data['spotify_id']
+            album__spotify_id=album_data['spotify_id']
         ).first()
         
         if existing_album:
@@ -549,42 +644,51 @@ def add_album_to_list(request, list_id):
                 status=status.HTTP_200_OK
             )
         
-        # Get primary genre from Spotify artist
-        primary_genre = ''
-        try:
-            spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(
-                client_id=settings.SPOTIFY_CLIENT_ID,
-                client_secret=settings.SPOTIFY_CLIENT_SECRET
-            ))
-            
-            # First get the album to find the artist ID
-            album_info = spotify.album(album_data['spotify_id'])
-            if album_info['artists']:
-                # Get the primary artist's genres
-                artist_id = album_info['artists'][0]['id']
-                artist_info = spotify.artist(artist_id)
-                genres = artist_info.get('genres', [])
-                # Only take the first genre if available
-                primary_genre = genres[0] if genres else ''
-                print(f"Found primary genre for artist {artist_info['name']}: {primary_genre}")
-            
-        except Exception as e:
-            print(f"Error fetching artist genre: {str(e)}")
-        
-        # Create the ListAlbum instance with primary genre
-        list_album = ListAlbum.objects.create(
-            list=list_obj,
-            spotify_id=album_data['spotify_id'],
-            name=album_data['name'],
-            artist=album_data['artist'],
-            image_url=album_data.get('image_url', ''),
-            release_date=album_data.get('release_date'),
-            external_url=album_data['external_url'],
-            genres=primary_genre,
-            rank=next_rank
+        # Use the cached artist's genre if we have one; otherwise the genre is
+        # filled in by a background job so the request never waits on Spotify
+        artist = artists.find_cached(
+            artist_id=album_data.get('artist_id'),
+            artist_name=album_data.get('artist')
         )
+        primary_genre = artist.primary_genre if artist is not None else ''
+
+        # Albums are shared across lists; a new one starts with the primary
+        # genre. The entry's rank is reserved under a lock on the list (see
+        # api.ranking)
+        album = list_albums.get_album(
+            album_data['spotify_id'],
+            {
+                'name': album_data['name'],
+                'artist': album_data['artist'],
+                'image_url': album_data.get('image_url', ''),
+                'release_date': album_data.get('release_date'),
+                'external_url': album_data.get('external_url', ''),
+            },
+            [primary_genre] if primary_genre else None
+        )
+        try:
+            with transaction.atomic():
+                list_album = ListAlbum.objects.create(
+                    list=list_obj,
+                    album=album,
+                    rank=ranking.append_ranks(list_obj.id, 1)[0]
+                )
+        except IntegrityError:
+            # A concurrent request added it after the check above
+            return Response(
+                {'message': 'Album already exists in this list'},
+                status=status.HTTP_200_OK
+            )
+
+        if artist is None and not album.genres.exists():
+            artist_id = album_data.get('artist_id')
+            jobs.enqueue(
+                'enrich_genres',
+                spotify_ids=[album.spotify_id],
+                artist_ids={album.spotify_id: artist_id} if artist_id else None
+            )
         
-        print(f"Created ListAlbum with primary genre: {list_album.genres}")
+        logger.debug("Created ListAlbum with primary genre: %s", primary_genre)
         
         return Response({
             'message': 'Album added to list successfully',
@@ -598,40 +702,105 @@ def add_album_to_list(request, list_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+MAX_BULK_ALBUMS = 200
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def add_albums_to_list(request, list_id):
+    """Append many albums, given as {"spotify_ids": [...]}, in one go; see api.list_albums."""
+    try:
+        list_obj = List.objects.get(id=list_id, user=request.user)
+        spotify_ids = request.data.get('spotify_ids')
+        if not isinstance(spotify_ids, list) or not spotify_ids:
+            return Response(
+                {'error': 'spotify_ids must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(spotify_ids) > MAX_BULK_ALBUMS:
+            return Response(
+                {'error': f'At most {MAX_BULK_ALBUMS} albums can be added at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created, skipped, not_found = list_albums.add_albums(list_obj, [str(spotify_id) for spotify_id in spotify_ids])
+        added = ListAlbum.objects.filter(id__in=[album.id for album in created]).select_related('album').prefetch_related('album__genres')
+        return Response({
+            'added': ListAlbumSerializer(added, many=True).data,
+            'skipped': skipped,
+            'not_found': not_found,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.warning("Error adding albums to list: %s", e)
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+TRACKS_MAX_AGE = 24 * 60 * 60
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@swr.stale_while_revalidate('tracks', key=lambda request, spotify_id: spotify_id)
 def get_album_tracks(request, spotify_id):
     try:
-        spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(
-            client_id=settings.SPOTIFY_CLIENT_ID,
-            client_secret=settings.SPOTIFY_CLIENT_SECRET
-        ))
-        
-        album_tracks = spotify.album_tracks(spotify_id)
-        return Response({"tracks": album_tracks['items']})
+        stored_at = tracks.fetched_at(spotify_id)
+        if stored_at is not None:
+            not_modified = get_conditional_response(request, etag=tracks.make_etag(spotify_id, stored_at))
+            if not_modified is not None:
+                return not_modified
+
+        stored_at, album_tracks = tracks.get_tracks(spotify_id)
+        response = Response({"tracks": album_tracks})
+        response['ETag'] = tracks.make_etag(spotify_id, stored_at)
+        patch_cache_control(response, private=True, max_age=TRACKS_MAX_AGE)
+        return response
     except Exception as e:
         return Response({'error': str(e)}, status=400)
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_album_ranks(request, list_id):
+    """Apply a whole new order, given as [{id, rank}] for every album in the list."""
     try:
         list_obj = List.objects.get(id=list_id, user=request.user)
-        albums_data = request.data  # Expect array of {id: X, rank: Y}
-        
-        for album_data in albums_data:
-            album = ListAlbum.objects.get(
-                id=album_data['id'],
-                list=list_obj
-            )
-            album.rank = album_data['rank']
-            album.save()
-            
+        albums_data = sorted(request.data, key=lambda album_data: album_data['rank'])
+        ranking.reorder(list_obj.id, [int(album_data['id']) for album_data in albums_data])
         return Response({'message': 'Rankings updated successfully'})
-        
+
     except Exception as e:
         return Response(
             {'error': str(e)}, 
             status=status.HTTP_400_BAD_REQUEST
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def move_list_album(request, list_id, album_id):
+    """Move one album to right after `after_id` or right before `before_id`."""
+    try:
+        list_obj = List.objects.get(id=list_id, user=request.user)
+        after_id, before_id = (
+            int(request.data[key]) if request.data.get(key) not in (None, '') else None
+            for key in ('after_id', 'before_id')
+        )
+        rank = ranking.move(list_obj.id, album_id, after_id=after_id, before_id=before_id)
+        return Response({'id': album_id, 'rank': rank})
+
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def service_metrics(request):
+    return Response({
+        'spotify_client': get_spotify_client_stats(),
+        'search_cache': search_cache.get_stats(),
+        'spotify_proxy_cache': swr.get_stats(),
+        'response_sizes': compression.get_stats(),
+        'profile_cache': profiles.get_stats(),
+    })
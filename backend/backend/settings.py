@@ -67,6 +67,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Before anything that reads or rewrites the response body
+    'api.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +76,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "corsheaders.middleware.CorsMiddleware",
+    'api.replicas.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -104,9 +107,151 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection is reused across requests; 0 closes it after each one
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts. Under WAL a deferred
+            # transaction that reads and then writes fails with "database is
+            # locked" straight away instead of waiting out busy_timeout, and
+            # SQLite ignores select_for_update().
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Applied to every new SQLite connection by api.signals.apply_sqlite_pragmas.
+# WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+    # Milliseconds to wait on a locked database before raising
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negative values are in KiB
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024)),
+}
+
+# Optional read replica; see api.replicas. For SQLite this is the path of a
+# second database file, refreshed with `manage.py sync_replica`.
+DATABASE_REPLICA_NAME = os.getenv('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DATABASE_REPLICA_NAME,
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they write
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Where cached data lives: locmem:// (per process, the default),
+# file:///var/tmp/albumlog-cache or a redis:// / rediss:// URL. Use a shared
+# backend when running more than one worker.
+CACHE_URL = os.getenv('CACHE_URL', 'locmem://')
+
+
+def cache_backend(url, name, **extra):
+    """A CACHES entry for ``url``; ``name`` keeps the aliases apart on a shared backend."""
+    scheme, _, location = url.partition('://')
+    if scheme == 'locmem':
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name, **extra}
+    if scheme == 'file':
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': os.path.join(location, name), **extra}
+    if scheme in ('redis', 'rediss'):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url, 'KEY_PREFIX': name, **extra}
+    raise ValueError(f'Unsupported CACHE_URL scheme: {scheme}')
+
+
+SPOTIFY_SEARCH_CACHE_TTL = int(os.getenv('SPOTIFY_SEARCH_CACHE_TTL', 60 * 60))
+SPOTIFY_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SPOTIFY_SEARCH_CACHE_MAX_ENTRIES', 5000))
+
+CACHES = {
+    'default': cache_backend(CACHE_URL, 'default'),
+    'spotify_search': cache_backend(
+        CACHE_URL, 'spotify-search',
+        TIMEOUT=SPOTIFY_SEARCH_CACHE_TTL,
+        OPTIONS={'MAX_ENTRIES': SPOTIFY_SEARCH_CACHE_MAX_ENTRIES} if not CACHE_URL.startswith('redis') else {},
+    ),
+    'spotify_proxy': cache_backend(CACHE_URL, 'spotify-proxy'),
+}
+
+# Spotify proxy responses; see api.swr. An entry is fresh for `ttl`
+# seconds, then served stale for up to `stale` more while one worker
+# refreshes it in the background (or while Spotify is failing).
+SPOTIFY_PROXY_CACHE = {
+    'search': {
+        'ttl': SPOTIFY_SEARCH_CACHE_TTL,
+        'stale': int(os.getenv('SPOTIFY_SEARCH_CACHE_STALE', 24 * 60 * 60)),
+    },
+    'trending': {
+        'ttl': int(os.getenv('TRENDING_CACHE_TTL', 5 * 60)),
+        'stale': int(os.getenv('TRENDING_CACHE_STALE', 24 * 60 * 60)),
+    },
+    'tracks': {
+        'ttl': int(os.getenv('TRACKS_CACHE_TTL', 24 * 60 * 60)),
+        'stale': int(os.getenv('TRACKS_CACHE_STALE', 7 * 24 * 60 * 60)),
+    },
 }
 
+# Seconds a cached /user/profile/ payload lives; signals drop it on changes
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 60 * 60))
+
+
+# Local catalog search
+# SQLiteFTSBackend falls back to DatabaseBackend on non-SQLite databases.
+
+CATALOG_SEARCH_BACKEND = os.getenv('CATALOG_SEARCH_BACKEND', 'api.catalog_search.SQLiteFTSBackend')
+# Serve local results when the Spotify search call fails or times out
+CATALOG_SEARCH_FALLBACK = os.getenv('CATALOG_SEARCH_FALLBACK', 'true').lower() == 'true'
+
+
+# Trending albums, refreshed by `manage.py refresh_trending`
+
+TRENDING_MARKETS = [m.strip().upper() for m in os.getenv('TRENDING_MARKETS', 'US,GB,CA,AU,DE,FR').split(',') if m.strip()]
+TRENDING_DEFAULT_MARKET = os.getenv('TRENDING_DEFAULT_MARKET', 'US')
+TRENDING_SNAPSHOTS_KEPT = int(os.getenv('TRENDING_SNAPSHOTS_KEPT', 3))
+
+
+# Seconds before cached Spotify artist metadata is re-fetched
+ARTIST_CACHE_MAX_AGE = int(os.getenv('ARTIST_CACHE_MAX_AGE', 30 * 24 * 60 * 60))
+
+
+# Background jobs, run by `manage.py run_workers`
+
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+JOB_BACKOFF_BASE = int(os.getenv('JOB_BACKOFF_BASE', 10))
+JOB_BACKOFF_MAX = int(os.getenv('JOB_BACKOFF_MAX', 60 * 60))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+
+
+# Activity feed; see api.feeds
+# Accounts with more followers than this are read on demand instead of
+# being copied into every follower's inbox
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))
+# Inbox entries kept per user by `manage.py trim_feeds`
+FEED_INBOX_SIZE = int(os.getenv('FEED_INBOX_SIZE', 1000))
+# Recent logs copied into a new follower's inbox
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 50))
+
+
+# Build /logs/, /favorites/ and /lists/ responses from values() rows
+# (api.fast_serializers) instead of the model serializers
+
+FAST_READ_SERIALIZERS = os.getenv('FAST_READ_SERIALIZERS', 'false').lower() == 'true'
+
+
+# Response compression; see api.compression. Brotli is offered when the
+# Brotli package is installed, gzip otherwise.
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -156,14 +156,25 @@ export const getFavorites = async () => {
     }
 };
 
+// The logs route pages its results; follow `next` to load them all
+export const getAllLogs = async () => {
+    let response = await api.get('/api/logs/');
+    const logs = [...response.data.results];
+    while (response.data.next) {
+        response = await api.get(response.data.next);
+        logs.push(...response.data.results);
+    }
+    return logs;
+};
+
 // Function to get recent logs
 export const getRecentLogs = async () => {
     try {
-        const response = await api.get('/api/logs/');
-        console.log('Raw logs response:', response.data); // Debug log
+        const logs = await getAllLogs();
+        console.log('Raw logs response:', logs); // Debug log
         
         // Filter out any invalid logs
-        const validLogs = response.data.filter(log => 
+        const validLogs = logs.filter(log => 
             log && 
             log.album && 
             typeof log.album === 'object' && 
@@ -13,6 +13,7 @@ import {
   Scroll,
 } from "lucide-react";
 import api from "../api/api";
+import { getAllLogs } from "../api/albums";
 import "../styles/Home.css";
 import { ACCESS_TOKEN } from "../constants";
 import { AnimatePresence, motion } from "framer-motion";
@@ -40,11 +41,11 @@ function Home() {
 
   const fetchInitialData = async () => {
     try {
-      const [logsResponse, statsResponse] = await Promise.all([
-        api.get("api/logs/"),
+      const [logs, statsResponse] = await Promise.all([
+        getAllLogs(),
         api.get("api/stats/"),
       ]);
-      setRecentLogs(logsResponse.data);
+      setRecentLogs(logs);
       setUserStats(statsResponse.data);
     } catch (error) {
       console.error("Error fetching initial data:", error);
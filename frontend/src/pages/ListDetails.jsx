@@ -11,6 +11,19 @@ import { DragDropContext, Droppable, Draggable } from "react-beautiful-dnd";
 // Register ChartJS components
 ChartJS.register(ArcElement, Tooltip, Legend);
 
+// The list detail route pages its albums; follow `next` to load them all
+const fetchFullList = async (listId) => {
+  const response = await api.get(`/api/lists/${listId}/`);
+  const list = response.data;
+  let next = list.next;
+  while (next) {
+    const page = await api.get(next);
+    list.albums = [...list.albums, ...page.data.albums];
+    next = page.data.next;
+  }
+  return list;
+};
+
 const DraggableAlbum = ({ album, index, isEditMode }) => (
   <Draggable
     draggableId={String(index)}
@@ -63,9 +76,9 @@ function ListDetails() {
   useEffect(() => {
     const fetchListDetails = async () => {
       try {
-        const response = await api.get(`/api/lists/${listId}/`);
-        setList(response.data);
-        setAlbums(response.data.albums || []);
+        const fullList = await fetchFullList(listId);
+        setList(fullList);
+        setAlbums(fullList.albums || []);
         setLoading(false);
       } catch (error) {
         setError(error.response?.data?.error || "Failed to fetch list details");
@@ -91,13 +104,16 @@ function ListDetails() {
     setAlbums(updatedAlbums);
     setList((prev) => ({ ...prev, albums: updatedAlbums }));
 
+    // Only the moved album's rank changes on the server
+    const destination = result.destination.index;
     try {
-      await api.put(
-        `/api/lists/${listId}/update_ranks/`,
-        items.map((item, index) => ({
-          id: parseInt(item.id),
-          rank: index + 1,
-        }))
+      await api.post(
+        `/api/lists/${listId}/albums/${reorderedItem.id}/move/`,
+        {
+          after_id: destination > 0 ? items[destination - 1].id : null,
+          before_id:
+            destination < items.length - 1 ? items[destination + 1].id : null,
+        }
       );
     } catch (error) {
       console.error("Error updating ranks:", error);
@@ -118,6 +134,7 @@ function ListDetails() {
           spotify_id: track.album.id,
           name: track.album.name,
           artist: track.artists[0].name,
+          artist_id: track.album.artists?.[0]?.id,
           image_url: track.album.images[0]?.url || "",
           release_date: track.album.release_date || "",
           external_url: track.album.external_urls?.spotify || "",
@@ -155,6 +172,7 @@ function ListDetails() {
         spotify_id: album.spotify_id,
         name: album.name,
         artist: album.artists?.[0]?.name || album.artist,
+        artist_id: album.artists?.[0]?.id || album.artist_id,
         image_url: album.images?.[0]?.url || album.image_url,
         release_date: formattedDate,
         external_url:
@@ -167,8 +185,8 @@ function ListDetails() {
 
       await api.post(`/api/lists/${listId}/add_album/`, albumData);
 
-      const updatedList = await api.get(`/api/lists/${listId}/`);
-      setList(updatedList.data);
+      const updatedList = await fetchFullList(listId);
+      setList(updatedList);
 
       setShowSearch(false);
       setSearchQuery("");
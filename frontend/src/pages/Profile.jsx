@@ -634,21 +634,21 @@ function Profile() {
 
                 {/* Album Preview Section */}
                 <div className="list-preview">
-                  {list.albums &&
-                    list.albums.slice(0, 3).map((album) => (
+                  {list.covers &&
+                    list.covers.map((cover, i) => (
                       <img
-                        key={album.id}
-                        src={album.image_url || "/default-album-cover.png"}
-                        alt={album.name}
+                        key={`cover-${i}`}
+                        src={cover}
+                        alt={list.title}
                         className="preview-album"
                         onError={(e) => {
                           e.target.src = "/default-album-cover.png";
                         }}
                       />
                     ))}
-                  {/* Add placeholder albums if less than 3 albums */}
-                  {list.albums &&
-                    [...Array(Math.max(0, 3 - list.albums.length))].map(
+                  {/* Add placeholder albums if less than 4 covers */}
+                  {list.covers &&
+                    [...Array(Math.max(0, 4 - list.covers.length))].map(
                       (_, i) => (
                         <div
                           key={`placeholder-${i}`}